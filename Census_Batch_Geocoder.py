@@ -0,0 +1,151 @@
+import io
+import csv
+import argparse
+import requests
+import pandas as pd
+
+from Geocode_Cache import GeocodeCache
+
+# US Census batch geocoder (CSV upload of up to 10,000 addresses per request)
+us_census_batch_url = "https://geocoding.geo.census.gov/geocoder/locations/addressbatch"
+benchmark = "Public_AR_Current"
+max_batch_size = 10000
+
+# Same provider name as the one-line geocoder, so both share cache entries and the BE column value
+provider_name = "US Census Geocoder"
+
+
+# Function to list every distinct (location, state) pair the rows may need, in first-seen order
+def collect_candidates(states, row_locations, row_fallbacks):
+    candidates = {}
+    for state, locations, fallbacks in zip(states, row_locations, row_fallbacks):
+        for location in list(locations) + list(fallbacks):
+            candidates.setdefault((location, state), None)
+    return list(candidates)
+
+
+# Function to write one batch in the Census upload format: Unique ID, Street address, City, State, ZIP
+def build_batch_file(batch):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, (location, state) in enumerate(batch):
+        writer.writerow([i, "", location, state, ""])
+    return buffer.getvalue().encode("utf-8")
+
+
+# Function to parse the Census batch response into {row id: (lat, lon) or None}
+def parse_batch_response(text):
+    results = {}
+    for record in csv.reader(io.StringIO(text)):
+        if not record:
+            continue
+        row_id = int(record[0])
+        if len(record) > 5 and record[2] == "Match" and record[5]:
+            lon, lat = (float(value) for value in record[5].split(","))
+            results[row_id] = (lat, lon)
+        else:
+            results[row_id] = None
+    return results
+
+
+# Function to geocode candidates in batch uploads; cached answers are not re-sent
+def batch_geocode(candidates, url=us_census_batch_url, chunk_size=max_batch_size, cache=None, session=None):
+    """
+    INPUTS:
+    candidates - list of (location, state) pairs
+    url - batch endpoint (a local fake endpoint can be given for tests)
+    chunk_size - addresses per upload (the service accepts at most 10,000)
+    cache - optional GeocodeCache; answers are read from and written to it
+
+    OUTPUT:
+    {(location, state): (lat, lon) or None}
+    """
+    session = session or requests.Session()
+    results = {}
+    pending = []
+    for candidate in candidates:
+        if cache is not None:
+            try:
+                results[candidate] = cache.get(provider_name, *candidate)
+                continue
+            except KeyError:
+                pass
+        pending.append(candidate)
+
+    for start in range(0, len(pending), chunk_size):
+        batch = pending[start:start + chunk_size]
+        response = session.post(
+            url,
+            files={"addressFile": ("addresses.csv", build_batch_file(batch), "text/csv")},
+            data={"benchmark": benchmark},
+            timeout=600,
+        )
+        response.raise_for_status()
+        answers = parse_batch_response(response.text)
+        for i, candidate in enumerate(batch):
+            results[candidate] = answers.get(i)
+            if cache is not None and i in answers:
+                cache.put(provider_name, *candidate, answers[i])
+        print(f"Census batch {start // chunk_size + 1}: {len(batch)} addresses, "
+              f"{sum(1 for i in range(len(batch)) if answers.get(i))} matched")
+    return results
+
+
+# Function to write BA-BE for each row from the batch results, following NLP_Geocoding_USCensus.py
+def apply_results(df, row_locations, row_fallbacks, results):
+    for index, state, locations, fallbacks in zip(df.index, df["STATE"], row_locations, row_fallbacks):
+        for location in locations:
+            coordinates = results.get((location, state))
+            if coordinates:
+                df.at[index, "BA"] = location
+                df.at[index, "BB"] = coordinates[0]
+                df.at[index, "BC"] = coordinates[1]
+                df.at[index, "BD"] = f"Narrative: {location}"
+                df.at[index, "BE"] = provider_name
+                break
+        else:
+            for location in fallbacks:
+                coordinates = results.get((location, state))
+                if coordinates:
+                    df.at[index, "BA"] = location
+                    df.at[index, "BB"] = coordinates[0]
+                    df.at[index, "BC"] = coordinates[1]
+                    df.at[index, "BD"] = "No narrative location found, using CZ_NAME for location"
+                    df.at[index, "BE"] = provider_name
+                    break
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geocode narrative locations with the Census batch endpoint.")
+    parser.add_argument("input_file", nargs="?", default="combined_rows.csv")
+    parser.add_argument("output_file", nargs="?", default="combined_rows_USCensus.csv")
+    parser.add_argument("--url", default=us_census_batch_url, help="Batch geocoder endpoint")
+    parser.add_argument("--chunk-size", type=int, default=max_batch_size, help="Addresses per upload")
+    parser.add_argument("--cache", default="geocode_cache.sqlite", help="Geocode cache file ('' to disable)")
+    args = parser.parse_args(argv)
+
+    import spaCy_Extraction as extraction
+
+    df_input = pd.read_csv(args.input_file)
+    nlp = extraction.load_pipeline(components=("ner",))
+    episode_locations = extraction.extract_column_locations(nlp, df_input["EPISODE_NARRATIVE"])
+    event_locations = extraction.extract_column_locations(nlp, df_input["EVENT_NARRATIVE"])
+    row_locations = [a + b for a, b in zip(episode_locations, event_locations)]
+    # CZ_NAME is only a fallback for rows whose narratives yield nothing, as in NLP_Geocoding_USCensus.py
+    row_fallbacks = extraction.extract_column_locations(nlp, df_input["CZ_NAME"])
+
+    cache = GeocodeCache(args.cache) if args.cache else None
+    candidates = collect_candidates(df_input["STATE"], row_locations, row_fallbacks)
+    print(f"{len(candidates)} unique (location, state) candidates from {len(df_input)} rows")
+    results = batch_geocode(candidates, args.url, args.chunk_size, cache)
+
+    apply_results(df_input, row_locations, row_fallbacks, results)
+    df_input.to_csv(args.output_file, index=False)
+    if cache is not None:
+        cache.report()
+    print(f"Geocoding complete. Results saved to {args.output_file}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,18 @@ ds = xr.open_dataset(file_path)
 print(ds)
 
 
-'''
-import xarray as xr
-import os
+# Merging every per-event file with xr.open_mfdataset(combine="by_coords") fails, or builds a
+# mostly-NaN cube, because each event has its own small box. Index them lazily as a ragged
+# "event" dimension instead; nothing is read until a result is computed.
+import pandas as pd
+from MERRA2_Event_Dataset import EventDataset
 
-# Folder containing all .nc files
+# Folder containing all .nc files, and the events they were downloaded for
 nc_folder = "/mnt/c/DevNet/NASA/NC Files/"
+events = pd.read_excel("Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx")
 
-# Get all .nc file paths
-nc_files = [os.path.join(nc_folder, f) for f in os.listdir(nc_folder) if f.endswith('.nc')]
-
-# Open and merge all .nc files along 'lon', 'lat', and 'time'
-ds_merged = xr.open_mfdataset(nc_files, combine="by_coords", parallel=True)  # Remove concat_dim
+dataset = EventDataset.from_folder(events, nc_folder)
+print(dataset.padded("SPEEDMAX"))  # event x time x lat x lon, one chunk per event
 
-# Save merged file
-ds_merged.to_netcdf("Arizona_Combined_Data.nc")
-'''
\ No newline at end of file
+# Peak SPEEDMAX within +/- 3 h of each event's begHour, streamed file by file
+print(dataset.peak_near_begin("SPEEDMAX", hours=3))
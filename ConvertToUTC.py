@@ -1,47 +1,128 @@
+import re
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
 
 # Load the Excel file
 input_file = "Arizona_1996-2023_Final-12_19_2024_with_bounds.xlsx"
-df = pd.read_excel(input_file)
-
-# Function to convert time
-def convert_to_utc(yearmonth, day, time):
-    # Ensure BEGIN_TIME is a valid 4-digit string
-    time_str = str(time).zfill(4)
-    hour = int(time_str[:2])
-    minute = int(time_str[2:])
-
-    # Construct datetime object in Arizona time
-    date_str = f"{str(yearmonth)[:4]}-{str(yearmonth)[4:6]}-{day}"
-    az_time = datetime.strptime(date_str, "%Y-%m-%d") + timedelta(hours=hour, minutes=minute)
-
-    # Convert Arizona time to UTC (add 7 hours)
-    utc_time = az_time + timedelta(hours=7)
-
-    # Round to the nearest 30 minutes
-    if utc_time.minute == 0:
-        utc_time = utc_time.replace(minute=30)
-    elif 1 <= utc_time.minute <= 29:
-        utc_time = utc_time.replace(minute=30)
-    elif utc_time.minute >= 31:
-        utc_time = utc_time.replace(minute=30) + timedelta(hours=1)
-
-    # Format the date correctly
-    beg_time = utc_time.strftime("%Y-%m-%dT00:00:00Z")
-    end_time = utc_time.strftime("%Y-%m-%dT23:00:00Z")
-    beg_hour = utc_time.strftime("%H:%M")
-
-    return beg_time, end_time, beg_hour
-
-# Apply the function
-df[['begTime', 'endTime', 'begHour']] = df.apply(
-    lambda row: convert_to_utc(row['BEGIN_YEARMONTH'], row['BEGIN_DAY'], row['BEGIN_TIME']),
-    axis=1, result_type='expand'
-)
-
-# Save to a new file
 output_file = "Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx"
-df.to_excel(output_file, index=False)
 
-print(f"Conversion complete. Saved to {output_file}.")
+# UTC offsets (hours) of the zone labels used in CZ_TIMEZONE; newer files also carry the offset ("MST-7")
+zone_offsets = {
+    "AST": -4, "ADT": -3, "EST": -5, "EDT": -4, "CST": -6, "CDT": -5, "MST": -7, "MDT": -6,
+    "PST": -8, "PDT": -7, "AKST": -9, "AKDT": -8, "HST": -10, "SST": -11, "GST": 10, "CHST": 10,
+    "UTC": 0, "GMT": 0,
+}
+zone_pattern = re.compile(r"^([A-Z]+)\s*([+-]?\d+)?$")
+
+# Time zone of each state, used (with its daylight-saving rules) when CZ_TIMEZONE is missing or unknown
+state_zones = {
+    "ALABAMA": "America/Chicago", "ALASKA": "America/Anchorage", "ARIZONA": "America/Phoenix",
+    "ARKANSAS": "America/Chicago", "CALIFORNIA": "America/Los_Angeles", "COLORADO": "America/Denver",
+    "CONNECTICUT": "America/New_York", "DELAWARE": "America/New_York", "DISTRICT OF COLUMBIA": "America/New_York",
+    "FLORIDA": "America/New_York", "GEORGIA": "America/New_York", "HAWAII": "Pacific/Honolulu",
+    "IDAHO": "America/Boise", "ILLINOIS": "America/Chicago", "INDIANA": "America/Indiana/Indianapolis",
+    "IOWA": "America/Chicago", "KANSAS": "America/Chicago", "KENTUCKY": "America/New_York",
+    "LOUISIANA": "America/Chicago", "MAINE": "America/New_York", "MARYLAND": "America/New_York",
+    "MASSACHUSETTS": "America/New_York", "MICHIGAN": "America/Detroit", "MINNESOTA": "America/Chicago",
+    "MISSISSIPPI": "America/Chicago", "MISSOURI": "America/Chicago", "MONTANA": "America/Denver",
+    "NEBRASKA": "America/Chicago", "NEVADA": "America/Los_Angeles", "NEW HAMPSHIRE": "America/New_York",
+    "NEW JERSEY": "America/New_York", "NEW MEXICO": "America/Denver", "NEW YORK": "America/New_York",
+    "NORTH CAROLINA": "America/New_York", "NORTH DAKOTA": "America/Chicago", "OHIO": "America/New_York",
+    "OKLAHOMA": "America/Chicago", "OREGON": "America/Los_Angeles", "PENNSYLVANIA": "America/New_York",
+    "RHODE ISLAND": "America/New_York", "SOUTH CAROLINA": "America/New_York", "SOUTH DAKOTA": "America/Chicago",
+    "TENNESSEE": "America/Chicago", "TEXAS": "America/Chicago", "UTAH": "America/Denver",
+    "VERMONT": "America/New_York", "VIRGINIA": "America/New_York", "WASHINGTON": "America/Los_Angeles",
+    "WEST VIRGINIA": "America/New_York", "WISCONSIN": "America/Chicago", "WYOMING": "America/Denver",
+    "PUERTO RICO": "America/Puerto_Rico", "VIRGIN ISLANDS": "America/St_Thomas", "GUAM": "Pacific/Guam",
+    "AMERICAN SAMOA": "Pacific/Pago_Pago",
+}
+
+# Zone of rows without a usable CZ_TIMEZONE or STATE (the old "+7 hours" Arizona assumption)
+default_zone = "America/Phoenix"
+
+
+# Function to turn a CZ_TIMEZONE label ("MST-7", "CST", "GST10") into its UTC offset in hours, or NaN
+def zone_offset(label):
+    match = zone_pattern.match(str(label).strip().upper())
+    if not match:
+        return np.nan
+    if match.group(2) is not None:
+        return float(int(match.group(2)))
+    return float(zone_offsets.get(match.group(1), np.nan))
+
+
+# Function to build the local begin time of every row from BEGIN_YEARMONTH, BEGIN_DAY and BEGIN_TIME
+def local_begin_times(df):
+    yearmonth = df["BEGIN_YEARMONTH"].to_numpy(dtype=np.int64)
+    time = df["BEGIN_TIME"].to_numpy(dtype=np.int64)
+    months = ((yearmonth // 100 - 1970) * 12 + yearmonth % 100 - 1).astype("datetime64[M]")
+    local = (months.astype("datetime64[m]")
+             + (df["BEGIN_DAY"].to_numpy(dtype=np.int64) - 1) * np.timedelta64(1, "D")
+             + (time // 100) * np.timedelta64(1, "h")
+             + (time % 100) * np.timedelta64(1, "m"))
+    return pd.Series(local.astype("datetime64[ns]"), index=df.index)
+
+
+# Function to convert local begin times to UTC, row by row zone but in bulk
+def to_utc(local, cz_timezone=None, states=None):
+    """
+    INPUTS:
+    local - Series of naive local begin times
+    cz_timezone - Series of CZ_TIMEZONE labels (optional); Storm Events times are
+                  recorded in this zone, so its fixed offset is applied directly
+    states - Series of STATE names (optional); rows without a known label are
+             localized with the state's tz rules, including daylight saving
+
+    OUTPUT:
+    Series of naive UTC times
+    """
+    offsets = pd.Series(np.nan, index=local.index)
+    if cz_timezone is not None:
+        labels = cz_timezone.astype(str)
+        offsets = labels.map({label: zone_offset(label) for label in labels.unique()})
+    utc = local - pd.to_timedelta(offsets, unit="h")
+
+    unknown = offsets.isna()
+    if unknown.any():
+        zones = states[unknown].str.upper().map(state_zones) if states is not None else None
+        zones = zones.fillna(default_zone) if zones is not None else pd.Series(default_zone, index=local.index[unknown])
+        for zone, rows in zones.groupby(zones).groups.items():
+            # Ambiguous fall-back hours are read as standard time, skipped spring-forward hours shift forward
+            localized = local[rows].dt.tz_localize(zone, ambiguous=np.zeros(len(rows), dtype=bool),
+                                                  nonexistent="shift_forward")
+            utc[rows] = localized.dt.tz_convert("UTC").dt.tz_localize(None)
+    return utc
+
+
+# Function to snap UTC times to the MERRA-2 tavg1 time stamps (HH:30), as the per-row rounding did:
+# minutes 0-30 go to HH:30, minutes 31-59 to the next hour's HH:30
+def snap_to_half_hour(utc):
+    return utc.dt.floor("h") + pd.Timedelta(minutes=30) + pd.to_timedelta((utc.dt.minute > 30).astype(int), unit="h")
+
+
+# Function to add begTime, endTime and begHour to the table
+def convert_to_utc(df):
+    local = local_begin_times(df)
+    utc = snap_to_half_hour(to_utc(
+        local,
+        df["CZ_TIMEZONE"] if "CZ_TIMEZONE" in df.columns else None,
+        df["STATE"] if "STATE" in df.columns else None,
+    ))
+
+    # Format each distinct day once; begHour is always HH:30 after snapping
+    unique_days, days = np.unique(utc.to_numpy().astype("datetime64[D]"), return_inverse=True)
+    dates = np.datetime_as_string(unique_days, unit="D").astype(object)
+    df["begTime"] = (dates + "T00:00:00Z")[days]
+    df["endTime"] = (dates + "T23:00:00Z")[days]
+    df["begHour"] = np.array([f"{hour:02d}:30" for hour in range(24)])[utc.dt.hour.to_numpy()]
+    return df
+
+
+if __name__ == "__main__":
+    df = pd.read_excel(input_file)
+    convert_to_utc(df)
+
+    # Save to a new file
+    df.to_excel(output_file, index=False)
+
+    print(f"Conversion complete. Saved to {output_file}.")
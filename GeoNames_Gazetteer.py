@@ -0,0 +1,138 @@
+import re
+import csv
+import sys
+import hashlib
+import unicodedata
+import numpy as np
+
+# GeoNames country extract (https://download.geonames.org/export/dump/US.zip) and the index built from it
+geonames_dump = "US.txt"
+index_file = "US.gazetteer.npy"
+
+# Feature classes kept in the index: populated places, admin areas (counties), areas, terrain
+default_feature_classes = ("P", "A", "L", "T")
+
+# Name reported in the BE column for answers from the local index
+source_name = "GeoNames (offline)"
+
+# StormEvents STATE values -> GeoNames admin1 codes
+state_codes = {
+    "ALABAMA": "AL", "ALASKA": "AK", "ARIZONA": "AZ", "ARKANSAS": "AR", "CALIFORNIA": "CA",
+    "COLORADO": "CO", "CONNECTICUT": "CT", "DELAWARE": "DE", "DISTRICT OF COLUMBIA": "DC",
+    "FLORIDA": "FL", "GEORGIA": "GA", "HAWAII": "HI", "IDAHO": "ID", "ILLINOIS": "IL", "INDIANA": "IN",
+    "IOWA": "IA", "KANSAS": "KS", "KENTUCKY": "KY", "LOUISIANA": "LA", "MAINE": "ME", "MARYLAND": "MD",
+    "MASSACHUSETTS": "MA", "MICHIGAN": "MI", "MINNESOTA": "MN", "MISSISSIPPI": "MS", "MISSOURI": "MO",
+    "MONTANA": "MT", "NEBRASKA": "NE", "NEVADA": "NV", "NEW HAMPSHIRE": "NH", "NEW JERSEY": "NJ",
+    "NEW MEXICO": "NM", "NEW YORK": "NY", "NORTH CAROLINA": "NC", "NORTH DAKOTA": "ND", "OHIO": "OH",
+    "OKLAHOMA": "OK", "OREGON": "OR", "PENNSYLVANIA": "PA", "RHODE ISLAND": "RI", "SOUTH CAROLINA": "SC",
+    "SOUTH DAKOTA": "SD", "TENNESSEE": "TN", "TEXAS": "TX", "UTAH": "UT", "VERMONT": "VT",
+    "VIRGINIA": "VA", "WASHINGTON": "WA", "WEST VIRGINIA": "WV", "WISCONSIN": "WI", "WYOMING": "WY",
+    "PUERTO RICO": "PR", "VIRGIN ISLANDS": "VI", "GUAM": "GU", "AMERICAN SAMOA": "AS",
+}
+
+# Record layout of the index: sorted by key, then by rank within a key. Coordinates are
+# float64 so BB/BC carry the dump's decimal values, as the online GeoNames answers do
+index_dtype = np.dtype([
+    ("key", "<u8"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("population", "<i8"),
+    ("rank", "<u4"),
+])
+
+# County-like suffixes also indexed without the suffix, so CZ_NAME "PINAL" finds "Pinal County"
+admin_suffixes = re.compile(r"\s+(county|parish|borough|census area|municipality)$")
+
+
+# Function to normalize a place name: ASCII, lower case, punctuation dropped, single spaces
+def normalize_name(name):
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    name = re.sub(r"[^a-z0-9 ]+", " ", name.lower().replace("'", ""))
+    return " ".join(name.split())
+
+
+# Function to turn a STATE value ("ARIZONA") or admin1 code ("AZ") into the admin1 code
+def state_code(state):
+    state = str(state or "").strip().upper()
+    return state_codes.get(state, state)
+
+
+# Function to hash a (name, state) pair into the 64-bit index key
+def make_key(name, state):
+    digest = hashlib.blake2b(f"{normalize_name(name)}|{state_code(state)}".encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+# Function to build the index from a GeoNames dump
+def build_index(dump_file=geonames_dump, output_file=index_file, feature_classes=default_feature_classes):
+    """
+    Keeps one record per (name variant, place). Within a key, records are ranked
+    by population (largest first), with populated places ahead of other features
+    of the same population. Returns the number of index records.
+    """
+    class_rank = {feature_class: i for i, feature_class in enumerate(default_feature_classes)}
+    records = []
+    with open(dump_file, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) < 15 or row[6] not in feature_classes:
+                continue
+            name, ascii_name, lat, lon, feature_class, admin1 = row[1], row[2], row[4], row[5], row[6], row[10]
+            population = int(row[14] or 0)
+            variants = {normalize_name(name), normalize_name(ascii_name)}
+            if feature_class == "A":
+                variants |= {admin_suffixes.sub("", v) for v in variants}
+            for variant in variants:
+                if variant:
+                    records.append((make_key(variant, admin1), float(lat), float(lon), population,
+                                    class_rank.get(feature_class, len(class_rank))))
+
+    # The rank field holds the feature-class order until the final ranks are computed
+    index = np.array(records, dtype=index_dtype)
+    index = index[np.lexsort((index["rank"], -index["population"], index["key"]))]
+
+    # Rank within each key (0 = preferred answer)
+    starts = np.r_[0, np.flatnonzero(np.diff(index["key"])) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(index)]))
+    index["rank"] = np.arange(len(index)) - group_start
+
+    np.save(output_file, index)
+    return len(index)
+
+
+class Gazetteer:
+    """Memory-mapped lookup over an index written by build_index."""
+
+    def __init__(self, path=index_file):
+        self.index = np.load(path, mmap_mode="r")
+        self.keys = self.index["key"]
+
+    # Return every match for (name, state) as [(lat, lon, population)], best first
+    def candidates(self, name, state):
+        key = np.uint64(make_key(name, state))
+        start = np.searchsorted(self.keys, key, side="left")
+        end = np.searchsorted(self.keys, key, side="right")
+        return [(float(r["lat"]), float(r["lon"]), int(r["population"])) for r in self.index[start:end]]
+
+    # Return (lat, lon) of the best match, or None
+    def lookup(self, name, state):
+        key = np.uint64(make_key(name, state))
+        start = np.searchsorted(self.keys, key, side="left")
+        if start < len(self.keys) and self.keys[start] == key:
+            record = self.index[start]
+            return float(record["lat"]), float(record["lon"])
+        return None
+
+    # Geocode like the remote providers: returns (lat, lon, source) or (None, None, None)
+    def geocode(self, state, location):
+        coordinates = self.lookup(location, state)
+        if coordinates:
+            return coordinates[0], coordinates[1], source_name
+        return None, None, None
+
+
+if __name__ == "__main__":
+    # Usage: python GeoNames_Gazetteer.py [US.txt] [US.gazetteer.npy]
+    dump = sys.argv[1] if len(sys.argv) > 1 else geonames_dump
+    output = sys.argv[2] if len(sys.argv) > 2 else index_file
+    count = build_index(dump, output)
+    print(f"Indexed {count} name variants from {dump} into {output}")
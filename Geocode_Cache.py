@@ -0,0 +1,146 @@
+import sys
+import time
+import sqlite3
+import pandas as pd
+
+# On-disk cache shared by every geocoding script
+cache_file = "geocode_cache.sqlite"
+
+# Found coordinates rarely move; "not found" answers are retried sooner in case a provider adds the place
+positive_ttl = 365 * 24 * 3600
+negative_ttl = 30 * 24 * 3600
+
+
+# Function to normalize a query so "Phoenix , ARIZONA" and "phoenix, Arizona" share one cache entry
+def normalize_query(location, state=None):
+    text = f"{location}, {state}" if state else str(location)
+    parts = [" ".join(part.split()) for part in text.lower().split(",")]
+    return ", ".join(part for part in parts if part)
+
+
+class GeocodeCache:
+    """
+    SQLite cache of geocoder answers keyed by (provider, normalized query).
+
+    Positive and negative ("not found") answers are both stored, each with its own
+    TTL. Provider errors are never cached, so they are retried on the next lookup.
+    Hits and misses are counted per provider for the current run and added to the
+    running totals in the database by report().
+    """
+
+    def __init__(self, path=cache_file, positive_ttl=positive_ttl, negative_ttl=negative_ttl):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = {}
+        self.misses = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                lat REAL,
+                lon REAL,
+                fetched REAL NOT NULL,
+                PRIMARY KEY (provider, query)
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                provider TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+    # Return (lat, lon) for a cached hit, None for a cached "not found", or raise KeyError on a miss
+    def get(self, provider, location, state=None):
+        row = self.db.execute(
+            "SELECT found, lat, lon, fetched FROM geocodes WHERE provider = ? AND query = ?",
+            (provider, normalize_query(location, state)),
+        ).fetchone()
+        if row is not None:
+            found, lat, lon, fetched = row
+            ttl = self.positive_ttl if found else self.negative_ttl
+            if time.time() - fetched < ttl:
+                self.hits[provider] = self.hits.get(provider, 0) + 1
+                return (lat, lon) if found else None
+        self.misses[provider] = self.misses.get(provider, 0) + 1
+        raise KeyError((provider, location, state))
+
+    # Store an answer; coordinates of None record a negative result
+    def put(self, provider, location, state, coordinates, fetched=None):
+        found = coordinates is not None
+        lat, lon = coordinates if found else (None, None)
+        self.db.execute(
+            "INSERT OR REPLACE INTO geocodes (provider, query, found, lat, lon, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+            (provider, normalize_query(location, state), int(found), lat, lon, fetched or time.time()),
+        )
+        self.db.commit()
+
+    # Return the cached answer, or call query(location, state) and cache what it returns
+    def lookup(self, provider, location, state, query):
+        """
+        query - provider call returning (lat, lon) or None when nothing matches;
+                it should raise on network/service errors so they are not cached
+        """
+        try:
+            return self.get(provider, location, state)
+        except KeyError:
+            pass
+        coordinates = query(location, state)
+        self.put(provider, location, state, coordinates)
+        return coordinates
+
+    # Warm-start the cache from a table written by the geocoding scripts (BA/BB/BC/BE columns)
+    def import_geocoded(self, df, location_column="BA", lat_column="BB", lon_column="BC",
+                        provider_column="BE", state_column="STATE", default_provider=None):
+        imported = 0
+        for row in df.itertuples(index=False):
+            row = row._asdict()
+            location, lat, lon = row.get(location_column), row.get(lat_column), row.get(lon_column)
+            provider = row.get(provider_column) if provider_column in row else default_provider
+            if pd.isnull(location) or pd.isnull(lat) or pd.isnull(lon) or pd.isnull(provider):
+                continue
+            self.put(provider, location, row.get(state_column), (float(lat), float(lon)))
+            imported += 1
+        return imported
+
+    # Print this run's hit/miss counters and fold them into the persistent totals
+    def report(self):
+        for provider in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits.get(provider, 0), self.misses.get(provider, 0)
+            rate = 100 * hits / (hits + misses) if hits + misses else 0
+            print(f"Geocode cache [{provider}]: {hits} hits, {misses} misses ({rate:.1f}% hit rate)")
+            self.db.execute(
+                "INSERT INTO stats (provider, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT(provider) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (provider, hits, misses),
+            )
+        self.db.commit()
+        self.hits, self.misses = {}, {}
+
+    # Return the persistent per-provider totals as {provider: (hits, misses)}
+    def totals(self):
+        return {provider: (hits, misses)
+                for provider, hits, misses in self.db.execute("SELECT provider, hits, misses FROM stats")}
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    # Usage: python Geocode_Cache.py import <geocoded.csv|.xlsx> [default provider]
+    #        python Geocode_Cache.py stats
+    if len(sys.argv) >= 3 and sys.argv[1] == "import":
+        input_file = sys.argv[2]
+        df = pd.read_excel(input_file) if input_file.endswith(".xlsx") else pd.read_csv(input_file)
+        cache = GeocodeCache()
+        count = cache.import_geocoded(df, default_provider=sys.argv[3] if len(sys.argv) > 3 else None)
+        print(f"Imported {count} geocoded locations from {input_file} into {cache_file}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "stats":
+        cache = GeocodeCache()
+        for provider, (hits, misses) in sorted(cache.totals().items()):
+            print(f"{provider}: {hits} hits, {misses} misses")
+    else:
+        print("Usage: python Geocode_Cache.py import <geocoded file> [default provider] | stats")
+        sys.exit(1)
@@ -0,0 +1,314 @@
+import abc
+import time
+import asyncio
+import argparse
+import aiohttp
+import pandas as pd
+
+from Geocode_Cache import GeocodeCache, normalize_query
+from GeoNames_Gazetteer import Gazetteer, source_name as gazetteer_source_name
+
+# Provider endpoints (overridable, e.g. to point the engine at a local stub server)
+us_census_geocode_url = "https://geocoding.geo.census.gov/geocoder/locations/onelineaddress"
+geonames_url = "http://api.geonames.org/searchJSON"
+nominatim_url = "https://nominatim.openstreetmap.org/search"
+
+# Rows geocoded concurrently
+default_max_in_flight = 32
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second on average, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Provider(abc.ABC):
+    """
+    One geocoder in the fallback chain. query() returns (lat, lon) or None (not
+    found); errors raise so they are neither cached nor mistaken for "not found".
+    Answers of providers with cached = True go through the GeocodeCache.
+    """
+
+    name = None
+    cached = True
+
+    @abc.abstractmethod
+    async def query(self, session, location, state):
+        """Return (lat, lon) or None for one location."""
+
+
+class HttpProvider(Provider):
+    """
+    One remote geocoder with its own rate limiter. Subclasses build the request
+    parameters (and optionally headers) and parse the JSON answer.
+    """
+
+    def __init__(self, url, rate, capacity=1):
+        self.url = url
+        self.bucket = TokenBucket(rate, capacity)
+
+    @abc.abstractmethod
+    def params(self, location, state):
+        """Return the query-string parameters of one request."""
+
+    @abc.abstractmethod
+    def parse(self, payload):
+        """Return (lat, lon) or None from the decoded JSON answer."""
+
+    # Extra request headers (none by default)
+    def headers(self):
+        return None
+
+    async def query(self, session, location, state):
+        await self.bucket.acquire()
+        async with session.get(self.url, params=self.params(location, state), headers=self.headers()) as response:
+            response.raise_for_status()
+            return self.parse(await response.json(content_type=None))
+
+
+class CensusProvider(HttpProvider):
+    name = "US Census Geocoder"
+
+    # The Census geocoder publishes no hard limit; stay polite by default
+    def __init__(self, url=us_census_geocode_url, rate=10, capacity=10):
+        super().__init__(url, rate, capacity)
+
+    def params(self, location, state):
+        return {"address": f"{location}, {state}", "benchmark": "Public_AR_Current", "format": "json"}
+
+    def parse(self, payload):
+        matches = payload["result"]["addressMatches"]
+        if matches:
+            coordinates = matches[0]["coordinates"]
+            return coordinates["y"], coordinates["x"]
+        return None
+
+
+class GeoNamesProvider(HttpProvider):
+    name = "GeoNames"
+
+    # Free GeoNames accounts get 1000 credits per hour
+    def __init__(self, username, url=geonames_url, rate=1000 / 3600, capacity=5):
+        super().__init__(url, rate, capacity)
+        self.username = username
+
+    def params(self, location, state):
+        return {"q": f"{location}, {state}", "maxRows": 1, "username": self.username}
+
+    def parse(self, payload):
+        if "status" in payload:
+            raise RuntimeError(f"GeoNames error: {payload['status'].get('message')}")
+        places = payload.get("geonames") or []
+        if places:
+            return float(places[0]["lat"]), float(places[0]["lng"])
+        return None
+
+
+class NominatimProvider(HttpProvider):
+    name = "Nominatim"
+
+    # Nominatim's usage policy allows at most 1 request per second
+    def __init__(self, user_agent="dust_storm_geocoder", url=nominatim_url, rate=1, capacity=1):
+        super().__init__(url, rate, capacity)
+        self.user_agent = user_agent
+
+    def params(self, location, state):
+        return {"q": f"{location}, {state}", "format": "json", "limit": 1}
+
+    # The usage policy requires an identifying User-Agent
+    def headers(self):
+        return {"User-Agent": self.user_agent}
+
+    def parse(self, payload):
+        if payload:
+            return float(payload[0]["lat"]), float(payload[0]["lon"])
+        return None
+
+
+class GazetteerProvider(Provider):
+    """Offline GeoNames index; no HTTP and no rate limit, so it is never cached either."""
+
+    name = gazetteer_source_name
+    cached = False
+
+    def __init__(self, path="US.gazetteer.npy"):
+        self.gazetteer = Gazetteer(path)
+
+    async def query(self, session, location, state):
+        return self.gazetteer.lookup(location, state)
+
+
+class GeocodingEngine:
+    """
+    Geocodes many rows concurrently through a fallback chain of providers.
+
+    Sequential mode asks the providers in chain order, like geocode_location in
+    NLP_Geocoding_GeoNames_USCensus.py. With race=True all providers are asked
+    at once and the answer of the highest-priority provider that found the place
+    wins, so results are identical and only latency changes. Identical in-flight
+    queries share one request, and answers go through the GeocodeCache.
+    """
+
+    def __init__(self, providers, cache=None, max_in_flight=default_max_in_flight, race=False):
+        self.providers = list(providers)
+        self.cache = cache
+        self.race = race
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.inflight = {}
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        return self
+
+    async def __aexit__(self, *exc):
+        # Let requests whose race was already decided finish, so their answers are cached too
+        if self.inflight:
+            await asyncio.gather(*self.inflight.values(), return_exceptions=True)
+        await self.session.close()
+
+    # Ask one provider, going through the cache and sharing identical in-flight requests
+    async def ask(self, provider, location, state):
+        if not provider.cached:
+            return await provider.query(self.session, location, state)
+        if self.cache is not None:
+            try:
+                return self.cache.get(provider.name, location, state)
+            except KeyError:
+                pass
+        key = (provider.name, normalize_query(location, state))
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(provider.query(self.session, location, state))
+            self.inflight[key] = future
+            future.add_done_callback(lambda done: self.finish(key, provider, location, state, done))
+        # Shielded: a caller cancelled in race mode does not cancel the request the others share
+        return await asyncio.shield(future)
+
+    # Done-callback of a shared request: drop it from the in-flight table and cache its answer
+    def finish(self, key, provider, location, state, future):
+        self.inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        if self.cache is not None:
+            self.cache.put(provider.name, location, state, future.result())
+
+    # Like ask(), but a provider error counts as "not found" for this row (and is reported)
+    async def ask_safely(self, provider, location, state):
+        try:
+            return await self.ask(provider, location, state)
+        except Exception as e:
+            print(f"{provider.name} error: {e}")
+            return None
+
+    # Geocode one location through the chain; returns (lat, lon, source) like geocode_location
+    async def geocode(self, state, location):
+        if self.race:
+            tasks = [asyncio.ensure_future(self.ask_safely(p, location, state)) for p in self.providers]
+            try:
+                for provider, task in zip(self.providers, tasks):
+                    coordinates = await task
+                    if coordinates:
+                        return coordinates[0], coordinates[1], provider.name
+            finally:
+                for task in tasks:
+                    task.cancel()
+            return None, None, None
+
+        for provider in self.providers:
+            coordinates = await self.ask_safely(provider, location, state)
+            if coordinates:
+                return coordinates[0], coordinates[1], provider.name
+        return None, None, None
+
+    # Geocode one row; returns the BA-BE values the scripts write
+    async def geocode_row(self, state, locations, cz_name):
+        async with self.semaphore:
+            for location in locations:
+                lat, lon, source = await self.geocode(state, location)
+                if lat and lon:
+                    return {"BA": location, "BB": lat, "BC": lon, "BD": f"Narrative: {location}", "BE": source}
+            if locations:
+                return {"BD": "Narrative found, but geocoding failed"}
+            if pd.notnull(cz_name):
+                lat, lon, source = await self.geocode(state, cz_name)
+                return {"BA": cz_name, "BB": lat, "BC": lon,
+                        "BD": "No narrative location found, using CZ_NAME for location", "BE": source}
+            return {}
+
+    async def geocode_rows(self, states, row_locations, cz_names):
+        return await asyncio.gather(*[
+            self.geocode_row(state, locations, cz_name)
+            for state, locations, cz_name in zip(states, row_locations, cz_names)
+        ])
+
+
+# Function to geocode a DataFrame; row_locations holds the narrative locations of each row, in row order
+def geocode_dataframe(df, row_locations, providers, cache=None, max_in_flight=default_max_in_flight, race=False):
+    async def run():
+        async with GeocodingEngine(providers, cache, max_in_flight, race) as engine:
+            return await engine.geocode_rows(df["STATE"], row_locations, df["CZ_NAME"])
+
+    results = asyncio.run(run())
+    for index, values in zip(df.index, results):
+        for column, value in values.items():
+            df.at[index, column] = value
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent narrative geocoding with per-provider rate limits.")
+    parser.add_argument("input_file", nargs="?", default="combined_rows.csv")
+    parser.add_argument("output_file", nargs="?", default="combined_rows_identify_which_geocode.csv")
+    parser.add_argument("--providers", default="census,geonames",
+                        help="Comma-separated fallback chain: census, gazetteer, geonames, nominatim")
+    parser.add_argument("--gazetteer", default="US.gazetteer.npy", help="Offline GeoNames index file")
+    parser.add_argument("--geonames-user", default="soheil.bouzari", help="GeoNames username")
+    parser.add_argument("--max-in-flight", type=int, default=default_max_in_flight, help="Rows geocoded concurrently")
+    parser.add_argument("--race", action="store_true", help="Query the whole fallback chain concurrently")
+    parser.add_argument("--cache", default="geocode_cache.sqlite", help="Geocode cache file ('' to disable)")
+    args = parser.parse_args(argv)
+
+    import spaCy_Extraction as extraction
+
+    factories = {
+        "census": lambda: CensusProvider(),
+        "gazetteer": lambda: GazetteerProvider(args.gazetteer),
+        "geonames": lambda: GeoNamesProvider(args.geonames_user),
+        "nominatim": lambda: NominatimProvider(),
+    }
+    providers = [factories[name.strip()]() for name in args.providers.split(",")]
+    cache = GeocodeCache(args.cache) if args.cache else None
+
+    df_input = pd.read_csv(args.input_file)
+    nlp = extraction.load_pipeline(components=("ner",))
+    episode_locations = extraction.extract_column_locations(nlp, df_input["EPISODE_NARRATIVE"])
+    event_locations = extraction.extract_column_locations(nlp, df_input["EVENT_NARRATIVE"])
+    row_locations = [a + b for a, b in zip(episode_locations, event_locations)]
+
+    geocode_dataframe(df_input, row_locations, providers, cache, args.max_in_flight, args.race)
+    df_input.to_csv(args.output_file, index=False)
+    if cache is not None:
+        cache.report()
+    print(f"Geocoding complete. Results saved to {args.output_file}.")
+
+
+if __name__ == "__main__":
+    main()
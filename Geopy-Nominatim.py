@@ -1,6 +1,7 @@
 import pandas as pd
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut
+from Geocode_Cache import GeocodeCache
 
 # Load your data from Excel
 input_file = "combined_rows_final_output - 10-1-2024.xlsx"
@@ -9,12 +10,20 @@ df = pd.read_excel(input_file)
 # Initialize geolocator
 geolocator = Nominatim(user_agent="geo_app")
 
-# Function to get coordinates
+# Shared on-disk geocode cache (keyed by provider and normalized query)
+geocode_cache = GeocodeCache("geocode_cache.sqlite")
+
+# Function to query Nominatim; returns (lat, lon) or None, and raises on timeouts
+def query_nominatim(location_name, state):
+    location = geolocator.geocode(location_name)
+    return (location.latitude, location.longitude) if location else None
+
+# Function to get coordinates (answers, including "Not Found", are cached; timeouts are not)
 def get_coordinates(location_name):
     try:
-        location = geolocator.geocode(location_name)
+        location = geocode_cache.lookup("Nominatim", location_name, None, query_nominatim)
         if location:
-            return f"{location.latitude}, {location.longitude}"
+            return f"{location[0]}, {location[1]}"
         else:
             return "Not Found"
     except GeocoderTimedOut:
@@ -26,4 +35,5 @@ df['Geocoordinate'] = df['Extracted_Location - 9-29-2024'].apply(get_coordinates
 # Save the output to a new Excel file
 output_file = "combined_rows_final_output_GeoLocation_11-17-2024.xlsx"
 df.to_excel(output_file, index=False)
+geocode_cache.report()
 print(f"Geocoding complete. Results saved to {output_file}.")
@@ -0,0 +1,95 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# Geocoded events table and the "..._with_bounds.xlsx" table ConvertToUTC.py reads
+input_file = "Arizona_1996-2023_Final-12_19_2024.xlsx"
+output_file = "Arizona_1996-2023_Final-12_19_2024_with_bounds.xlsx"
+
+# Grid spacing and origin (dlon, dlat, lon0, lat0): the native MERRA-2 grid and the
+# cfsr0.5a destination grid the subset requests regrid to
+grids = {
+    "merra2": (0.625, 0.5, -180.0, -90.0),
+    "cfsr0.5a": (0.5, 0.5, -180.0, -90.0),
+}
+
+# Event coordinates, in order of preference: geocoded (BB/BC, see the geocoding scripts), then the Storm Events begin point
+lat_columns = ("BB", "BEGIN_LAT")
+lon_columns = ("BC", "BEGIN_LON")
+
+
+# Function to pick each row's coordinates from the first column that has them
+def event_coordinates(df, lat_columns=lat_columns, lon_columns=lon_columns):
+    lat = pd.Series(np.nan, index=df.index)
+    lon = pd.Series(np.nan, index=df.index)
+    for lat_column, lon_column in zip(lat_columns, lon_columns):
+        if lat_column in df.columns and lon_column in df.columns:
+            candidate_lat = pd.to_numeric(df[lat_column], errors="coerce")
+            candidate_lon = pd.to_numeric(df[lon_column], errors="coerce")
+            missing = lat.isna() | lon.isna()
+            use = missing & candidate_lat.notna() & candidate_lon.notna()
+            lat[use], lon[use] = candidate_lat[use], candidate_lon[use]
+    return lat.to_numpy(), lon.to_numpy()
+
+
+# Function to build grid-snapped boxes around points, all at once
+def snap_boxes(lat, lon, grid="cfsr0.5a", padding=0):
+    """
+    Each box is the grid cell holding the point (the four nodes bilinear
+    interpolation needs), widened by `padding` cells on every side. Edges sit
+    on grid lines, so nearby events share identical boxes and the request
+    ledger and coalescing planner can deduplicate them.
+
+    INPUTS:
+    lat, lon - arrays of event coordinates (NaN gives a NaN box)
+    grid - "merra2" (0.625 x 0.5 deg) or "cfsr0.5a" (0.5 x 0.5 deg)
+    padding - extra grid cells around the cell of the point
+
+    OUTPUT:
+    dict of minlon, maxlon, minlat, maxlat arrays
+    """
+    dlon, dlat, lon0, lat0 = grids[grid]
+    lat = np.asarray(lat, dtype=float).copy()
+    lon = np.asarray(lon, dtype=float).copy()
+    missing = np.isnan(lat) | np.isnan(lon)
+    lat[missing] = lon[missing] = np.nan
+
+    # A point on a grid line belongs to the cell above/right of it
+    i = np.floor((lon - lon0) / dlon + 1e-9)
+    j = np.floor((lat - lat0) / dlat + 1e-9)
+    return {
+        "minlon": np.round(lon0 + (i - padding) * dlon, 6),
+        "maxlon": np.round(lon0 + (i + 1 + padding) * dlon, 6),
+        "minlat": np.clip(np.round(lat0 + (j - padding) * dlat, 6), -90, 90),
+        "maxlat": np.clip(np.round(lat0 + (j + 1 + padding) * dlat, 6), -90, 90),
+    }
+
+
+# Function to add minlon/maxlon/minlat/maxlat columns to the events table
+def add_bounds(df, grid="cfsr0.5a", padding=0):
+    lat, lon = event_coordinates(df)
+    for column, values in snap_boxes(lat, lon, grid, padding).items():
+        df[column] = values
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add grid-snapped MERRA-2 subset boxes to the events table.")
+    parser.add_argument("input_file", nargs="?", default=input_file)
+    parser.add_argument("output_file", nargs="?", default=output_file)
+    parser.add_argument("--grid", choices=sorted(grids), default="cfsr0.5a", help="Grid the box edges snap to")
+    parser.add_argument("--padding", type=int, default=0, help="Extra grid cells around each event's cell")
+    args = parser.parse_args(argv)
+
+    df = pd.read_excel(args.input_file)
+    add_bounds(df, args.grid, args.padding)
+    df.to_excel(args.output_file, index=False)
+
+    missing = df["minlon"].isna().sum()
+    boxes = df[["minlon", "minlat", "maxlon", "maxlat"]].dropna().drop_duplicates()
+    print(f"Bounds added to {len(df) - missing}/{len(df)} rows ({len(boxes)} distinct boxes). "
+          f"Saved to {args.output_file}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import logging
+import numpy as np
+import xarray as xr
+
+import MERRA2_Subset_Client as subset
+from MERRA2_Jobs import SubsetJob, row_tag
+
+logger = logging.getLogger(__name__)
+
+# A merged box may cover at most this many times the area of the boxes it replaces
+default_max_inflation = 2.0
+
+# Boxes narrower than one cfsr0.5a grid cell still fetch a whole cell, so areas are counted from this size up
+min_extent = 0.5
+
+# Directory for the coalesced downloads that are split into per-event files
+coalesced_directory = "coalesced"
+
+
+# Function to compute the area (deg^2) of a [minlon, minlat, maxlon, maxlat] box
+def box_area(box):
+    return max(box[2] - box[0], min_extent) * max(box[3] - box[1], min_extent)
+
+
+# Function to compute the bounding box of two boxes
+def union_box(a, b):
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+# Function to merge boxes greedily into groups whose union box stays within the inflation limit
+def coalesce_boxes(boxes, max_inflation=default_max_inflation):
+    """
+    INPUTS:
+    boxes - list of [minlon, minlat, maxlon, maxlat]
+    max_inflation - largest allowed (union box area) / (sum of member box areas);
+                    overlapping and adjacent boxes merge easily, distant ones do not
+
+    OUTPUT:
+    list of (union box, [indexes into boxes])
+    """
+    groups = []
+    for i in sorted(range(len(boxes)), key=lambda i: (boxes[i][0], boxes[i][1])):
+        box = [float(v) for v in boxes[i]]
+        for group in groups:
+            merged = union_box(group["box"], box)
+            if box_area(merged) <= max_inflation * (group["area"] + box_area(box)):
+                group["box"] = merged
+                group["area"] += box_area(box)
+                group["members"].append(i)
+                break
+        else:
+            groups.append({"box": box, "area": box_area(box), "members": [i]})
+    return [(group["box"], sorted(group["members"])) for group in groups]
+
+
+# Function to plan one subset job per (day, diurnal hour) group of nearby rows
+def plan_jobs(df, max_inflation=default_max_inflation, location_column="Extracted_Location - 9-29-2024"):
+    """
+    Rows sharing begTime, endTime and begHour are merged into union-box jobs with
+    coalesce_boxes. A group of one row is an ordinary per-row job; a larger group
+    lists its events in job.members so split_job can cut the per-event files.
+    """
+    # Rows that cannot form a valid request are left out, as in jobs_from_table
+    valid = []
+    for index, row in df.iterrows():
+        try:
+            subset.SubsetRequest([row["minlon"], row["minlat"], row["maxlon"], row["maxlat"]],
+                                 row["begTime"], row["endTime"], row["begHour"])
+            valid.append(index)
+        except ValueError as e:
+            logger.error(f"Row {index + 1} - Invalid request, skipping: {e}")
+
+    jobs = []
+    for (begTime, endTime, begHour), rows in df.loc[valid].groupby(["begTime", "endTime", "begHour"], sort=False):
+        boxes = rows[["minlon", "minlat", "maxlon", "maxlat"]].to_numpy(dtype=float).tolist()
+        tags = [row_tag(row, index, location_column) for index, row in rows.iterrows()]
+        names = [f"Row {index + 1}" for index in rows.index]
+
+        for box, members in coalesce_boxes(boxes, max_inflation):
+            args = subset.build_subset_args(box[0], box[2], box[1], box[3], begTime, endTime, begHour, begHour)
+            if len(members) == 1:
+                jobs.append(SubsetJob(names[members[0]], args, tags[members[0]]))
+                continue
+            name = ", ".join(names[i] for i in members)
+            tag = f"group{len(jobs) + 1}"
+            # Union-box downloads get their own directory so they are not mistaken for per-event files
+            jobs.append(SubsetJob(name, args, tag, members=[(tags[i], boxes[i]) for i in members],
+                                  directory=coalesced_directory))
+
+    logger.info(f"Coalesced {len(df)} rows into {len(jobs)} subset jobs")
+    return jobs
+
+
+# Function to pick the grid indexes inside [low, high], or the nearest one if the box falls between grid lines
+def axis_slice(values, low, high):
+    inside = np.flatnonzero((values >= low - 1e-6) & (values <= high + 1e-6))
+    if len(inside):
+        return slice(inside[0], inside[-1] + 1)
+    nearest = int(np.abs(values - (low + high) / 2).argmin())
+    return slice(nearest, nearest + 1)
+
+
+# Function to cut one event box out of a coalesced NetCDF file
+def crop_box(ds, box):
+    return ds.isel(
+        lon=axis_slice(ds["lon"].values, box[0], box[2]),
+        lat=axis_slice(ds["lat"].values, box[1], box[3]),
+    )
+
+
+# Function to split the downloaded files of a coalesced job into per-event files
+def split_job(job, directory="."):
+    """
+    Each event gets the grid points of the union subset that fall inside its own
+    box (the service crops the same destination grid), written as
+    MERRA2_xxx.YYYYMMDD.SUB.<tag>.nc like a per-row download. Returns the paths.
+    """
+    paths = []
+    for path in job.files:
+        with xr.open_dataset(path) as ds:
+            for tag, box in job.members:
+                output = os.path.join(directory, subset.tagged_file_name(os.path.basename(path), tag))
+                crop_box(ds, box).load().to_netcdf(output)
+                paths.append(output)
+                logger.info(f"{job.name} - Split: {output}")
+    return paths
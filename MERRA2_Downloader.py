@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Parallel downloads, streamed block size, and attempts per file (each retry resumes the partial file)
+default_workers = 4
+default_chunk_size = 1 << 20
+default_retries = 3
+
+# Throttling and server-error responses retried (with backoff, or the server's Retry-After) before giving up
+retry_statuses = (429, 500, 502, 503, 504)
+default_backoff = 2
+
+# Suffix of partial downloads; they are renamed into place only once complete and verified
+part_suffix = ".part"
+
+
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded or fails size/checksum verification."""
+
+
+class Downloader:
+    """
+    Streams result files to disk through one pooled requests Session (which
+    also picks up Earthdata credentials from ~/.netrc, like requests.get did).
+
+    Each file is written to <path>.part in blocks and renamed into place once
+    complete, so a crash never leaves a truncated .nc under the final name. A
+    leftover .part file is resumed with an HTTP Range request. Files are
+    checked against the server's length and, when given, an expected size and
+    sha256. Responses in retry_statuses are retried by the session's adapter
+    with exponential backoff, honouring Retry-After. Every finished download
+    adds a record to self.metrics.
+    """
+
+    def __init__(self, session=None, workers=default_workers, chunk_size=default_chunk_size,
+                 retries=default_retries, timeout=300, backoff=default_backoff):
+        self.session = session or requests.Session()
+        # Only status retries here: dropped connections are retried by download(), which resumes the .part file
+        status_retry = Retry(total=retries, connect=0, read=0, other=0, status_forcelist=retry_statuses,
+                             backoff_factor=backoff, allowed_methods=("GET",), respect_retry_after_header=True,
+                             raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=status_retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    # Download url to path; returns the metrics record of the file
+    def download(self, url, path, expected_size=None, expected_sha256=None):
+        error = None
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(2 ** attempt)
+            try:
+                record = self.fetch_once(url, path, expected_size, expected_sha256)
+                with self.lock:
+                    self.metrics.append(record)
+                logger.info(f"Downloaded {path}: {record['size']} bytes, {record['mb_per_s']:.2f} MB/s"
+                            + (" (resumed)" if record["resumed"] else ""))
+                return record
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                error = e
+                logger.warning(f"Download of {url} interrupted ({e}), attempt {attempt + 1}/{self.retries}")
+        raise DownloadError(f"{url} failed after {self.retries} attempts: {error}")
+
+    # One download attempt, resuming <path>.part when it exists
+    def fetch_once(self, url, path, expected_size=None, expected_sha256=None):
+        part = path + part_suffix
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        start = time.perf_counter()
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+            if r.status_code == 416:
+                # The partial file already holds everything the server has
+                total = int(r.headers.get("Content-Range", "*/-1").split("/")[-1])
+                if total != offset:
+                    # A stale partial file, or no length to check it against: start over from zero
+                    logger.warning(f"{url}: cannot resume {offset} bytes (server total {total}), restarting")
+                    os.remove(part)
+                    return self.fetch_once(url, path, expected_size, expected_sha256)
+            elif r.status_code == 206 and offset:
+                total = int(r.headers.get("Content-Range", "*/-1").split("/")[-1])
+            elif r.status_code == 200:
+                offset = 0
+                total = int(r.headers.get("Content-Length", -1))
+            else:
+                raise DownloadError(f"HTTP {r.status_code} downloading {url}")
+
+            digest = hashlib.sha256()
+            if offset:
+                with open(part, "rb") as f:
+                    for block in iter(lambda: f.read(self.chunk_size), b""):
+                        digest.update(block)
+
+            transferred = 0
+            if r.status_code != 416:
+                with open(part, "ab" if offset else "wb") as f:
+                    for block in r.iter_content(self.chunk_size):
+                        f.write(block)
+                        digest.update(block)
+                        transferred += len(block)
+
+        size = offset + transferred
+        if total >= 0 and size < total:
+            # Keep the partial file so the next attempt resumes it
+            raise requests.exceptions.ChunkedEncodingError(f"got {size} of {total} bytes")
+        if (total >= 0 and size != total) or (expected_size is not None and size != expected_size):
+            os.remove(part)
+            raise DownloadError(f"{url}: got {size} bytes, expected {expected_size or total}")
+        checksum = digest.hexdigest()
+        if expected_sha256 is not None and checksum != expected_sha256:
+            os.remove(part)
+            raise DownloadError(f"{url}: sha256 mismatch")
+        os.replace(part, path)
+
+        seconds = time.perf_counter() - start
+        return {
+            "url": url,
+            "path": path,
+            "size": size,
+            "bytes": transferred,
+            "seconds": seconds,
+            "mb_per_s": transferred / seconds / 1e6 if seconds else 0.0,
+            "resumed": bool(offset),
+            "sha256": checksum,
+        }
+
+    # Queue one download on the pool; returns a future of its metrics record
+    def submit(self, url, path, expected_size=None, expected_sha256=None):
+        return self.pool.submit(self.download, url, path, expected_size, expected_sha256)
+
+    # Download [(url, path)] pairs in parallel; returns their metrics records in the same order
+    def download_many(self, targets):
+        futures = [self.submit(url, path) for url, path in targets]
+        return [future.result() for future in futures]
+
+    # Return total bytes, seconds and throughput over every download so far
+    def summary(self):
+        with self.lock:
+            records = list(self.metrics)
+        total_bytes = sum(record["bytes"] for record in records)
+        total_seconds = sum(record["seconds"] for record in records)
+        return {
+            "files": len(records),
+            "bytes": total_bytes,
+            "seconds": total_seconds,
+            "mb_per_s": total_bytes / total_seconds / 1e6 if total_seconds else 0.0,
+            "resumed": sum(1 for record in records if record["resumed"]),
+        }
+
+    def close(self):
+        self.pool.shutdown()
+        self.session.close()
@@ -0,0 +1,198 @@
+import os
+import re
+import argparse
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask
+import dask.array as da
+
+from MERRA2_Jobs import row_tag
+
+# Folder of the per-event subsets and the cached header index of its files
+nc_folder = "/mnt/c/DevNet/NASA/NC Files/"
+index_file = "merra2_file_index.parquet"
+
+# Per-event subsets are named MERRA2_400.YYYYMMDD.SUB.<City>.nc (see Run_Subsetting_MERRA2.py)
+file_pattern = re.compile(r"^(MERRA2_\d+)\.(\d{8})\.SUB\.(.+)\.nc$")
+
+# Events evaluated concurrently while streaming through the files
+default_workers = 8
+
+
+# Function to list the per-event subsets of a folder (names only, no file is opened)
+def scan_files(directory=nc_folder):
+    records = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = file_pattern.match(entry.name)
+            if match and entry.is_file():
+                stat = entry.stat()
+                records.append({"path": entry.path, "date": match.group(2), "tag": match.group(3),
+                                "size": stat.st_size, "mtime": stat.st_mtime})
+    return pd.DataFrame(records, columns=["path", "date", "tag", "size", "mtime"])
+
+
+# Function to read the shape and time range of one subset from its header and coordinates
+def read_header(path):
+    with xr.open_dataset(path) as ds:
+        return {"n_time": ds.sizes.get("time", 1), "n_lat": ds.sizes["lat"], "n_lon": ds.sizes["lon"],
+                "first_time": pd.Timestamp(ds["time"].values[0]) if "time" in ds else pd.NaT}
+
+
+# Function to index the subsets of a folder, re-reading only headers of new or changed files
+def index_files(directory=nc_folder, cache_file=index_file):
+    files = scan_files(directory)
+    cached = pd.read_parquet(cache_file) if cache_file and os.path.exists(cache_file) else None
+    if cached is not None:
+        files = files.merge(cached, on=["path", "size", "mtime"], how="left", suffixes=("", "_cached"))
+        files = files.drop(columns=[c for c in files.columns if c.endswith("_cached")])
+    else:
+        files = files.assign(n_time=np.nan, n_lat=np.nan, n_lon=np.nan, first_time=pd.NaT)
+
+    stale = files["n_lat"].isna()
+    for i in files.index[stale]:
+        for column, value in read_header(files.at[i, "path"]).items():
+            files.at[i, column] = value
+    files[["n_time", "n_lat", "n_lon"]] = files[["n_time", "n_lat", "n_lon"]].astype(int)
+    if cache_file:
+        files.to_parquet(cache_file, index=False)
+    return files
+
+
+# Function to match events to their subset files by UTC day and location tag
+def build_index(events, files, location_column="Extracted_Location - 9-29-2024", id_column="EVENT_ID"):
+    """
+    INPUTS:
+    events - table with begTime and begHour (see ConvertToUTC.py) and the location column
+    files - output of index_files
+
+    OUTPUT:
+    one row per (event, file) with the event's UTC begin time and the file's shape
+    """
+    keys = pd.DataFrame({
+        "event_id": events[id_column].to_numpy() if id_column in events.columns else events.index.to_numpy(),
+        "date": events["begTime"].astype(str).str[:10].str.replace("-", ""),
+        "tag": [row_tag(row, index, location_column) for index, row in events.iterrows()],
+        "begin": pd.to_datetime(events["begTime"].astype(str).str[:10] + " " + events["begHour"].astype(str)),
+    })
+    return keys.merge(files, on=["date", "tag"], how="inner").reset_index(drop=True)
+
+
+# Function to load one variable of one subset, NaN-padded to a common shape
+def load_padded(path, variable, shape):
+    out = np.full(shape, np.nan, dtype="float32")
+    with xr.open_dataset(path) as ds:
+        values = ds[variable].values
+    out[:values.shape[0], :values.shape[1], :values.shape[2]] = values
+    return out
+
+
+# Function to load one subset's time/lat/lon coordinates, NaT/NaN-padded to a common shape
+def load_padded_coords(path, shape):
+    time = np.full(shape[0], np.datetime64("NaT"), dtype="datetime64[ns]")
+    lat, lon = np.full(shape[1], np.nan), np.full(shape[2], np.nan)
+    with xr.open_dataset(path) as ds:
+        if "time" in ds:
+            time[:ds.sizes["time"]] = ds["time"].values
+        lat[:ds.sizes["lat"]] = ds["lat"].values
+        lon[:ds.sizes["lon"]] = ds["lon"].values
+    return time, lat, lon
+
+
+# Function to open one subset, apply func(event, ds) and return its result
+def apply_event(path, event, func):
+    with xr.open_dataset(path) as ds:
+        return func(event, ds)
+
+
+class EventDataset:
+    """
+    Thousands of per-event subsets seen as one lazy collection.
+
+    The boxes (and time axes) of the files differ, so they cannot be merged by
+    coordinates. Instead every event is one entry of a ragged "event"
+    dimension: padded() gives an event x time x lat x lon dask array with one
+    chunk per event, NaN-padded to the largest file (each event's own
+    time/lat/lon come along as NaT/NaN-padded coordinates), and map_events() streams
+    a reduction through the files with at most `workers` open at a time.
+    Nothing is read until a result is computed.
+    """
+
+    def __init__(self, index, workers=default_workers):
+        self.index = index
+        self.workers = workers
+
+    @classmethod
+    def from_folder(cls, events, directory=nc_folder, cache_file=index_file, **kwargs):
+        return cls(build_index(events, index_files(directory, cache_file), **kwargs))
+
+    def __len__(self):
+        return len(self.index)
+
+    # Return one event's subset as a lazily loaded xarray Dataset
+    def open_event(self, i):
+        return xr.open_dataset(self.index.at[i, "path"])
+
+    # Return a lazy event x time x lat x lon DataArray of one variable, with each event's coordinates
+    def padded(self, variable):
+        """
+        OUTPUT:
+        DataArray with event_time (event, time), event_lat (event, lat) and
+        event_lon (event, lon) coordinates padded like the values, plus the
+        index's begin, first_time and n_time/n_lat/n_lon on the event dimension
+        """
+        shape = tuple(int(self.index[c].max()) for c in ("n_time", "n_lat", "n_lon"))
+        chunks = [
+            da.from_delayed(dask.delayed(load_padded)(path, variable, shape), shape=shape, dtype="float32")
+            for path in self.index["path"]
+        ]
+        axes = [dask.delayed(load_padded_coords, nout=3)(path, shape) for path in self.index["path"]]
+        event_time, event_lat, event_lon = (
+            da.stack([da.from_delayed(a[i], shape=(shape[i],), dtype=dtype) for a in axes])
+            for i, dtype in enumerate(("datetime64[ns]", "float64", "float64"))
+        )
+        coords = {"event": self.index["event_id"].to_numpy(),
+                  "event_time": (("event", "time"), event_time),
+                  "event_lat": (("event", "lat"), event_lat),
+                  "event_lon": (("event", "lon"), event_lon)}
+        coords.update({c: ("event", self.index[c].to_numpy())
+                       for c in ("begin", "first_time", "n_time", "n_lat", "n_lon") if c in self.index.columns})
+        return xr.DataArray(da.stack(chunks), dims=("event", "time", "lat", "lon"), coords=coords, name=variable)
+
+    # Apply func(event row, Dataset) to every event, streaming through the files; returns the results in order
+    def map_events(self, func):
+        tasks = [dask.delayed(apply_event)(event.path, event, func) for event in self.index.itertuples()]
+        return list(dask.compute(*tasks, scheduler="threads", num_workers=self.workers))
+
+    # Return the peak of a variable over each event's box within +/- hours of its begin time
+    def peak_near_begin(self, variable="SPEEDMAX", hours=3):
+        window = pd.Timedelta(hours=hours)
+
+        def peak(event, ds):
+            values = ds[variable].sel(time=slice(event.begin - window, event.begin + window))
+            return float(values.max()) if values.size else np.nan
+
+        return pd.Series(self.map_events(peak), index=self.index["event_id"], name=f"{variable}_peak_{hours}h")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-event peak of a MERRA-2 variable around the event begin time.")
+    parser.add_argument("events_file", nargs="?",
+                        default="Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx")
+    parser.add_argument("--folder", default=nc_folder, help="Folder of MERRA2_*.SUB.<City>.nc files")
+    parser.add_argument("--variable", default="SPEEDMAX")
+    parser.add_argument("--hours", type=float, default=3, help="Window half-width around begHour")
+    parser.add_argument("--output", default="event_peaks.csv")
+    args = parser.parse_args(argv)
+
+    events = pd.read_excel(args.events_file) if args.events_file.endswith(".xlsx") else pd.read_csv(args.events_file)
+    dataset = EventDataset.from_folder(events, args.folder)
+    print(f"{len(dataset)} events matched to subset files")
+    peaks = dataset.peak_near_begin(args.variable, args.hours)
+    peaks.to_csv(args.output)
+    print(f"Saved {args.variable} peaks to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
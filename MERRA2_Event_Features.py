@@ -0,0 +1,117 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ProcessPoolExecutor
+
+import MERRA2_Subset_Client as subset
+from MERRA2_Event_Dataset import nc_folder, index_file, index_files, build_index
+
+# Columnar per-event feature table, joined back to the events on EVENT_ID
+features_file = "merra2_event_features.parquet"
+
+# Statistics computed per variable
+statistics = ("at_begin", "daily_max", "daily_mean")
+
+
+# Function to load the variables of one subset as one (variable, time, box) array; returns (values, times)
+def load_values(path, variables=tuple(subset.varNames)):
+    with xr.open_dataset(path) as ds:
+        values = np.stack([ds[variable].values for variable in variables]).astype("float64")
+        times = ds["time"].values
+    return values.reshape(len(variables), len(times), -1), times
+
+
+# Function to reduce one subset's loaded values to the features of each begin time
+def reduce_values(values, times, begins, variables=tuple(subset.varNames)):
+    """
+    All variables are reduced together: the box mean at the time step nearest
+    each event's UTC begin time, and the maximum and mean over the box and
+    every time step of the file (the same for every event of the file). For
+    diurnal subsets (one time step per day) all three come from that step.
+
+    OUTPUT:
+    one {"<VAR>_at_begin": ..., "<VAR>_daily_max": ..., "<VAR>_daily_mean": ..., "begin_step": ...} per begin
+    """
+    daily_max = np.nanmax(values.reshape(len(variables), -1), axis=1)
+    daily_mean = np.nanmean(values.reshape(len(variables), -1), axis=1)
+    box_means = np.nanmean(values, axis=2)
+
+    rows = []
+    for begin in begins:
+        step = int(np.abs(times - np.datetime64(begin)).argmin())
+        features = {"begin_step": pd.Timestamp(times[step])}
+        for i, variable in enumerate(variables):
+            features[f"{variable}_at_begin"] = box_means[i, step]
+            features[f"{variable}_daily_max"] = daily_max[i]
+            features[f"{variable}_daily_mean"] = daily_mean[i]
+        rows.append(features)
+    return rows
+
+
+# Function to reduce one event's subset to its features
+def event_features(path, begin, variables=tuple(subset.varNames)):
+    values, times = load_values(path, variables)
+    return reduce_values(values, times, [begin], variables)[0]
+
+
+# Function to compute the features of one file's events, opening the file once; used by the process pool
+def file_features(path, event_ids, begins, variables):
+    try:
+        values, times = load_values(path, variables)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Skipping {len(event_ids)} events ({os.path.basename(path)}): {e}")
+        return []
+    return [{"EVENT_ID": event_id, **features}
+            for event_id, features in zip(event_ids, reduce_values(values, times, begins, variables))]
+
+
+# Function to reduce every indexed event in a process pool into one table
+def reduce_events(index, variables=tuple(subset.varNames), workers=None):
+    """
+    INPUTS:
+    index - output of MERRA2_Event_Dataset.build_index (event_id, begin, path)
+    workers - worker processes (default: one per CPU)
+
+    OUTPUT:
+    DataFrame with one row per event: EVENT_ID, begin_step and the features
+    """
+    groups = list(index.groupby("path", sort=False))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(
+            file_features,
+            [path for path, _ in groups],
+            [rows["event_id"].tolist() for _, rows in groups],
+            [rows["begin"].tolist() for _, rows in groups],
+            [variables] * len(groups),
+            chunksize=max(1, len(groups) // (4 * (workers or os.cpu_count() or 1))),
+        )
+        rows = [row for part in results for row in part]
+
+    columns = ["EVENT_ID", "begin_step"] + [f"{v}_{s}" for v in variables for s in statistics]
+    table = pd.DataFrame(rows, columns=columns)
+    feature_columns = columns[2:]
+    table[feature_columns] = table[feature_columns].astype("float32")
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-event MERRA-2 features (at begHour, daily max/mean).")
+    parser.add_argument("events_file", nargs="?",
+                        default="Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx")
+    parser.add_argument("--folder", default=nc_folder, help="Folder of MERRA2_*.SUB.<City>.nc files")
+    parser.add_argument("--output", default=features_file, help="Parquet feature table")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    args = parser.parse_args(argv)
+
+    events = pd.read_excel(args.events_file) if args.events_file.endswith(".xlsx") else pd.read_csv(args.events_file)
+    index = build_index(events, index_files(args.folder, index_file))
+    table = reduce_events(index, workers=args.workers)
+    table.to_parquet(args.output, index=False)
+    print(f"Saved features of {len(table)} events to {args.output} "
+          f"(join on EVENT_ID: {len(events) - table['EVENT_ID'].nunique()} events without a subset file)")
+
+
+if __name__ == "__main__":
+    main()
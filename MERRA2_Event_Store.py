@@ -0,0 +1,203 @@
+import os
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+from zarr.codecs import BloscCodec, BloscShuffle
+
+import MERRA2_Subset_Client as subset
+from MERRA2_Event_Dataset import nc_folder, index_file, index_files, build_index
+
+# Single consolidated store holding every downloaded per-event subset
+store_path = "merra2_events.zarr"
+
+# Largest subset a store row holds; snapped boxes are 2-3 nodes per side (see MERRA2_Bounds.py)
+default_max_time = 24
+default_max_lat = 8
+default_max_lon = 8
+
+# Events per shard file: one file on disk per this many events instead of one per event
+default_shard_events = 512
+
+# Events written per append batch
+default_batch_size = 256
+
+# Lossless float32 compression: bit-shuffling groups the sign/exponent bits of the
+# smooth fields (each variable is contiguous in a row) so zstd finds long runs
+compressor = BloscCodec(cname="zstd", clevel=5, shuffle=BloscShuffle.bitshuffle, typesize=4)
+
+# Empty time slot of a row (reads back as NaT)
+time_fill = np.iinfo("int64").min
+
+# Consolidated metadata is not in the Zarr v3 spec yet; zarr-python reads it back fine
+warnings.filterwarnings("ignore", message="Consolidated metadata", category=UserWarning)
+
+
+class EventStore:
+    """
+    Append-only Zarr store of the per-event MERRA-2 subsets.
+
+    Row i of the store is one event. "values" is an event x variable x cell
+    float32 array whose chunk is exactly one row, so reading an event is one
+    chunk read from one shard file. Per-row index arrays hold the event id, the
+    subset shape and its time/lat/lon coordinates (NaN/NaT padded); they are
+    small and loaded once on open. attrs["events"] counts the committed rows and
+    is written after the data, so an interrupted append leaves no partial event.
+    """
+
+    def __init__(self, path=store_path, mode="r"):
+        self.path = path
+        if mode == "r":
+            self.group = zarr.open_consolidated(path, mode="r")
+        else:
+            self.group = zarr.open_group(path, mode=mode, use_consolidated=False)
+        self.variables = list(self.group.attrs["variables"])
+        self.shape = tuple(self.group.attrs["shape"])
+        self.load_index()
+
+    # Create an empty store
+    @classmethod
+    def create(cls, path=store_path, variables=tuple(subset.varNames), max_time=default_max_time,
+               max_lat=default_max_lat, max_lon=default_max_lon, shard_events=default_shard_events):
+        group = zarr.open_group(path, mode="w")
+        group.attrs.update({"variables": list(variables), "shape": [max_time, max_lat, max_lon], "events": 0})
+        cells = max_time * max_lat * max_lon
+
+        def rows(name, width, dtype, fill_value):
+            shape = (0,) if width is None else (0, width)
+            chunks = (4096,) if width is None else (4096, width)
+            group.create_array(name, shape=shape, chunks=chunks, dtype=dtype, fill_value=fill_value)
+
+        group.create_array("values", shape=(0, len(variables), cells), chunks=(1, len(variables), cells),
+                           shards=(shard_events, len(variables), cells), dtype="float32",
+                           fill_value=np.nan, compressors=compressor)
+        rows("event_id", None, "int64", -1)
+        rows("n_time", None, "int16", 0)
+        rows("n_lat", None, "int16", 0)
+        rows("n_lon", None, "int16", 0)
+        rows("time", max_time, "int64", time_fill)
+        rows("lat", max_lat, "float64", np.nan)
+        rows("lon", max_lon, "float64", np.nan)
+        zarr.consolidate_metadata(path)
+        return cls(path, mode="a")
+
+    # Open a store for appending, creating it when missing
+    @classmethod
+    def open_or_create(cls, path=store_path, **kwargs):
+        if os.path.exists(os.path.join(path, "zarr.json")):
+            return cls(path, mode="a")
+        return cls.create(path, **kwargs)
+
+    # Load the per-row index (event id -> row, shapes and coordinates)
+    def load_index(self):
+        n = int(self.group.attrs["events"])
+        self.event_ids = self.group["event_id"][:n]
+        self.rows = {int(event_id): row for row, event_id in enumerate(self.event_ids)}
+        self.sizes = np.stack([self.group[name][:n] for name in ("n_time", "n_lat", "n_lon")], axis=1)
+        self.times = self.group["time"][:n].view("datetime64[ns]")
+        self.lats = self.group["lat"][:n]
+        self.lons = self.group["lon"][:n]
+
+    def __len__(self):
+        return len(self.event_ids)
+
+    def __contains__(self, event_id):
+        return int(event_id) in self.rows
+
+    # Return one event's subset as an xarray Dataset, as the original .nc file had it
+    def read_event(self, event_id):
+        row = self.rows[int(event_id)]
+        n_time, n_lat, n_lon = (int(n) for n in self.sizes[row])
+        values = self.group["values"][row].reshape(len(self.variables), *self.shape)
+        coords = {"time": self.times[row, :n_time], "lat": self.lats[row, :n_lat], "lon": self.lons[row, :n_lon]}
+        data = {variable: (("time", "lat", "lon"), values[i, :n_time, :n_lat, :n_lon])
+                for i, variable in enumerate(self.variables)}
+        return xr.Dataset(data, coords=coords, attrs={"EVENT_ID": int(event_id)})
+
+    # Pack one subset file into a store row; returns (values, n_time, n_lat, n_lon, time, lat, lon)
+    def pack(self, path):
+        max_time, max_lat, max_lon = self.shape
+        with xr.open_dataset(path) as ds:
+            n_time, n_lat, n_lon = ds.sizes.get("time", 1), ds.sizes["lat"], ds.sizes["lon"]
+            if n_time > max_time or n_lat > max_lat or n_lon > max_lon:
+                raise ValueError(f"{n_time}x{n_lat}x{n_lon} subset exceeds the store's "
+                                 f"{max_time}x{max_lat}x{max_lon} rows")
+            values = np.full((len(self.variables), max_time, max_lat, max_lon), np.nan, dtype="float32")
+            for i, variable in enumerate(self.variables):
+                values[i, :n_time, :n_lat, :n_lon] = ds[variable].values.reshape(n_time, n_lat, n_lon)
+            time = np.full(max_time, time_fill, dtype="int64")
+            time[:n_time] = ds["time"].values.astype("datetime64[ns]").view("int64")
+            lat = np.full(max_lat, np.nan)
+            lat[:n_lat] = ds["lat"].values
+            lon = np.full(max_lon, np.nan)
+            lon[:n_lon] = ds["lon"].values
+        return values.reshape(len(self.variables), -1), n_time, n_lat, n_lon, time, lat, lon
+
+    # Write packed rows after the committed ones, then commit them by bumping attrs["events"]
+    def write_rows(self, event_ids, packed):
+        start = len(self)
+        stop = start + len(event_ids)
+        columns = list(zip(*packed))
+        arrays = {"values": np.stack(columns[0]), "n_time": np.array(columns[1]), "n_lat": np.array(columns[2]),
+                  "n_lon": np.array(columns[3]), "time": np.stack(columns[4]), "lat": np.stack(columns[5]),
+                  "lon": np.stack(columns[6]), "event_id": np.asarray(event_ids, dtype="int64")}
+        for name, data in arrays.items():
+            array = self.group[name]
+            if array.shape[0] < stop:
+                array.resize((stop,) + array.shape[1:])
+            array[start:stop] = data
+        self.group.attrs["events"] = stop
+        self.load_index()
+
+    # Append every indexed event that is not in the store yet
+    def append(self, index, batch_size=default_batch_size):
+        """
+        INPUTS:
+        index - output of MERRA2_Event_Dataset.build_index (event_id, path)
+        batch_size - events packed and written per batch
+
+        OUTPUT:
+        number of events appended (events already stored are skipped, so this can
+        run after every download round)
+        """
+        pending = index.drop_duplicates("event_id")
+        pending = pending[[event_id not in self for event_id in pending["event_id"]]]
+        appended = 0
+        for begin in range(0, len(pending), batch_size):
+            event_ids, packed = [], []
+            for event in pending.iloc[begin:begin + batch_size].itertuples():
+                try:
+                    packed.append(self.pack(event.path))
+                    event_ids.append(event.event_id)
+                except (OSError, KeyError, ValueError) as e:
+                    print(f"Skipping event {event.event_id} ({os.path.basename(event.path)}): {e}")
+            if event_ids:
+                self.write_rows(event_ids, packed)
+                appended += len(event_ids)
+        zarr.consolidate_metadata(self.path)
+        return appended
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append the per-event MERRA-2 subsets to one Zarr store.")
+    parser.add_argument("events_file", nargs="?",
+                        default="Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx")
+    parser.add_argument("--folder", default=nc_folder, help="Folder of MERRA2_*.SUB.<City>.nc files")
+    parser.add_argument("--store", default=store_path, help="Zarr store to append to")
+    parser.add_argument("--show", type=int, default=None, help="Print one stored event instead of appending")
+    args = parser.parse_args(argv)
+
+    if args.show is not None:
+        print(EventStore(args.store).read_event(args.show))
+        return
+
+    events = pd.read_excel(args.events_file) if args.events_file.endswith(".xlsx") else pd.read_csv(args.events_file)
+    store = EventStore.open_or_create(args.store)
+    appended = store.append(build_index(events, index_files(args.folder, index_file)))
+    print(f"Appended {appended} events to {args.store} ({len(store)} stored)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# On-disk ledger shared by the MERRA-2 subsetting scripts
+ledger_file = "merra2_jobs.sqlite"
+
+
+# Function to key a subset request by its parameters (box, time window, diurnal hours, variables, ...)
+def request_key(args):
+    canonical = json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Function to compute the sha256 of a downloaded file
+def file_checksum(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobLedger:
+    """
+    SQLite record of every subset request: its jobId, last known status, the
+    result URLs and the downloaded files with their size and sha256.
+
+    A restarted run looks each request up by request_key() and skips requests
+    whose files are all still on disk, re-attaches to jobs that were still
+    Accepted/Running, re-downloads finished jobs whose files are missing, and
+    resubmits only failed or never-submitted requests.
+    """
+
+    def __init__(self, path=ledger_file):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY,
+                name TEXT,
+                args TEXT NOT NULL,
+                job_id TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                key TEXT NOT NULL,
+                label TEXT NOT NULL,
+                link TEXT NOT NULL,
+                path TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                PRIMARY KEY (key, label)
+            );
+        """)
+
+    # Return the ledger entry of a request as a dict, or None if it was never submitted
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT name, args, job_id, status, error, updated FROM jobs WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        name, args, job_id, status, error, updated = row
+        return {"name": name, "args": json.loads(args), "job_id": job_id, "status": status,
+                "error": error, "updated": updated}
+
+    # Record the jobId and status of a request (a new submission or a status change)
+    def record_job(self, key, name, args, job_id, status, error=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO jobs (key, name, args, job_id, status, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, name, json.dumps(args, sort_keys=True, default=str), job_id, status, error, time.time()),
+            )
+            if status != "Succeeded":
+                # A resubmitted request gets new result URLs
+                self.db.execute("DELETE FROM files WHERE key = ?", (key,))
+            self.db.commit()
+
+    # Record the result URLs of a finished job
+    def record_results(self, key, items):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO files (key, label, link) VALUES (?, ?, ?)",
+                [(key, item["label"], item["link"]) for item in items],
+            )
+            self.db.commit()
+
+    # Record a downloaded file with its size and checksum (computed from the file when not given)
+    def record_file(self, key, label, path, sha256=None):
+        size, checksum = os.path.getsize(path), sha256 or file_checksum(path)
+        with self.lock:
+            self.db.execute(
+                "UPDATE files SET path = ?, size = ?, sha256 = ? WHERE key = ? AND label = ?",
+                (path, size, checksum, key, label),
+            )
+            self.db.commit()
+
+    # Mark a result file as not downloaded; its URL is kept so a later run fetches it again
+    def clear_file(self, key, label):
+        with self.lock:
+            self.db.execute(
+                "UPDATE files SET path = NULL, size = NULL, sha256 = NULL WHERE key = ? AND label = ?",
+                (key, label),
+            )
+            self.db.commit()
+
+    # Return [{label, link, path, size, sha256}] for a request
+    def files(self, key):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT label, link, path, size, sha256 FROM files WHERE key = ? ORDER BY label", (key,)
+            ).fetchall()
+        return [dict(zip(("label", "link", "path", "size", "sha256"), row)) for row in rows]
+
+    # Return the downloaded paths if every result file is on disk with its recorded size, else None
+    def completed_files(self, key, verify=False):
+        """
+        verify - also recompute each file's sha256 (slower; size is checked either way)
+        """
+        files = self.files(key)
+        if not files:
+            return None
+        for f in files:
+            if not f["path"] or not os.path.exists(f["path"]) or os.path.getsize(f["path"]) != f["size"]:
+                return None
+            if verify and file_checksum(f["path"]) != f["sha256"]:
+                return None
+        return [f["path"] for f in files]
+
+    # Return {status: count} over the whole ledger
+    def summary(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    # Usage: python MERRA2_Job_Ledger.py [merra2_jobs.sqlite]
+    ledger = JobLedger(sys.argv[1] if len(sys.argv) > 1 else ledger_file)
+    for status, count in sorted(ledger.summary().items()):
+        print(f"{status}: {count}")
@@ -0,0 +1,54 @@
+import logging
+import pandas as pd
+
+import MERRA2_Subset_Client as subset
+from MERRA2_Job_Ledger import request_key
+
+logger = logging.getLogger(__name__)
+
+
+class SubsetJob:
+    """One subset request and everything learned about it while it runs."""
+
+    def __init__(self, name, args, tag=None, members=None, directory=None):
+        self.name = name
+        self.args = args
+        self.tag = tag
+        # Events covered by a coalesced job, as [(tag, box)]; see MERRA2_Coalescing.py
+        self.members = members or []
+        # Download directory of this job when it differs from the one given to run_jobs
+        self.directory = directory
+        self.key = request_key(args)
+        self.job_id = None
+        self.status = "Pending"
+        self.percent = 0
+        self.files = []
+        self.error = None
+        self.status_errors = 0
+        self.next_poll = 0
+
+
+# Function to pick the file tag of a table row: the city (like Run_Subsetting_MERRA2.py), else rowN
+def row_tag(row, index, location_column="Extracted_Location - 9-29-2024"):
+    # Tagging keeps same-day events from overwriting each other's files
+    if location_column in row.index and pd.notnull(row[location_column]):
+        tag = str(row[location_column]).split(",")[0].strip()
+        if tag:
+            return tag
+    return f"row{index + 1}"
+
+
+# Function to build one job per row of the "..._with_bounds_and_date_time.xlsx" table
+def jobs_from_table(df, location_column="Extracted_Location - 9-29-2024"):
+    jobs = []
+    for index, row in df.iterrows():
+        try:
+            args = subset.build_subset_args(
+                row["minlon"], row["maxlon"], row["minlat"], row["maxlat"],
+                row["begTime"], row["endTime"], row["begHour"], row["begHour"],
+            )
+        except ValueError as e:
+            logger.error(f"Row {index + 1} - Invalid request, skipping: {e}")
+            continue
+        jobs.append(SubsetJob(f"Row {index + 1}", args, row_tag(row, index, location_column)))
+    return jobs
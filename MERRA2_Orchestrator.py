@@ -0,0 +1,250 @@
+import os
+import time
+import logging
+import argparse
+import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import MERRA2_Subset_Client as subset
+import MERRA2_Coalescing as coalescing
+import MERRA2_Tile_Cache as tiles
+# SubsetJob and row_tag stay importable from here for scripts that build jobs by hand
+from MERRA2_Jobs import SubsetJob, row_tag, jobs_from_table
+from MERRA2_Job_Ledger import JobLedger, ledger_file
+from MERRA2_Polling import PollSchedule, default_min_delay, default_max_delay
+
+logger = logging.getLogger(__name__)
+
+# Jobs kept running on the service at once, and parallel result downloads
+default_max_active = 4
+default_download_workers = 4
+
+# Polls in a row whose GetStatus fails (each after the client's retries) before a job is given up
+max_status_errors = 3
+
+
+# Function to save a job's jobId and status in the ledger (if any)
+def record_job(ledger, job):
+    if ledger is not None:
+        ledger.record_job(job.key, job.name, job.args, job.job_id, job.status, job.error)
+
+
+# Function to fetch the result list of a finished job and download its data files; raises the first download error
+def fetch_job(client, job, directory=".", ledger=None):
+    directory = job.directory or directory
+    os.makedirs(directory, exist_ok=True)
+    # Downloads start while later result pages are still being fetched
+    downloads, _ = client.start_downloads(job.job_id, directory, job.tag)
+    if ledger is not None:
+        ledger.record_results(job.key, [item for item, _ in downloads])
+    files, error = [], None
+    for item, future in downloads:
+        try:
+            record = future.result()
+        except Exception as e:
+            error = error or e
+            if ledger is not None:
+                ledger.clear_file(job.key, item["label"])
+            continue
+        files.append(record["path"])
+        if ledger is not None:
+            ledger.record_file(job.key, item["label"], record["path"], record["sha256"])
+        logger.info(f"{job.name} - Downloaded: {record['path']} ({record['mb_per_s']:.2f} MB/s)")
+    if error is not None:
+        raise error
+    return files
+
+
+# Function to sort jobs by what the ledger knows about them: (to submit, still running, to download)
+def resume_jobs(jobs, ledger):
+    pending, active, finished = deque(), [], []
+    for job in jobs:
+        entry = ledger.get(job.key) if ledger is not None else None
+        if entry is None or entry["status"] not in ("Accepted", "Running", "Succeeded"):
+            pending.append(job)
+            continue
+        job.job_id, job.status = entry["job_id"], entry["status"]
+        if job.status != "Succeeded":
+            logger.info(f"{job.name} - Re-attaching to job {job.job_id}")
+            active.append(job)
+            continue
+        files = ledger.completed_files(job.key)
+        if files:
+            job.files = files
+            logger.info(f"{job.name} - Already downloaded, skipping")
+        else:
+            finished.append(job)
+    return pending, active, finished
+
+
+# Function to run many subset jobs with at most max_active of them on the service at a time
+def run_jobs(jobs, client, max_active=default_max_active, schedule=None,
+             download_workers=default_download_workers, directory=".", ledger=None):
+    """
+    One scheduler loop submits jobs until max_active are running, polls every
+    active job that is due in the same tick, and hands finished jobs to a
+    download pool so new jobs are submitted while earlier results are still
+    downloading. When each job is due comes from the PollSchedule (progress,
+    past job durations, backoff); request pacing comes from the client's
+    RateBudget rather than fixed sleeps.
+
+    With a JobLedger, completed requests are skipped, jobs left running by an
+    earlier run are polled by their jobId instead of being resubmitted, jobs
+    whose downloads failed are downloaded again from their recorded results,
+    and only failed requests are submitted again.
+
+    Returns the jobs with their final status, job_id and downloaded files.
+    """
+    schedule = schedule or PollSchedule()
+
+    # Identical requests (same canonical args) run once; the others reuse the files
+    unique = {}
+    for job in jobs:
+        unique.setdefault(job.key, job)
+    duplicates = [job for job in jobs if unique[job.key] is not job]
+
+    pending, active, finished = resume_jobs(unique.values(), ledger)
+    for job in active:
+        schedule.start(job.job_id, record=False)
+    downloads = {}
+
+    with ThreadPoolExecutor(max_workers=download_workers) as pool:
+        for job in finished:
+            downloads[pool.submit(fetch_job, client, job, directory, ledger)] = job
+
+        while pending or active or downloads:
+            # Top up the service with new jobs
+            while pending and len(active) < max_active:
+                job = pending.popleft()
+                try:
+                    result = client.submit(job.args)
+                except subset.SubsetServiceError as e:
+                    job.status, job.error = "Failed", str(e)
+                    logger.error(f"{job.name} - Submit failed: {e}")
+                    record_job(ledger, job)
+                    continue
+                job.job_id, job.status = result["jobId"], result["Status"]
+                record_job(ledger, job)
+                logger.info(f"{job.name} - Job ID: {job.job_id} ({job.status})")
+                schedule.start(job.job_id)
+                job.next_poll = time.monotonic() + schedule.next_delay(job.job_id)
+                active.append(job)
+
+            # Poll every job that is due in one pass
+            now = time.monotonic()
+            for job in [job for job in active if job.next_poll <= now]:
+                try:
+                    result = client.status(job.job_id)
+                except subset.SubsetServiceError as e:
+                    logger.warning(f"{job.name} - Error getting status: {e}")
+                    job.status_errors += 1
+                    job.next_poll = time.monotonic() + schedule.next_delay(job.job_id, job.percent)
+                    if job.status_errors >= max_status_errors:
+                        # e.g. a jobId from an earlier run that the service has forgotten
+                        active.remove(job)
+                        schedule.finished(job.job_id, succeeded=False)
+                        job.status, job.error = "Failed", str(e)
+                        record_job(ledger, job)
+                    continue
+                job.status_errors = 0
+                job.status, job.percent = result["Status"], result.get("PercentCompleted", 0)
+                if job.status in ("Accepted", "Running"):
+                    job.next_poll = time.monotonic() + schedule.next_delay(job.job_id, job.percent)
+                    continue
+                active.remove(job)
+                schedule.finished(job.job_id, job.status == "Succeeded")
+                if job.status == "Succeeded":
+                    logger.info(f"{job.name} - Job Finished")
+                    downloads[pool.submit(fetch_job, client, job, directory, ledger)] = job
+                else:
+                    job.error = result.get("message", job.status)
+                    logger.error(f"{job.name} - Job {job.status}: {job.error}")
+                record_job(ledger, job)
+
+            # Sleep until the next job is due, waking early when a download finishes
+            timeout = max(0, min(job.next_poll for job in active) - time.monotonic()) if active else None
+            if downloads:
+                done, _ = wait(list(downloads), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = downloads.pop(future)
+                    try:
+                        job.files = future.result()
+                    except Exception as e:
+                        # The job itself succeeded: it keeps its result URLs and a rerun only downloads again
+                        job.files, job.error = [], f"download failed: {e}"
+                        logger.error(f"{job.name} - Error downloading: {e}")
+                        record_job(ledger, job)
+            elif active:
+                time.sleep(timeout)
+
+    for job in duplicates:
+        original = unique[job.key]
+        job.job_id, job.status, job.error = original.job_id, original.status, original.error
+        if original.files:
+            job.files = subset.reuse_files(original.files, job.directory or directory, job.tag)
+            logger.info(f"{job.name} - Same request as {original.name}, reused its files")
+    return list(jobs)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Run MERRA-2 subset jobs concurrently.")
+    parser.add_argument("input_file", nargs="?",
+                        default="Arizona_1996-2023_Final-12_19_2024_with_bounds_and_date_time.xlsx")
+    parser.add_argument("--max-active", type=int, default=default_max_active, help="Jobs running at once")
+    parser.add_argument("--download-workers", type=int, default=default_download_workers)
+    parser.add_argument("--min-poll", type=float, default=default_min_delay, help="Shortest wait between status polls")
+    parser.add_argument("--max-poll", type=float, default=default_max_delay, help="Longest wait between status polls")
+    parser.add_argument("--rate", type=float, default=1.0, help="Requests per second to the service")
+    parser.add_argument("--url", default=subset.subset_url, help="JSON-WSP endpoint")
+    parser.add_argument("--ledger", default=None,
+                        help=f"Job ledger file (default {ledger_file}; '' to disable resuming; not with --tiles)")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Merge same-day, same-hour rows into union-box jobs and split the results locally")
+    parser.add_argument("--max-inflation", type=float, default=2.0,
+                        help="Largest union-box area relative to the merged boxes (with --coalesce)")
+    parser.add_argument("--tiles", default=None,
+                        help="Tile cache directory: fetch each date's regional tile once and cut the boxes locally")
+    parser.add_argument("--mirror", default=None, help="Folder of locally mirrored granules (with --tiles)")
+    parser.add_argument("--region", type=float, nargs=4, default=tiles.arizona_region,
+                        metavar=("MINLON", "MINLAT", "MAXLON", "MAXLAT"),
+                        help="Native-grid region of the cached tiles (with --tiles)")
+    args = parser.parse_args(argv)
+    # Locally cut jobs never reach the service, so there is nothing to coalesce or to record in the ledger
+    if args.tiles and args.coalesce:
+        parser.error("--coalesce cannot be combined with --tiles")
+    if args.tiles and args.ledger:
+        parser.error("--ledger cannot be combined with --tiles")
+
+    df = pd.read_excel(args.input_file)
+    client = subset.SubsetClient(args.url, budget=subset.RateBudget(args.rate))
+    ledger_path = args.ledger if args.ledger is not None else ledger_file
+    ledger = JobLedger(ledger_path) if ledger_path and not args.tiles else None
+    schedule = PollSchedule(args.min_poll, args.max_poll)
+
+    if args.tiles:
+        cache = tiles.TileCache(args.tiles, args.region, mirror=args.mirror, downloader=client.downloader)
+        try:
+            jobs = tiles.cut_jobs(jobs_from_table(df), cache)
+        finally:
+            cache.close()
+    elif not args.coalesce:
+        jobs = run_jobs(jobs_from_table(df), client, args.max_active, schedule, args.download_workers,
+                        ledger=ledger)
+    else:
+        jobs = run_jobs(coalescing.plan_jobs(df, args.max_inflation), client, args.max_active,
+                        schedule, args.download_workers, ledger=ledger)
+        for job in jobs:
+            if job.members and job.files:
+                coalescing.split_job(job)
+
+    succeeded = sum(1 for job in jobs if job.status == "Succeeded" and job.files)
+    print(f"All requests completed: {succeeded}/{len(jobs)} jobs downloaded.")
+    metrics = client.downloader.summary()
+    print(f"Downloaded {metrics['files']} files, {metrics['bytes'] / 1e6:.1f} MB at {metrics['mb_per_s']:.2f} MB/s "
+          f"({metrics['resumed']} resumed).")
+
+
+if __name__ == "__main__":
+    main()
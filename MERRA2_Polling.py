@@ -0,0 +1,71 @@
+import time
+import random
+import statistics
+from collections import deque
+
+# Bounds on the wait between two GetStatus calls for one job
+default_min_delay = 2
+default_max_delay = 60
+
+# Growth of the wait while a job shows no progress, and the random spread added to every wait
+default_backoff = 1.5
+default_jitter = 0.2
+
+# Finished-job durations kept to estimate how long new jobs take
+default_history = 50
+
+
+class PollSchedule:
+    """
+    Decides when each subset job is next worth a GetStatus call.
+
+    While PercentCompleted moves, the wait is the time the job needs to finish
+    at its observed rate. Without progress, the wait is the typical duration of
+    the jobs finished so far minus the time already spent, and once that is
+    used up the wait grows exponentially. Every wait is kept within
+    [min_delay, max_delay] and spread by +/- jitter so jobs submitted together
+    are not polled in lockstep.
+    """
+
+    def __init__(self, min_delay=default_min_delay, max_delay=default_max_delay, backoff=default_backoff,
+                 jitter=default_jitter, history=default_history):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.durations = deque(maxlen=history)
+        self.jobs = {}
+
+    # Start tracking a job; record=False for jobs re-attached from an earlier run (their start time is unknown)
+    def start(self, job_id, record=True):
+        self.jobs[job_id] = {"started": time.monotonic(), "percent": 0, "delay": self.min_delay, "record": record}
+
+    # Return the seconds to wait before polling the job again, given its latest PercentCompleted
+    def next_delay(self, job_id, percent=0):
+        if job_id not in self.jobs:
+            self.start(job_id, record=False)
+        job = self.jobs[job_id]
+        elapsed = time.monotonic() - job["started"]
+        percent = percent or 0
+
+        if 0 < percent < 100 and percent > job["percent"]:
+            # Progress reported: wait for the projected finish
+            delay = elapsed * (100 - percent) / percent
+            job["delay"] = self.min_delay
+        elif self.durations and statistics.median(self.durations) - elapsed > self.min_delay:
+            # No progress yet: wait until jobs like this one usually finish
+            delay = statistics.median(self.durations) - elapsed
+        else:
+            # Past the estimate (or nothing to estimate from): back off
+            delay = job["delay"]
+            job["delay"] = min(job["delay"] * self.backoff, self.max_delay)
+        job["percent"] = max(job["percent"], percent)
+
+        delay = min(max(delay, self.min_delay), self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    # Stop tracking a job; durations of succeeded jobs feed later estimates
+    def finished(self, job_id, succeeded=True):
+        job = self.jobs.pop(job_id, None)
+        if job is not None and job["record"] and succeeded:
+            self.durations.append(time.monotonic() - job["started"])
@@ -0,0 +1,208 @@
+import os
+import hashlib
+import argparse
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import xarray as xr
+import scipy.sparse as sparse
+from collections import OrderedDict
+
+import MERRA2_Subset_Client as subset
+
+# Weight matrices kept in memory; one per (source grid, target nodes) pair
+default_cached_weights = 256
+
+# Tolerance for a target node lying exactly on the edge of the source grid
+edge_tolerance = 1e-6
+
+# Largest difference to a service-made subset, relative to the variable's magnitude there
+default_rtol = 1e-3
+
+
+# Function to locate target coordinates between source coordinates along one axis
+def axis_weights(source, target):
+    """
+    OUTPUT:
+    (lower, upper, fraction, outside): indexes of the source points on either
+    side of each target point, the weight of the upper one, and a mask of the
+    target points outside the source axis (left undefined, as remapbil does)
+    """
+    source = np.asarray(source, dtype="float64")
+    target = np.asarray(target, dtype="float64")
+    order = np.argsort(source)
+    ordered = source[order]
+    outside = (target < ordered[0] - edge_tolerance) | (target > ordered[-1] + edge_tolerance)
+    if len(ordered) == 1:
+        zeros = np.zeros(len(target), dtype=int)
+        outside |= np.abs(target - ordered[0]) > edge_tolerance
+        return order[zeros], order[zeros], np.zeros(len(target)), outside
+
+    position = np.clip(np.searchsorted(ordered, target, side="right") - 1, 0, len(ordered) - 2)
+    fraction = np.clip((target - ordered[position]) / (ordered[position + 1] - ordered[position]), 0, 1)
+    return order[position], order[position + 1], fraction, outside
+
+
+class BilinearWeights:
+    """
+    Bilinear interpolation from one lat/lon grid to a set of target nodes as a
+    sparse (target nodes x source nodes) matrix with at most four weights per
+    row. apply() interpolates any stack of fields on the source grid (every
+    variable and time step at once) with one sparse matrix product. Target
+    nodes outside the source grid, and nodes with a missing neighbour, come out
+    as NaN.
+    """
+
+    def __init__(self, source_lat, source_lon, target_lat, target_lon):
+        self.source_shape = (len(source_lat), len(source_lon))
+        self.target_shape = (len(target_lat), len(target_lon))
+        lat0, lat1, fy, lat_outside = axis_weights(source_lat, target_lat)
+        lon0, lon1, fx, lon_outside = axis_weights(source_lon, target_lon)
+
+        # Every target node (a, b) takes its four surrounding source nodes
+        rows = np.arange(np.prod(self.target_shape)).reshape(self.target_shape)
+        n_lon = self.source_shape[1]
+        corners = [
+            (lat0[:, None] * n_lon + lon0[None, :], (1 - fy)[:, None] * (1 - fx)[None, :]),
+            (lat0[:, None] * n_lon + lon1[None, :], (1 - fy)[:, None] * fx[None, :]),
+            (lat1[:, None] * n_lon + lon0[None, :], fy[:, None] * (1 - fx)[None, :]),
+            (lat1[:, None] * n_lon + lon1[None, :], fy[:, None] * fx[None, :]),
+        ]
+        matrix = sparse.csr_matrix(
+            (np.concatenate([w.ravel() for _, w in corners]),
+             (np.tile(rows.ravel(), 4), np.concatenate([c.ravel() for c, _ in corners]))),
+            shape=(rows.size, np.prod(self.source_shape)),
+        )
+        # Zero weights must not pull a missing neighbour into the result
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self.outside = (lat_outside[:, None] | lon_outside[None, :]).ravel()
+
+    # Interpolate values of shape (..., lat, lon) on the source grid; returns (..., target lat, target lon)
+    def apply(self, values):
+        values = np.asarray(values)
+        leading = values.shape[:-2]
+        flat = values.reshape(-1, self.matrix.shape[1]).astype("float64")
+        result = (self.matrix @ flat.T).T
+        result[:, self.outside] = np.nan
+        return result.reshape(leading + self.target_shape)
+
+
+# Weight matrices by grid fingerprint, most recently used last
+weights_cache = OrderedDict()
+weights_lock = threading.Lock()
+
+
+# Function to fingerprint a source grid and target nodes
+def grid_key(*axes):
+    digest = hashlib.sha1()
+    for axis in axes:
+        values = np.ascontiguousarray(axis, dtype="float64")
+        digest.update(len(values).to_bytes(4, "little"))
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+# Function to return the cached weights of a (source grid, target nodes) pair, computing them once
+def get_weights(source_lat, source_lon, target_lat, target_lon, cached=default_cached_weights):
+    key = grid_key(source_lat, source_lon, target_lat, target_lon)
+    with weights_lock:
+        if key in weights_cache:
+            weights_cache.move_to_end(key)
+            return weights_cache[key]
+    weights = BilinearWeights(source_lat, source_lon, target_lat, target_lon)
+    with weights_lock:
+        weights_cache[key] = weights
+        while len(weights_cache) > cached:
+            weights_cache.popitem(last=False)
+    return weights
+
+
+# Function to regrid the (time, lat, lon) variables of a Dataset onto target nodes in one batched product
+def regrid_dataset(ds, lat, lon, variables=None):
+    """
+    INPUTS:
+    ds - Dataset on a regular lat/lon grid (e.g. a native MERRA-2 tile)
+    lat, lon - target node coordinates (e.g. the cfsr0.5a nodes inside a box)
+    variables - variables to regrid (default: every variable with lat and lon dimensions)
+
+    OUTPUT:
+    Dataset with the same variables, attributes and other coordinates on the target nodes
+    """
+    if variables is None:
+        variables = [v for v in ds.data_vars if {"lat", "lon"} <= set(ds[v].dims)]
+    weights = get_weights(ds["lat"].values, ds["lon"].values, lat, lon)
+    fields = [ds[v].transpose(..., "lat", "lon") for v in variables]
+    if len({field.shape for field in fields}) == 1:
+        regridded = weights.apply(np.stack([field.values for field in fields]))
+    else:
+        regridded = [weights.apply(field.values) for field in fields]
+
+    # Plain (dims, values, attrs) tuples: building a DataArray per variable costs more than the product
+    data = {variable: (field.dims, regridded[i].astype(field.dtype), field.attrs)
+            for i, (variable, field) in enumerate(zip(variables, fields))}
+    coords = {d: ds[d].values for field in fields for d in field.dims[:-2] if d in ds.coords}
+    coords.update({"lat": np.asarray(lat), "lon": np.asarray(lon)})
+    return xr.Dataset(data, coords=coords, attrs=ds.attrs)
+
+
+# Function to compare a locally cut subset with one made by the service
+def compare_subsets(local_path, service_path, variables=tuple(subset.varNames), rtol=default_rtol):
+    """
+    Both files are compared on the time steps and grid nodes they share.
+
+    OUTPUT:
+    DataFrame with one row per variable: max_abs_diff, max_rel_diff (relative to
+    the largest magnitude of the service values) and within (max_rel_diff <= rtol)
+    """
+    rows = []
+    with xr.open_dataset(local_path) as local, xr.open_dataset(service_path) as service:
+        local, service = xr.align(local, service, join="inner")
+        for variable in variables:
+            a = local[variable].values.astype("float64")
+            b = service[variable].values.astype("float64")
+            diff = float(np.nanmax(np.abs(a - b))) if a.size else np.nan
+            scale = float(np.nanmax(np.abs(b))) if b.size else np.nan
+            rel = diff / scale if scale else diff
+            rows.append({"variable": variable, "max_abs_diff": diff, "max_rel_diff": rel, "within": rel <= rtol})
+    return pd.DataFrame(rows)
+
+
+# Function to regrid a native file onto a service-made subset's nodes and compare the two
+def validate_against_service(source_path, service_path, variables=tuple(subset.varNames), rtol=default_rtol):
+    """
+    INPUTS:
+    source_path - native-grid file covering the subset (a tile or a whole granule)
+    service_path - the subset service's remapbil output for the same day
+
+    OUTPUT:
+    comparison table of compare_subsets
+    """
+    with xr.open_dataset(service_path) as service:
+        lat, lon, times = service["lat"].values, service["lon"].values, service["time"].values
+    with xr.open_dataset(source_path) as source:
+        local = regrid_dataset(source[list(variables)].sel(time=times).load(), lat, lon)
+    handle, local_path = tempfile.mkstemp(suffix=".nc")
+    os.close(handle)
+    try:
+        local.to_netcdf(local_path)
+        return compare_subsets(local_path, service_path, variables, rtol)
+    finally:
+        os.remove(local_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check local bilinear regridding against a subset service file.")
+    parser.add_argument("source_file", help="Native-grid MERRA-2 file (tile or granule)")
+    parser.add_argument("service_file", help="Subset downloaded with mapping remapbil")
+    parser.add_argument("--rtol", type=float, default=default_rtol)
+    args = parser.parse_args(argv)
+
+    report = validate_against_service(args.source_file, args.service_file, rtol=args.rtol)
+    print(report.to_string(index=False))
+    print("Match" if report["within"].all() else "MISMATCH")
+
+
+if __name__ == "__main__":
+    main()
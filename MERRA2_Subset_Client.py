@@ -0,0 +1,353 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+import urllib3
+import certifi
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from MERRA2_Downloader import Downloader
+from MERRA2_Polling import PollSchedule
+from MERRA2_Job_Ledger import request_key
+
+# GES DISC subset service endpoint
+subset_url = "https://disc.gsfc.nasa.gov/service/subset/jsonwsp"
+
+# Defaults shared by the MERRA-2 subsetting scripts
+# SPEED = surface wind speed
+# SPEEDMAX = surface wind speed
+# TLML = surface air temperature
+# QLML = surface specific humidity
+# QSH = effective surface specific humidity
+# HLML = surface layer height
+product = "M2T1NXFLX_V5.12.4"
+varNames = ["SPEED", "SPEEDMAX", "TLML", "QLML", "QSH", "HLML"]
+interp = "remapbil"
+destGrid = "cfsr0.5a"
+
+# Downloaded granule labels look like MERRA2_400.tavg1_2d_flx_Nx.20230901.SUB.nc
+label_pattern = re.compile(r"^(MERRA2_\d+)\..*?(\d{8})")
+
+# Diurnal hours are given as HH:MM
+hour_pattern = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+
+# The service's diurnalAggregation codes and the reduction over the selected hours each one stands for
+diurnal_aggregations = {"none": None, "1": "mean", "2": "min", "3": "max"}
+
+
+class SubsetServiceError(Exception):
+    """Raised when the subset service keeps failing or returns a jsonwsp/fault."""
+
+
+class RateBudget:
+    """
+    Thread-safe token bucket shared by every request to the service: at most
+    `rate` requests per second on average, with bursts of up to `capacity`.
+    It replaces the fixed sleeps between requests.
+    """
+
+    def __init__(self, rate=1.0, capacity=5):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Function to turn a time value (ISO string, date string or Timestamp) into the string sent to the service
+def time_text(value):
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return str(value).strip()
+
+
+# Function to turn a diurnal hour value ("20:30", "20:30:00" or a time) into HH:MM
+def hour_text(value):
+    if hasattr(value, "strftime"):
+        return value.strftime("%H:%M")
+    text = str(value).strip()
+    return text[:5] if len(text) == 8 and text[5] == ":" else text
+
+
+class SubsetRequest:
+    """
+    One validated subset request: product, variables, box, time window,
+    diurnal hours, mapping and grid. to_args() gives the JSON-WSP 'args' every
+    script sends and key() its canonical hash, which the job ledger uses to
+    answer a repeated request with the files already downloaded.
+
+    Raises ValueError for a bad box, time window, diurnal hour or aggregation,
+    or variable list.
+    """
+
+    def __init__(self, box, start, end, diurnal_from=None, diurnal_to=None, diurnal_aggregation="none",
+                 product=product, variables=varNames, mapping=interp, grid=destGrid, crop=True):
+        self.box = [float(v) for v in box]
+        self.start = time_text(start)
+        self.end = time_text(end)
+        self.diurnal_from = hour_text(diurnal_from) if diurnal_from is not None else None
+        self.diurnal_to = hour_text(diurnal_to) if diurnal_to is not None else self.diurnal_from
+        self.diurnal_aggregation = str(diurnal_aggregation)
+        self.product = product
+        self.variables = list(variables)
+        self.mapping = mapping
+        self.grid = grid
+        self.crop = crop
+        self.validate()
+
+    def validate(self):
+        minlon, minlat, maxlon, maxlat = self.box
+        if any(v != v for v in self.box):
+            raise ValueError(f"box has missing values: {self.box}")
+        if not (-180 <= minlon <= maxlon <= 180):
+            raise ValueError(f"box longitudes must satisfy -180 <= minlon <= maxlon <= 180: {self.box}")
+        if not (-90 <= minlat <= maxlat <= 90):
+            raise ValueError(f"box latitudes must satisfy -90 <= minlat <= maxlat <= 90: {self.box}")
+        try:
+            start = datetime.fromisoformat(self.start.replace("Z", "+00:00"))
+            end = datetime.fromisoformat(self.end.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"start/end must be ISO dates or times: {self.start!r}, {self.end!r}") from None
+        if start.replace(tzinfo=None) > end.replace(tzinfo=None):
+            raise ValueError(f"start {self.start} is after end {self.end}")
+        for hour in (self.diurnal_from, self.diurnal_to):
+            if hour is not None and not hour_pattern.match(hour):
+                raise ValueError(f"diurnal hour must be HH:MM: {hour!r}")
+        if self.diurnal_aggregation not in diurnal_aggregations:
+            raise ValueError(f"diurnal aggregation must be one of {sorted(diurnal_aggregations)}: "
+                             f"{self.diurnal_aggregation!r}")
+        if not self.variables or len(set(self.variables)) != len(self.variables):
+            raise ValueError(f"variables must be a non-empty list without duplicates: {self.variables}")
+        if not (self.product and self.mapping and self.grid):
+            raise ValueError("product, mapping and grid are required")
+
+    def to_args(self):
+        args = {
+            "role": "subset",
+            "start": self.start,
+            "end": self.end,
+        }
+        if self.diurnal_from is not None:
+            args["diurnalFrom"] = self.diurnal_from
+            args["diurnalTo"] = self.diurnal_to
+            args["diurnalAggregation"] = self.diurnal_aggregation
+        args.update({
+            "box": self.box,
+            "crop": self.crop,
+            "mapping": self.mapping,
+            "grid": self.grid,
+            "data": [{"datasetId": self.product, "variable": var} for var in self.variables],
+        })
+        return args
+
+    def key(self):
+        return request_key(self.to_args())
+
+    # Rebuild the request from its JSON-WSP 'args' (e.g. a SubsetJob's)
+    @classmethod
+    def from_args(cls, args):
+        return cls(args["box"], args["start"], args["end"], args.get("diurnalFrom"), args.get("diurnalTo"),
+                   args.get("diurnalAggregation", "none"), product=args["data"][0]["datasetId"],
+                   variables=[item["variable"] for item in args["data"]], mapping=args["mapping"],
+                   grid=args["grid"], crop=args.get("crop", True))
+
+
+# Function to build the 'args' of a subset request (validated by SubsetRequest)
+def build_subset_args(minlon, maxlon, minlat, maxlat, begTime, endTime, begHour=None, endHour=None,
+                      product=product, variables=varNames, mapping=interp, grid=destGrid):
+    return SubsetRequest([minlon, minlat, maxlon, maxlat], begTime, endTime, begHour, endHour,
+                         product=product, variables=variables, mapping=mapping, grid=grid).to_args()
+
+
+# Function to rename a downloaded label the way Run_Subsetting_MERRA2.py does: MERRA2_400.20230901.SUB.<tag>.nc
+def tagged_file_name(label, tag):
+    match = label_pattern.match(label)
+    if not match:
+        return f"{os.path.splitext(label)[0]}.{tag}.nc"
+    return f"{match.group(1)}.{match.group(2)}.SUB.{tag}.nc"
+
+
+class SubsetClient:
+    """
+    Client for the GES DISC JSON-WSP subset service. One urllib3 PoolManager
+    (and so one set of kept-alive TLS connections) is shared by every call, and
+    result files go through one streaming Downloader.
+    """
+
+    def __init__(self, url=subset_url, http=None, retries=3, retry_wait=5, budget=None, downloader=None):
+        self.url = url
+        self.http = http or urllib3.PoolManager(cert_reqs="CERT_REQUIRED", ca_certs=certifi.where(), maxsize=8)
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.budget = budget
+        self.downloader = downloader or Downloader()
+
+    # POST one JSON-WSP request, retrying HTTP, JSON and fault errors; raises SubsetServiceError
+    def call(self, methodname, args):
+        request = {"methodname": methodname, "type": "jsonwsp/request", "version": "1.0", "args": args}
+        hdrs = {"Content-Type": "application/json", "Accept": "application/json"}
+        data = json.dumps(request)
+        error = None
+
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(self.retry_wait)
+            if self.budget is not None:
+                self.budget.acquire()
+            try:
+                r = self.http.request("POST", self.url, body=data, headers=hdrs)
+                if r.status != 200:
+                    error = f"HTTP {r.status}"
+                    continue
+                response = json.loads(r.data)
+                if response.get("type") == "jsonwsp/fault":
+                    error = f"faulty {response.get('methodname', methodname)} request: {response.get('fault')}"
+                    continue
+                return response["result"]
+            except (json.decoder.JSONDecodeError, KeyError, urllib3.exceptions.HTTPError) as e:
+                error = str(e)
+            print(f"Error: {methodname} attempt {attempt + 1}/{self.retries} failed ({error})")
+
+        raise SubsetServiceError(f"{methodname} failed after {self.retries} attempts: {error}")
+
+    # Submit a subset job; returns the result dict (jobId, Status, ...)
+    def submit(self, subset_args):
+        return self.call("subset", subset_args)
+
+    # Return the current status of a job (Status, PercentCompleted, ...)
+    def status(self, job_id):
+        return self.call("GetStatus", {"jobId": job_id})
+
+    # Yield the result items of a finished job lazily, fetching the next page while the caller uses this one
+    def iter_results(self, job_id, batchsize=20):
+        with ThreadPoolExecutor(max_workers=1) as pager:
+            start = 0
+            page = pager.submit(self.call, "GetResult", {"jobId": job_id, "count": batchsize, "startIndex": start})
+            while page is not None:
+                result = page.result()
+                start += result["itemsPerPage"]
+                page = None
+                if result["itemsPerPage"] and start < result["totalResults"]:
+                    page = pager.submit(self.call, "GetResult",
+                                        {"jobId": job_id, "count": batchsize, "startIndex": start})
+                yield from result["items"]
+
+    # Return every result item of a finished job
+    def results(self, job_id, batchsize=20):
+        return list(self.iter_results(job_id, batchsize))
+
+    # Poll a job until it leaves Accepted/Running; returns the final status dict
+    def wait(self, job_id, schedule=None):
+        schedule = schedule or PollSchedule()
+        schedule.start(job_id)
+        percent = 0
+        while True:
+            time.sleep(schedule.next_delay(job_id, percent))
+            result = self.status(job_id)
+            percent = result.get("PercentCompleted", 0)
+            print(f"Job status: {result['Status']} ({percent}% complete)")
+            if result["Status"] not in ("Accepted", "Running"):
+                schedule.finished(job_id, result["Status"] == "Succeeded")
+                return result
+
+    # Queue the download of every data item as its result page arrives; returns ([(item, future)], doc items)
+    def start_downloads(self, job_id, directory=".", tag=None):
+        downloads, docs = [], []
+        for item in self.iter_results(job_id):
+            if is_data_item(item):
+                downloads.append((item, self.downloader.submit(item["link"], item_path(item, directory, tag))))
+            else:
+                docs.append(item)
+        return downloads, docs
+
+    # Download every data file of a finished job in parallel; returns the written paths
+    def fetch(self, job_id, directory=".", tag=None):
+        downloads, _ = self.start_downloads(job_id, directory, tag)
+        return [future.result()["path"] for _, future in downloads]
+
+    # Submit one subset request, wait for it and download its files; returns the written paths
+    def run(self, subset_args, directory=".", tag=None, schedule=None, ledger=None):
+        """
+        ledger - optional JobLedger; a request already downloaded is answered from
+                 its files without contacting the service, and new ones are recorded
+        """
+        key = request_key(subset_args)
+        if ledger is not None:
+            files = ledger.completed_files(key)
+            if files:
+                print("Request already downloaded, reusing its files")
+                return reuse_files(files, directory, tag)
+
+        job_id = self.submit(subset_args)["jobId"]
+        print(f"Job ID: {job_id}")
+        if ledger is not None:
+            ledger.record_job(key, tag, subset_args, job_id, "Accepted")
+        result = self.wait(job_id, schedule)
+        if result["Status"] != "Succeeded":
+            if ledger is not None:
+                ledger.record_job(key, tag, subset_args, job_id, result["Status"], result.get("message"))
+            raise SubsetServiceError(f"job {job_id} {result['Status']}: {result.get('message')}")
+        if ledger is None:
+            return self.fetch(job_id, directory, tag)
+
+        ledger.record_job(key, tag, subset_args, job_id, "Succeeded")
+        downloads, _ = self.start_downloads(job_id, directory, tag)
+        ledger.record_results(key, [item for item, _ in downloads])
+        files = []
+        for item, future in downloads:
+            record = future.result()
+            ledger.record_file(key, item["label"], record["path"], record["sha256"])
+            files.append(record["path"])
+        return files
+
+    # Download one result item into directory; returns the written path
+    def download(self, item, directory=".", file_name=None):
+        path = os.path.join(directory, file_name or item["label"])
+        return self.downloader.download(item["link"], path)["path"]
+
+    # Download result items in parallel; returns the Downloader metrics record of each, in order
+    def download_many(self, items, directory=".", tag=None):
+        return self.downloader.download_many([(item["link"], item_path(item, directory, tag)) for item in items])
+
+
+# Function to tell data items (they cover a time range) from documentation links
+def is_data_item(item):
+    return bool(item.get("start") and item.get("end"))
+
+
+# Function to split result items into data URLs and documentation links
+def split_results(items):
+    urls = [item for item in items if is_data_item(item)]
+    docs = [item for item in items if not is_data_item(item)]
+    return urls, docs
+
+
+# Function to give already-downloaded files of an identical request this request's tag (copying them)
+def reuse_files(files, directory=".", tag=None):
+    paths = []
+    for path in files:
+        target = os.path.join(directory, tagged_file_name(os.path.basename(path), tag)) if tag else path
+        if not os.path.exists(target):
+            shutil.copyfile(path, target)
+        paths.append(target)
+    return paths
+
+
+# Function to build the local path of a result item, tagged like Run_Subsetting_MERRA2.py when a tag is given
+def item_path(item, directory=".", tag=None):
+    return os.path.join(directory, tagged_file_name(item["label"], tag) if tag else item["label"])
@@ -0,0 +1,304 @@
+import os
+import glob
+import json
+import shutil
+import logging
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+import xarray as xr
+from collections import OrderedDict
+
+import MERRA2_Subset_Client as subset
+from MERRA2_Bounds import grids
+from MERRA2_Downloader import Downloader, DownloadError
+# compare_subsets and default_rtol stay importable from here for scripts that validate local cuts
+from MERRA2_Regrid import regrid_dataset, compare_subsets, default_rtol
+from MERRA2_Job_Ledger import request_key, file_checksum
+
+logger = logging.getLogger(__name__)
+
+# OPeNDAP root of the M2T1NXFLX granules; a constraint expression cuts a region out server-side without a subset job
+opendap_url = "https://goldsmr4.gesdisc.eosdis.nasa.gov/opendap/MERRA2/M2T1NXFLX.5.12.4"
+
+# Content-addressed cache of daily regional tiles: objects/<sha[:2]>/<sha>.nc4 plus catalog.json (tile key -> object)
+cache_dir = "merra2_tiles"
+
+# Native-grid region a tile covers (minlon, minlat, maxlon, maxlat): Arizona plus one MERRA-2 cell
+# on every side, so bilinear interpolation has neighbours for every box inside the state
+arizona_region = (-115.625, 30.5, -108.125, 37.5)
+
+# Locally mirrored granules, e.g. MERRA2_400.tavg1_2d_flx_Nx.20230901.nc4 (searched recursively)
+mirror_pattern = "MERRA2_*.tavg1_2d_flx_Nx.{date}.nc4"
+
+# Tiles kept open in memory while cutting events (a tile is ~100 kB)
+default_open_tiles = 16
+
+
+# Function to give the MERRA-2 stream number of a date (the "400" in MERRA2_400...)
+def stream_numbers(date):
+    year = pd.Timestamp(date).year
+    if year < 1992:
+        return [100]
+    if year < 2001:
+        return [200]
+    if year < 2011:
+        return [300]
+    # A few reprocessed months were published as stream 401
+    return [400, 401]
+
+
+# Function to give the native grid index ranges (first, last) covering a region
+def native_ranges(region):
+    dlon, dlat, lon0, lat0 = grids["merra2"]
+    minlon, minlat, maxlon, maxlat = region
+    i = (int(np.floor((minlon - lon0) / dlon + 1e-9)), int(np.ceil((maxlon - lon0) / dlon - 1e-9)))
+    j = (int(np.floor((minlat - lat0) / dlat + 1e-9)), int(np.ceil((maxlat - lat0) / dlat - 1e-9)))
+    return i, j
+
+
+# Function to build the OPeNDAP URL of one day's regional tile (netCDF-4 response)
+def tile_url(date, region=arizona_region, variables=subset.varNames, stream=400):
+    day = pd.Timestamp(date)
+    (i0, i1), (j0, j1) = native_ranges(region)
+    granule = f"MERRA2_{stream}.tavg1_2d_flx_Nx.{day:%Y%m%d}.nc4"
+    fields = [f"{variable}[0:23][{j0}:{j1}][{i0}:{i1}]" for variable in variables]
+    fields += ["time", f"lat[{j0}:{j1}]", f"lon[{i0}:{i1}]"]
+    return f"{opendap_url}/{day:%Y}/{day:%m}/{granule}.nc4?{','.join(fields)}"
+
+
+# Function to give the destination grid nodes inside [low, high], or the nearest one when none falls inside
+def grid_nodes(low, high, step, origin):
+    first = int(np.ceil((low - origin) / step - 1e-6))
+    last = int(np.floor((high - origin) / step + 1e-6))
+    if last < first:
+        first = last = int(np.round(((low + high) / 2 - origin) / step))
+    return np.round(origin + np.arange(first, last + 1) * step, 6)
+
+
+# Function to keep the time steps whose time of day lies in [diurnal_from, diurnal_to] and aggregate them
+def select_diurnal(ds, diurnal_from, diurnal_to, aggregation="none"):
+    """
+    aggregation - the service's diurnalAggregation code (see subset.diurnal_aggregations)
+    """
+    if str(aggregation) not in subset.diurnal_aggregations:
+        raise ValueError(f"unknown diurnal aggregation {aggregation!r}")
+    reduction = subset.diurnal_aggregations[str(aggregation)]
+    times = ds["time"].values
+    minutes = (times - times.astype("datetime64[D]")) // np.timedelta64(1, "m")
+    start, stop = (int(h[:2]) * 60 + int(h[3:5]) for h in (diurnal_from, diurnal_to))
+    keep = (minutes >= start) & (minutes <= stop) if start <= stop else (minutes >= start) | (minutes <= stop)
+    ds = ds.isel(time=np.flatnonzero(keep))
+    if reduction is None or ds.sizes["time"] == 0:
+        return ds
+    reductions = {"mean": ds.mean, "min": ds.min, "max": ds.max}
+    reduced = reductions[reduction]("time", keep_attrs=True)
+    return reduced.expand_dims(time=ds["time"].values[:1])
+
+
+class TileCache:
+    """
+    Daily regional M2T1NXFLX tiles, fetched once per date and cut locally.
+
+    A tile holds every hour and variable of one day over `region` on the
+    native MERRA-2 grid. It comes from a local mirror of the granules when one
+    is configured, otherwise from one OPeNDAP request. Tiles are stored under
+    their sha256 (objects/<sha[:2]>/<sha>.nc4) and catalog.json maps each tile
+    key (product, variables, region, date) to its object, so a date is
+    downloaded once however many events fall on it. cut() then answers a
+    SubsetRequest the way the service would: bilinear interpolation onto the
+    destination grid nodes inside the box, the requested time window and
+    diurnal hours, and one file per day.
+    """
+
+    def __init__(self, directory=cache_dir, region=arizona_region, mirror=None, downloader=None,
+                 variables=tuple(subset.varNames), product=subset.product, open_tiles=default_open_tiles):
+        self.directory = directory
+        self.region = tuple(region)
+        self.mirror = mirror
+        self.downloader = downloader or Downloader()
+        self.variables = list(variables)
+        self.product = product
+        self.open_tiles = open_tiles
+        self.lock = threading.Lock()
+        self.loaded = OrderedDict()
+        self.catalog_file = os.path.join(directory, "catalog.json")
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "tmp"), exist_ok=True)
+        if os.path.exists(self.catalog_file):
+            with open(self.catalog_file) as f:
+                self.catalog = json.load(f)
+        else:
+            self.catalog = {}
+
+    # Return the catalog key of one day's tile
+    def tile_key(self, date):
+        return request_key({"product": self.product, "variables": self.variables, "region": list(self.region),
+                            "date": f"{pd.Timestamp(date):%Y-%m-%d}"})
+
+    # Return the path of a content-addressed object
+    def object_path(self, sha256):
+        return os.path.join(self.directory, "objects", sha256[:2], f"{sha256}.nc4")
+
+    # Move a finished file into the object store and record it in the catalog; returns the object path
+    def add(self, key, path, label, source, sha256=None):
+        sha256 = sha256 or file_checksum(path)
+        target = self.object_path(sha256)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        with self.lock:
+            self.catalog[key] = {"sha256": sha256, "label": label, "source": source}
+            temporary = self.catalog_file + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(self.catalog, f, indent=1, sort_keys=True)
+            os.replace(temporary, self.catalog_file)
+        return target
+
+    # Return the mirrored granule of a date, or None
+    def mirrored(self, date):
+        if not self.mirror:
+            return None
+        pattern = mirror_pattern.format(date=f"{pd.Timestamp(date):%Y%m%d}")
+        matches = sorted(glob.glob(os.path.join(self.mirror, "**", pattern), recursive=True))
+        return matches[0] if matches else None
+
+    # Return the path and granule label of one day's tile, fetching it if it is not cached
+    def tile(self, date):
+        key = self.tile_key(date)
+        entry = self.catalog.get(key)
+        if entry and os.path.exists(self.object_path(entry["sha256"])):
+            return self.object_path(entry["sha256"]), entry["label"]
+
+        temporary = os.path.join(self.directory, "tmp", f"{key}.nc4")
+        granule = self.mirrored(date)
+        if granule is not None:
+            (i0, i1), (j0, j1) = native_ranges(self.region)
+            with xr.open_dataset(granule) as ds:
+                ds[self.variables].isel(lon=slice(i0, i1 + 1), lat=slice(j0, j1 + 1)).load().to_netcdf(temporary)
+            label = os.path.basename(granule)
+            logger.info(f"Tile {date:%Y-%m-%d} cut from mirrored {label}")
+            return self.add(key, temporary, label, granule), label
+
+        error = None
+        for stream in stream_numbers(date):
+            url = tile_url(date, self.region, self.variables, stream)
+            try:
+                record = self.downloader.download(url, temporary)
+            except DownloadError as e:
+                error = e
+                continue
+            label = f"MERRA2_{stream}.tavg1_2d_flx_Nx.{pd.Timestamp(date):%Y%m%d}.nc4"
+            logger.info(f"Tile {date:%Y-%m-%d} downloaded ({record['size']} bytes)")
+            return self.add(key, temporary, label, url, record["sha256"]), label
+        raise DownloadError(f"no tile for {date:%Y-%m-%d}: {error}")
+
+    # Return one day's tile as a loaded Dataset, keeping the most recently used ones in memory
+    def open(self, date):
+        day = pd.Timestamp(date).normalize()
+        with self.lock:
+            if day in self.loaded:
+                self.loaded.move_to_end(day)
+                return self.loaded[day]
+        path, label = self.tile(day)
+        with xr.open_dataset(path) as ds:
+            tile = ds.load()
+        tile.attrs["granule"] = label
+        with self.lock:
+            self.loaded[day] = tile
+            while len(self.loaded) > self.open_tiles:
+                self.loaded.popitem(last=False)
+        return tile
+
+    # Cut a SubsetRequest out of the cached tiles; returns [(label, Dataset)], one per day like the service
+    def cut(self, request):
+        if request.grid not in grids or request.mapping != "remapbil":
+            raise ValueError(f"local cutting supports remapbil onto {sorted(grids)}, not "
+                             f"{request.mapping} onto {request.grid}")
+        minlon, minlat, maxlon, maxlat = request.box
+        rminlon, rminlat, rmaxlon, rmaxlat = self.region
+        if minlon < rminlon or maxlon > rmaxlon or minlat < rminlat or maxlat > rmaxlat:
+            raise ValueError(f"box {request.box} is outside the cached region {self.region}")
+        dlon, dlat, lon0, lat0 = grids[request.grid]
+        lat = grid_nodes(minlat, maxlat, dlat, lat0)
+        lon = grid_nodes(minlon, maxlon, dlon, lon0)
+
+        start = pd.Timestamp(request.start).tz_localize(None)
+        end = pd.Timestamp(request.end).tz_localize(None)
+        outputs = []
+        for day in pd.date_range(start.normalize(), end.normalize(), freq="D"):
+            tile = self.open(day)
+            ds = tile[request.variables].sel(time=slice(start, end + pd.Timedelta(minutes=59)))
+            if request.diurnal_from is not None:
+                ds = select_diurnal(ds, request.diurnal_from, request.diurnal_to, request.diurnal_aggregation)
+            ds = regrid_dataset(ds, lat, lon, request.variables)
+            for variable in request.variables:
+                ds[variable] = ds[variable].astype("float32")
+            label = tile.attrs["granule"].replace(".nc4", ".SUB.nc")
+            outputs.append((label, ds))
+        return outputs
+
+    # Write the subset files of a request, named like the service's downloads; returns the paths
+    def subset(self, request, directory=".", tag=None):
+        paths = []
+        for label, ds in self.cut(request):
+            path = os.path.join(directory, subset.tagged_file_name(label, tag) if tag else label)
+            ds.to_netcdf(path)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        shutil.rmtree(os.path.join(self.directory, "tmp"), ignore_errors=True)
+        self.downloader.close()
+
+
+# Function to answer orchestrator jobs from the tile cache instead of the subset service
+def cut_jobs(jobs, cache, directory="."):
+    """
+    Jobs are processed in date order so each tile is loaded once, and
+    identical requests are cut once, the others reusing the files (as in
+    run_jobs). A job that cannot be cut locally (box outside the region, no
+    tile) is marked Failed with the reason, as run_jobs does for service failures.
+    """
+    unique = {}
+    for job in jobs:
+        unique.setdefault(job.key, job)
+
+    for job in sorted(unique.values(), key=lambda job: job.args["start"]):
+        try:
+            job.files = cache.subset(subset.SubsetRequest.from_args(job.args), job.directory or directory, job.tag)
+            job.status = "Succeeded"
+            logger.info(f"{job.name} - Cut locally: {', '.join(job.files)}")
+        except (OSError, ValueError, DownloadError) as e:
+            job.status, job.error = "Failed", str(e)
+            logger.error(f"{job.name} - Local cut failed: {e}")
+
+    for job in jobs:
+        original = unique[job.key]
+        if original is job:
+            continue
+        job.status, job.error = original.status, original.error
+        if original.files:
+            job.files = subset.reuse_files(original.files, job.directory or directory, job.tag)
+            logger.info(f"{job.name} - Same request as {original.name}, reused its files")
+    return jobs
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Compare a locally cut MERRA-2 subset with a service-made one.")
+    parser.add_argument("local_file")
+    parser.add_argument("service_file")
+    parser.add_argument("--rtol", type=float, default=default_rtol)
+    args = parser.parse_args(argv)
+
+    report = compare_subsets(args.local_file, args.service_file, rtol=args.rtol)
+    print(report.to_string(index=False))
+    print("Match" if report["within"].all() else "MISMATCH")
+
+
+if __name__ == "__main__":
+    main()
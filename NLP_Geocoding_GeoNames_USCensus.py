@@ -1,62 +1,85 @@
 import pandas as pd
-import spacy
+import os
 import requests
 from geopy.geocoders import GeoNames
+import spaCy_Extraction as extraction
+from Geocode_Cache import GeocodeCache
+from GeoNames_Gazetteer import Gazetteer
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition (only NER is used)
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
 
 # Initialize the GeoNames geocoder
 geo_names_user = "soheil.bouzari"  # Replace with your GeoNames username
 geonames = GeoNames(username=geo_names_user)
 
+# Offline GeoNames index (built with GeoNames_Gazetteer.py from US.txt); used before the remote API when present
+gazetteer_file = "US.gazetteer.npy"
+gazetteer = Gazetteer(gazetteer_file) if os.path.exists(gazetteer_file) else None
+
 # US Census Geocoder API URL
 us_census_geocode_url = "https://geocoding.geo.census.gov/geocoder/locations/onelineaddress"
 
+# Shared on-disk geocode cache (keyed by provider and normalized query)
+geocode_cache = GeocodeCache("geocode_cache.sqlite")
+
 # Load your data from CSV
 input_file = "combined_rows.csv"
 df_input = pd.read_csv(input_file)
 
-# Function to extract location entities from text using spaCy
-def extract_locations(text):
-    doc = nlp(str(text))
-    locations = [ent.text for ent in doc.ents if ent.label_ == "GPE"]
-    return locations
+# Function to query the US Census Geocoder API; returns (lat, lon) or None, and raises on service errors
+def query_us_census(location, state):
+    params = {
+        'address': f'{location}, {state}',
+        'benchmark': 'Public_AR_Current',
+        'format': 'json'
+    }
+    response = requests.get(us_census_geocode_url, params=params)
+    response.raise_for_status()
+    response_json = response.json()
 
-# Function to geocode using US Census Geocoder API
+    # Parse response to extract coordinates
+    if response_json['result']['addressMatches']:
+        coordinates = response_json['result']['addressMatches'][0]['coordinates']
+        return coordinates['y'], coordinates['x']  # Return latitude and longitude
+    return None
+
+# Function to geocode using US Census Geocoder API (answers, including "not found", are cached)
 def geocode_us_census(state, location):
     try:
-        params = {
-            'address': f'{location}, {state}',
-            'benchmark': 'Public_AR_Current',
-            'format': 'json'
-        }
-        response = requests.get(us_census_geocode_url, params=params)
-        response_json = response.json()
-
-        # Parse response to extract coordinates
-        if response_json['result']['addressMatches']:
-            coordinates = response_json['result']['addressMatches'][0]['coordinates']
-            return coordinates['y'], coordinates['x'], "US Census Geocoder"  # Return latitude, longitude, and source
+        coordinates = geocode_cache.lookup("US Census Geocoder", location, state, query_us_census)
+        if coordinates:
+            return coordinates[0], coordinates[1], "US Census Geocoder"  # Return latitude, longitude, and source
         return None, None, None
     except Exception as e:
         print(f"US Census Geocoder error: {e}")
         return None, None, None
 
-# Function to geocode using GeoNames API
+# Function to query the GeoNames API; returns (lat, lon) or None, and raises on service errors
+def query_geonames(location, state):
+    geo = geonames.geocode(f"{location}, {state}")
+    return (geo.latitude, geo.longitude) if geo else None
+
+# Function to geocode using GeoNames API (answers, including "not found", are cached)
 def geocode_geonames(state, location):
     try:
-        geo = geonames.geocode(f"{location}, {state}")
-        if geo:
-            return geo.latitude, geo.longitude, "GeoNames"  # Return latitude, longitude, and source
+        coordinates = geocode_cache.lookup("GeoNames", location, state, query_geonames)
+        if coordinates:
+            return coordinates[0], coordinates[1], "GeoNames"  # Return latitude, longitude, and source
         return None, None, None
     except Exception as e:
         print(f"GeoNames error: {e}")
         return None, None, None
 
-# Geocoding function combining both geocoders
+# Geocoding function combining the geocoders: US Census, then the offline GeoNames index, then GeoNames API
 def geocode_location(state, location):
     lat, lon, source = geocode_us_census(state, location)
+    if (not lat or not lon) and gazetteer is not None:
+        lat, lon, source = gazetteer.geocode(state, location)
     if not lat or not lon:
         lat, lon, source = geocode_geonames(state, location)
     return lat, lon, source
@@ -64,19 +87,17 @@ def geocode_location(state, location):
 # Initialize results list
 results = []
 
+# Extract location entities from both narrative columns in batches (row order is kept)
+episode_locations = extraction.extract_column_locations(nlp, df_input['EPISODE_NARRATIVE'], batch_size, n_process)
+event_locations = extraction.extract_column_locations(nlp, df_input['EVENT_NARRATIVE'], batch_size, n_process)
+
 # Process each row in the DataFrame
-for index, row in df_input.iterrows():
+for (index, row), row_episode_locations, row_event_locations in zip(df_input.iterrows(), episode_locations, event_locations):
     state = row['STATE']
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
     cz_name = row['CZ_NAME']
     
-    # Extract locations from narratives
-    locations = []
-    for narrative in [episode_narrative, event_narrative]:
-        if pd.notnull(narrative):
-            extracted_locations = extract_locations(narrative)
-            locations.extend(extracted_locations)
+    # Locations from narratives
+    locations = row_episode_locations + row_event_locations
     
     # Case 1: Geocode using extracted locations from narratives
     found_location = False
@@ -108,5 +129,6 @@ for index, row in df_input.iterrows():
 # Save the updated DataFrame to a new CSV file
 output_file = "combined_rows_identify_which_geocode.csv"
 df_input.to_csv(output_file, index=False)
+geocode_cache.report()
 
 print(f"Geocoding complete. Results saved to {output_file}.")
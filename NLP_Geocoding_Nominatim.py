@@ -1,13 +1,21 @@
 import pandas as pd
-import spacy
 from geopy.geocoders import Nominatim
+import spaCy_Extraction as extraction
+from Geocode_Cache import GeocodeCache
 
-# Load the spaCy model
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model (only NER is used)
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
 
 # Initialize geocoder
 geolocator = Nominatim(user_agent="dust_storm_geocoder")
 
+# Shared on-disk geocode cache (keyed by provider and normalized query)
+geocode_cache = GeocodeCache("geocode_cache.sqlite")
+
 # Load your data from CSV
 input_file = "combined_rows.csv"  # Ensure this file is in the same directory as the script
 df_input = pd.read_csv(input_file)
@@ -25,33 +33,36 @@ if 'BC' not in df_input.columns:
 if 'BD' not in df_input.columns:
     df_input['BD'] = ''  # Empty string for narrative
 
-# Function to extract location entities
-def extract_locations(text):
-    doc = nlp(str(text))
-    locations = [ent.text for ent in doc.ents if ent.label_ == "GPE"]
-    return locations
+# Function to query Nominatim; returns (lat, lon) or None, and raises on service errors
+def query_nominatim(location, state):
+    geo = geolocator.geocode(f"{location}, {state}")
+    return (geo.latitude, geo.longitude) if geo else None
 
-# Function to geocode locations
+# Function to geocode locations (answers, including "not found", are cached)
 def geocode_location(location, state):
     try:
-        geo = geolocator.geocode(f"{location}, {state}")
-        if geo:
-            return (geo.latitude, geo.longitude)
+        coordinates = geocode_cache.lookup("Nominatim", location, state, query_nominatim)
+        if coordinates:
+            return coordinates
         else:
             return (None, None)
     except:
         return (None, None)
 
+# Extract location entities from both narrative columns in batches (row order is kept)
+episode_locations = extraction.extract_column_locations(nlp, df_input['EPISODE_NARRATIVE'], batch_size, n_process)
+event_locations = extraction.extract_column_locations(nlp, df_input['EVENT_NARRATIVE'], batch_size, n_process)
+
 # Process each narrative in both columns and geocode locations
-for index, row in df_input.iterrows():
+for (index, row), row_episode_locations, row_event_locations in zip(df_input.iterrows(), episode_locations, event_locations):
     narratives = [row['EPISODE_NARRATIVE'], row['EVENT_NARRATIVE']]
+    narrative_locations = [row_episode_locations, row_event_locations]
     state = row['STATE']  # Use the state column to restrict geocoding to the correct state
     
     # To store results in BA, BB, BC, BD columns
     latitude, longitude, location = None, None, None
     
-    for narrative in narratives:
-        locations = extract_locations(narrative)
+    for narrative, locations in zip(narratives, narrative_locations):
         if locations:
             for loc in locations:
                 lat, lon = geocode_location(loc, state)
@@ -68,3 +79,4 @@ for index, row in df_input.iterrows():
 
 # Save updated data back to the same file
 df_input.to_csv(input_file, index=False)
+geocode_cache.report()
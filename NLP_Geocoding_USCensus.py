@@ -1,38 +1,48 @@
 import pandas as pd
-import spacy
 import requests
+import spaCy_Extraction as extraction
+from Geocode_Cache import GeocodeCache
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition (only NER is used)
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
 
 # US Census Geocoder API URL
 us_census_geocode_url = "https://geocoding.geo.census.gov/geocoder/locations/onelineaddress"
 
+# Shared on-disk geocode cache (keyed by provider and normalized query)
+geocode_cache = GeocodeCache("geocode_cache.sqlite")
+
 # Load your data from CSV
 input_file = "combined_rows.csv"
 df_input = pd.read_csv(input_file)
 
-# Function to extract location entities from text using spaCy
-def extract_locations(text):
-    doc = nlp(str(text))
-    locations = [ent.text for ent in doc.ents if ent.label_ == "GPE"]  # GPE is for geopolitical entities
-    return locations
+# Function to query the US Census Geocoder API; returns (lat, lon) or None, and raises on service errors
+def query_us_census(location, state):
+    params = {
+        'address': f'{location}, {state}',
+        'benchmark': 'Public_AR_Current',
+        'format': 'json'
+    }
+    response = requests.get(us_census_geocode_url, params=params)
+    response.raise_for_status()
+    response_json = response.json()
 
-# Function to geocode using US Census Geocoder API
+    # Parse response to extract coordinates
+    if response_json['result']['addressMatches']:
+        coordinates = response_json['result']['addressMatches'][0]['coordinates']
+        return coordinates['y'], coordinates['x']  # Return latitude and longitude
+    return None
+
+# Function to geocode using US Census Geocoder API (answers, including "not found", are cached)
 def geocode_us_census(state, location):
     try:
-        params = {
-            'address': f'{location}, {state}',
-            'benchmark': 'Public_AR_Current',
-            'format': 'json'
-        }
-        response = requests.get(us_census_geocode_url, params=params)
-        response_json = response.json()
-
-        # Parse response to extract coordinates
-        if response_json['result']['addressMatches']:
-            coordinates = response_json['result']['addressMatches'][0]['coordinates']
-            return coordinates['y'], coordinates['x'], "US Census Geocoder"  # Return latitude, longitude, and source
+        coordinates = geocode_cache.lookup("US Census Geocoder", location, state, query_us_census)
+        if coordinates:
+            return coordinates[0], coordinates[1], "US Census Geocoder"  # Return latitude, longitude, and source
         return None, None, None
     except Exception as e:
         print(f"US Census Geocoder error: {e}")
@@ -46,21 +56,25 @@ def geocode_location(state, location):
 # Initialize results list
 results = []
 
+# Extract location entities from both narrative columns in batches (row order is kept)
+episode_locations = extraction.extract_column_locations(nlp, df_input['EPISODE_NARRATIVE'], batch_size, n_process)
+event_locations = extraction.extract_column_locations(nlp, df_input['EVENT_NARRATIVE'], batch_size, n_process)
+
+# CZ_NAME fallback locations, parsed in the same batched way
+cz_name_locations = extraction.extract_column_locations(nlp, df_input['CZ_NAME'], batch_size, n_process)
+
 # Process each row in the DataFrame
-for index, row in df_input.iterrows():
+for (index, row), row_episode_locations, row_event_locations, row_cz_name_locations in zip(
+        df_input.iterrows(), episode_locations, event_locations, cz_name_locations):
     state = row['STATE']
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
-    cz_name = row['CZ_NAME']
     
-    # Extract and prioritize narratives for location extraction
-    narratives = [episode_narrative, event_narrative]
+    # Extracted locations, episode narrative first (empty for a missing narrative)
+    narrative_locations = [row_episode_locations, row_event_locations]
     
     # Case 1: Geocode using narratives (if present)
     found_location = False
-    for narrative in narratives:
-        if pd.notnull(narrative):  # Check if narrative exists
-            locations = extract_locations(narrative)
+    for locations in narrative_locations:
+        if locations:
             for location in locations:
                 lat, lon, source = geocode_location(state, location)
                 if lat and lon:  # If valid coordinates found
@@ -76,20 +90,20 @@ for index, row in df_input.iterrows():
 
     # Case 2: Fallback to CZ_NAME if no valid narrative-based location is found
     if not found_location:
-        if pd.notnull(cz_name):  # Use CZ_NAME as fallback if no location was found in the narrative
-            locations = extract_locations(cz_name)  # Apply spaCy to CZ_NAME
-            for location in locations:
-                lat, lon, source = geocode_location(state, location)
-                if lat and lon:
-                    df_input.at[index, 'BA'] = location
-                    df_input.at[index, 'BB'] = lat
-                    df_input.at[index, 'BC'] = lon
-                    df_input.at[index, 'BD'] = "No narrative location found, using CZ_NAME for location"
-                    df_input.at[index, 'BE'] = source
-                    break
+        # Use CZ_NAME as fallback if no location was found in the narrative (empty for a missing CZ_NAME)
+        for location in row_cz_name_locations:
+            lat, lon, source = geocode_location(state, location)
+            if lat and lon:
+                df_input.at[index, 'BA'] = location
+                df_input.at[index, 'BB'] = lat
+                df_input.at[index, 'BC'] = lon
+                df_input.at[index, 'BD'] = "No narrative location found, using CZ_NAME for location"
+                df_input.at[index, 'BE'] = source
+                break
 
 # Save the updated DataFrame to a new CSV file
 output_file = "combined_rows_USCensus.csv"
 df_input.to_csv(output_file, index=False)
+geocode_cache.report()
 
 print(f"Geocoding complete. Results saved to {output_file}.")
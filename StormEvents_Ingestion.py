@@ -0,0 +1,368 @@
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import shutil
+import logging
+import argparse
+import tempfile
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Default pattern of the yearly NOAA StormEvents detail files
+csv_files_path = "StormEvents_details-ftp_v1.0_d*.csv.gz"
+
+# Output file for the extracted rows
+output_file_path = "combined_rows.csv"
+
+# Rows read from a yearly file at a time; bounds peak memory per file
+default_chunksize = 50000
+
+# Yearly file names carry the data year (_dYYYY) and NOAA creation stamp (_cYYYYMMDD)
+file_name_pattern = re.compile(r"_d(\d{4})_c(\d{8})\.csv(?:\.gz)?$")
+
+
+# Function to pull the data year and creation stamp out of a StormEvents file name
+def parse_file_name(file):
+    match = file_name_pattern.search(os.path.basename(file))
+    if not match:
+        return None, None
+    return int(match.group(1)), match.group(2)
+
+
+# Function to list the yearly files in year order (unknown names sort last, by name)
+def list_yearly_files(pattern=csv_files_path):
+    def sort_key(file):
+        year, created = parse_file_name(file)
+        return (year is None, year or 0, created or "", os.path.basename(file))
+
+    # NOAA may leave an older creation stamp next to a reissue; only the newest stamp of a year is read
+    newest = {}
+    for file in sorted(glob.glob(pattern), key=sort_key):
+        year, _ = parse_file_name(file)
+        if year is None:
+            newest[file] = file
+            continue
+        if year in newest:
+            logger.info(f"Ignoring {os.path.basename(newest[year])}: superseded by {os.path.basename(file)}")
+        newest[year] = file
+    return sorted(newest.values(), key=sort_key)
+
+
+# Function to build the pushdown predicate applied to every chunk before it is kept
+def build_predicate(event_types=("Dust Storm",), states=None):
+    event_types = set(event_types) if event_types else None
+    states = {s.upper() for s in states} if states else None
+
+    def predicate(chunk):
+        mask = pd.Series(True, index=chunk.index)
+        if event_types is not None:
+            mask &= chunk["EVENT_TYPE"].isin(event_types)
+        if states is not None:
+            mask &= chunk["STATE"].str.upper().isin(states)
+        return mask
+
+    return predicate
+
+
+# Function to stream one yearly file and yield only the matching rows
+def read_matching_rows(file, event_types=("Dust Storm",), states=None, columns=None,
+                       chunksize=default_chunksize):
+    """
+    INPUTS:
+    file - path to a StormEvents_details CSV (plain or .gz)
+    event_types - EVENT_TYPE values to keep, or None for all
+    states - STATE values to keep (case-insensitive), or None for all
+    columns - output columns in order, or None for every column in the file
+    chunksize - rows parsed per chunk
+
+    OUTPUT:
+    generator of DataFrames holding the matching rows of each chunk
+    """
+    predicate = build_predicate(event_types, states)
+
+    # Only parse the requested columns plus the ones the predicate needs
+    usecols = None
+    if columns is not None:
+        columns = list(columns)
+        filter_columns = ["EVENT_TYPE"] if event_types else []
+        filter_columns += ["STATE"] if states else []
+        usecols = columns + [c for c in filter_columns if c not in columns]
+
+    # Everything is read as text so values are written back exactly as NOAA published them
+    reader = pd.read_csv(file, usecols=usecols, dtype=str, keep_default_na=False,
+                         chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            matches = chunk[predicate(chunk)]
+            if matches.empty:
+                continue
+            if columns is not None:
+                matches = matches[columns]
+            yield matches
+
+
+# Function to stream every file into one output CSV, writing matches as they are found
+def stream_extract(files, output_file=output_file_path, event_types=("Dust Storm",), states=None,
+                   columns=None, chunksize=default_chunksize):
+    """
+    Returns the number of rows written. The output is written to a temporary file
+    and renamed into place, so an interrupted run never leaves a truncated CSV.
+    """
+    tmp_file = output_file + ".tmp"
+    rows_written = 0
+    header = None
+
+    with open(tmp_file, "w", newline="", encoding="utf-8") as out:
+        for file in files:
+            started = time.perf_counter()
+            file_rows = 0
+            for matches in read_matching_rows(file, event_types, states, columns, chunksize):
+                if header is None:
+                    header = list(matches.columns)
+                    matches.to_csv(out, index=False)
+                else:
+                    # Yearly files from different eras can order columns differently
+                    matches.reindex(columns=header, fill_value="").to_csv(out, index=False, header=False)
+                file_rows += len(matches)
+            rows_written += file_rows
+            log_file_done(file, file_rows, time.perf_counter() - started)
+
+    return finish_output(tmp_file, output_file, rows_written)
+
+
+# Function to log the per-file timing line shared by the serial and parallel scans
+def log_file_done(file, rows, seconds):
+    logger.info(f"Scanned {os.path.basename(file)}: {rows} matching rows in {seconds:.2f} s")
+
+
+# Function to move a finished temporary output into place (or drop it if nothing matched)
+def finish_output(tmp_file, output_file, rows_written):
+    if rows_written:
+        os.replace(tmp_file, output_file)
+    else:
+        os.remove(tmp_file)
+    return rows_written
+
+
+# Worker: extract the matches of one yearly file into its own part CSV
+def extract_file_part(file, part_file, event_types, states, columns, chunksize):
+    started = time.perf_counter()
+    rows = 0
+    header = None
+    with open(part_file, "w", newline="", encoding="utf-8") as out:
+        for matches in read_matching_rows(file, event_types, states, columns, chunksize):
+            matches.to_csv(out, index=False, header=header is None)
+            if header is None:
+                header = list(matches.columns)
+            rows += len(matches)
+    return header, rows, time.perf_counter() - started
+
+
+# Function to scan the yearly files in a process pool, one file per task
+def parallel_extract(files, output_file=output_file_path, event_types=("Dust Storm",), states=None,
+                     columns=None, chunksize=default_chunksize, workers=None):
+    """
+    Each worker writes the matches of one file to a part CSV; the parts are then
+    appended in the order of files, so the result is byte-identical to
+    stream_extract over the same file list.
+    """
+    files = list(files)
+    tmp_file = output_file + ".tmp"
+    part_dir = tempfile.mkdtemp(prefix="stormevents_parts_", dir=os.path.dirname(os.path.abspath(output_file)))
+    part_files = [os.path.join(part_dir, f"{i:05d}.csv") for i in range(len(files))]
+    rows_written = 0
+    header = None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool, open(tmp_file, "wb") as out:
+            # map yields in submission order, so parts are merged in year order as they finish
+            results = pool.map(extract_file_part, files, part_files,
+                               *[[arg] * len(files) for arg in (event_types, states, columns, chunksize)])
+            for file, part_file, (part_header, rows, seconds) in zip(files, part_files, results):
+                log_file_done(file, rows, seconds)
+                if not rows:
+                    continue
+                if header is None:
+                    header = part_header
+                    with open(part_file, "rb") as part:
+                        shutil.copyfileobj(part, out)
+                elif part_header == header:
+                    with open(part_file, "rb") as part:
+                        part.readline()  # Skip the part's own header line
+                        shutil.copyfileobj(part, out)
+                else:
+                    part = pd.read_csv(part_file, dtype=str, keep_default_na=False)
+                    out.write(part.reindex(columns=header, fill_value="")
+                              .to_csv(index=False, header=False).encode("utf-8"))
+                rows_written += rows
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    return finish_output(tmp_file, output_file, rows_written)
+
+
+# Function to compute the content hash recorded in the incremental manifest
+def hash_file(file, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to describe a source file for the manifest; the hash is reused when name, size and mtime are unchanged
+def fingerprint_file(file, previous=None):
+    stat = os.stat(file)
+    year, created = parse_file_name(file)
+    entry = {"file": os.path.basename(file), "year": year, "created": created,
+             "size": stat.st_size, "mtime": stat.st_mtime}
+    if previous and all(previous.get(key) == entry[key] for key in ("file", "size", "mtime")):
+        entry["sha256"] = previous["sha256"]
+    else:
+        entry["sha256"] = hash_file(file)
+    return entry
+
+
+# Function to read a manifest written by incremental_extract (None if there is none yet)
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Function to refresh the output, re-extracting only the years whose source file is new or revised
+def incremental_extract(files, output_file=output_file_path, event_types=("Dust Storm",), states=None,
+                        columns=None, chunksize=default_chunksize, manifest_file=None):
+    """
+    The manifest (<output>.manifest.json by default) records, per year, the source
+    file name, creation stamp, size, SHA-256 and the EVENT_IDs it contributed.
+    Unchanged years are copied from the existing output by EVENT_ID; changed years
+    are re-read from their file. The result is the same file a full rebuild writes.
+
+    Returns the number of rows in the output.
+    """
+    if columns is not None and "EVENT_ID" not in columns:
+        raise ValueError("Incremental extraction needs EVENT_ID among the output columns")
+    manifest_file = manifest_file or output_file + ".manifest.json"
+    settings = {"event_types": sorted(event_types) if event_types else None,
+                "states": sorted(s.upper() for s in states) if states else None,
+                "columns": list(columns) if columns is not None else None}
+
+    # A manifest built with other filters, or whose output went missing, cannot be reused
+    manifest = load_manifest(manifest_file)
+    previous = {}
+    if manifest is not None and manifest.get("settings") == settings:
+        previous = manifest["years"]
+        if any(entry["event_ids"] for entry in previous.values()) and not os.path.exists(output_file):
+            previous = {}
+
+    # NOAA may leave an older creation stamp next to a reissue; the newest stamp wins
+    latest = {}
+    for file in files:
+        year, created = parse_file_name(file)
+        if year is None:
+            logger.warning(f"Skipping {os.path.basename(file)}: not a yearly StormEvents file name")
+            continue
+        if str(year) not in latest or created > parse_file_name(latest[str(year)])[1]:
+            latest[str(year)] = file
+
+    entries = {}
+    changed = []
+    for year in sorted(latest):
+        entry = fingerprint_file(latest[year], previous.get(year))
+        old = previous.get(year)
+        if old and all(old[key] == entry[key] for key in ("created", "size", "sha256")):
+            entry["event_ids"] = old["event_ids"]
+        else:
+            changed.append(year)
+        entries[year] = entry
+    removed = sorted(set(previous) - set(entries))
+
+    if not changed and not removed:
+        logger.info("All yearly files unchanged; output is up to date")
+        return sum(len(entry["event_ids"]) for entry in entries.values())
+    logger.info(f"Re-extracting years {changed or 'none'}; dropping years {removed or 'none'}")
+
+    existing = None
+    if previous and os.path.exists(output_file):
+        existing = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+
+    blocks = []
+    for year, entry in entries.items():
+        if year in changed:
+            started = time.perf_counter()
+            parts = list(read_matching_rows(latest[year], event_types, states, columns, chunksize))
+            block = pd.concat(parts, ignore_index=True) if parts else None
+            log_file_done(latest[year], 0 if block is None else len(block), time.perf_counter() - started)
+        else:
+            block = existing[existing["EVENT_ID"].isin(set(entry["event_ids"]))] if entry["event_ids"] else None
+        entry["event_ids"] = block["EVENT_ID"].tolist() if block is not None else []
+        if block is not None:
+            blocks.append(block)
+
+    tmp_file = output_file + ".tmp"
+    rows_written = 0
+    with open(tmp_file, "w", newline="", encoding="utf-8") as out:
+        for block in blocks:
+            if rows_written == 0:
+                header = list(block.columns)
+                block.to_csv(out, index=False)
+            else:
+                block.reindex(columns=header, fill_value="").to_csv(out, index=False, header=False)
+            rows_written += len(block)
+    finish_output(tmp_file, output_file, rows_written)
+    if not rows_written and os.path.exists(output_file):
+        os.remove(output_file)
+
+    with open(manifest_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "years": entries}, f, indent=1)
+    os.replace(manifest_file + ".tmp", manifest_file)
+    return rows_written
+
+
+# Function to define the command-line options shared by the extraction scripts
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Extract StormEvents rows by event type and state.")
+    parser.add_argument("--input-glob", default=csv_files_path, help="Pattern of yearly StormEvents files")
+    parser.add_argument("--output", default=output_file_path, help="Combined output CSV")
+    parser.add_argument("--event-type", action="append", dest="event_types",
+                        help="EVENT_TYPE to keep (repeatable, default: Dust Storm)")
+    parser.add_argument("--state", action="append", dest="states", help="STATE to keep (repeatable)")
+    parser.add_argument("--columns", help="Comma-separated list of columns to keep (default: all)")
+    parser.add_argument("--chunksize", type=int, default=default_chunksize, help="Rows parsed per chunk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes, one yearly file each (1 = serial, 0 = all cores)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only re-extract years whose source file changed since the last run")
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = build_arg_parser().parse_args(argv)
+
+    event_types = args.event_types or ["Dust Storm"]
+    columns = [c.strip() for c in args.columns.split(",")] if args.columns else None
+    files = list_yearly_files(args.input_glob)
+
+    if args.incremental:
+        rows = incremental_extract(files, args.output, event_types, args.states, columns, args.chunksize)
+    elif args.workers == 1:
+        rows = stream_extract(files, args.output, event_types, args.states, columns, args.chunksize)
+    else:
+        rows = parallel_extract(files, args.output, event_types, args.states, columns, args.chunksize,
+                                workers=args.workers or None)
+    if rows:
+        print(f"Combined {rows} rows with {', '.join(event_types)} event type saved to: {args.output}")
+    else:
+        print(f"No rows with {', '.join(event_types)} event type found in any CSV files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import os
+import shutil
+import logging
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from concurrent.futures import ProcessPoolExecutor
+
+import StormEvents_Ingestion as ingestion
+
+logger = logging.getLogger(__name__)
+
+# Root directory of the partitioned columnar copy of the StormEvents archive
+store_path = "StormEvents_store"
+
+# Explicit schema of the StormEvents_details files. This replaces the old list of
+# "mixed dtype" column indices: every column has a declared type and values that
+# do not fit it are reported instead of silently falling back to object dtype.
+int_columns = [
+    "BEGIN_YEARMONTH", "BEGIN_DAY", "BEGIN_TIME", "END_YEARMONTH", "END_DAY", "END_TIME",
+    "EPISODE_ID", "EVENT_ID", "STATE_FIPS", "YEAR", "CZ_FIPS",
+    "INJURIES_DIRECT", "INJURIES_INDIRECT", "DEATHS_DIRECT", "DEATHS_INDIRECT", "TOR_OTHER_CZ_FIPS",
+]
+float_columns = [
+    "MAGNITUDE", "CATEGORY", "TOR_LENGTH", "TOR_WIDTH", "BEGIN_RANGE", "END_RANGE",
+    "BEGIN_LAT", "BEGIN_LON", "END_LAT", "END_LON",
+]
+category_columns = [
+    "STATE", "MONTH_NAME", "EVENT_TYPE", "CZ_TYPE", "CZ_NAME", "WFO", "CZ_TIMEZONE", "SOURCE",
+    "MAGNITUDE_TYPE", "FLOOD_CAUSE", "TOR_F_SCALE", "TOR_OTHER_WFO", "TOR_OTHER_CZ_STATE",
+    "BEGIN_AZIMUTH", "END_AZIMUTH", "DATA_SOURCE",
+]
+string_columns = [
+    "BEGIN_DATE_TIME", "END_DATE_TIME", "DAMAGE_PROPERTY", "DAMAGE_CROPS", "TOR_OTHER_CZ_NAME",
+    "BEGIN_LOCATION", "END_LOCATION", "EPISODE_NARRATIVE", "EVENT_NARRATIVE",
+]
+
+# Column order of the NOAA files
+column_order = [
+    "BEGIN_YEARMONTH", "BEGIN_DAY", "BEGIN_TIME", "END_YEARMONTH", "END_DAY", "END_TIME",
+    "EPISODE_ID", "EVENT_ID", "STATE", "STATE_FIPS", "YEAR", "MONTH_NAME", "EVENT_TYPE",
+    "CZ_TYPE", "CZ_FIPS", "CZ_NAME", "WFO", "BEGIN_DATE_TIME", "CZ_TIMEZONE", "END_DATE_TIME",
+    "INJURIES_DIRECT", "INJURIES_INDIRECT", "DEATHS_DIRECT", "DEATHS_INDIRECT",
+    "DAMAGE_PROPERTY", "DAMAGE_CROPS", "SOURCE", "MAGNITUDE", "MAGNITUDE_TYPE", "FLOOD_CAUSE",
+    "CATEGORY", "TOR_F_SCALE", "TOR_LENGTH", "TOR_WIDTH", "TOR_OTHER_WFO", "TOR_OTHER_CZ_STATE",
+    "TOR_OTHER_CZ_FIPS", "TOR_OTHER_CZ_NAME", "BEGIN_RANGE", "BEGIN_AZIMUTH", "BEGIN_LOCATION",
+    "END_RANGE", "END_AZIMUTH", "END_LOCATION", "BEGIN_LAT", "BEGIN_LON", "END_LAT", "END_LON",
+    "EPISODE_NARRATIVE", "EVENT_NARRATIVE", "DATA_SOURCE",
+]
+
+# Columns encoded in the directory layout: YEAR=1996/STATE=ARIZONA/EVENT_TYPE=Dust Storm/
+partition_columns = ["YEAR", "STATE", "EVENT_TYPE"]
+
+dictionary_type = pa.dictionary(pa.int32(), pa.string())
+partitioning = ds.partitioning(
+    pa.schema([("YEAR", pa.int16()), ("STATE", pa.string()), ("EVENT_TYPE", pa.string())]),
+    flavor="hive",
+)
+
+
+# Function to build the Arrow schema of the store (partition columns last, as the dataset reads them)
+def arrow_schema():
+    fields = []
+    for column in column_order:
+        if column in partition_columns:
+            continue
+        if column in int_columns:
+            fields.append((column, pa.int64()))
+        elif column in float_columns:
+            fields.append((column, pa.float64()))
+        elif column in category_columns:
+            fields.append((column, dictionary_type))
+        else:
+            fields.append((column, pa.string()))
+    return pa.schema(fields + list(partitioning.schema))
+
+
+# Function to check a raw (all-text) chunk against the schema and convert it to typed columns
+def apply_schema(chunk, source=""):
+    """
+    INPUTS:
+    chunk - DataFrame read with dtype=str and keep_default_na=False
+    source - file name used in error messages
+
+    OUTPUT:
+    DataFrame with nullable ints, floats, categoricals and strings; empty fields become missing
+
+    Raises ValueError when columns are missing or unexpected, or when a non-empty
+    value cannot be represented in its declared type.
+    """
+    missing = [c for c in column_order if c not in chunk.columns]
+    unexpected = [c for c in chunk.columns if c not in column_order]
+    if missing or unexpected:
+        raise ValueError(f"{source}: schema mismatch (missing {missing}, unexpected {unexpected})")
+
+    typed = {}
+    for column in column_order:
+        values = chunk[column].str.strip().replace("", None)
+        if column in int_columns or column in float_columns:
+            numbers = pd.to_numeric(values, errors="coerce")
+            bad = values.notna() & numbers.isna()
+            if column in int_columns:
+                bad |= numbers.notna() & (numbers % 1 != 0)
+            if bad.any():
+                examples = values[bad].unique()[:5].tolist()
+                raise ValueError(f"{source}: column {column} has values that are not "
+                                 f"{'integers' if column in int_columns else 'numbers'}: {examples}")
+            typed[column] = numbers.astype("Int64" if column in int_columns else "float64")
+        elif column in category_columns:
+            typed[column] = values.astype("category")
+        else:
+            typed[column] = values.astype(object)
+    return pd.DataFrame(typed, index=chunk.index)
+
+
+# Function to convert a typed DataFrame into an Arrow table with the store schema
+def to_arrow(typed):
+    schema = arrow_schema()
+    typed = typed[schema.names].astype({"STATE": object, "EVENT_TYPE": object})
+    return pa.Table.from_pandas(typed, schema=schema, preserve_index=False)
+
+
+# Function to drop every partition written for one year (so a year can be rebuilt cleanly)
+def remove_year(year, store=store_path):
+    year_dir = os.path.join(store, f"YEAR={year}")
+    if os.path.isdir(year_dir):
+        shutil.rmtree(year_dir)
+
+
+# Worker: convert one yearly CSV into the partitioned store
+def convert_file(file, store=store_path, chunksize=ingestion.default_chunksize):
+    year, created = ingestion.parse_file_name(file)
+    if year is None:
+        raise ValueError(f"{file}: not a StormEvents_details yearly file name")
+    remove_year(year, store)
+
+    rows = 0
+    stem = f"d{year}_c{created}"
+    for index, chunk in enumerate(ingestion.read_matching_rows(file, event_types=None, chunksize=chunksize)):
+        table = to_arrow(apply_schema(chunk, os.path.basename(file)))
+        ds.write_dataset(
+            table, store, format="parquet", partitioning=partitioning,
+            basename_template=f"{stem}-{index}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        rows += table.num_rows
+    logger.info(f"Stored {os.path.basename(file)}: {rows} rows")
+    return rows
+
+
+# Function to convert a list of yearly files, one worker process per file
+def build_store(files, store=store_path, workers=1, chunksize=ingestion.default_chunksize):
+    files = list(files)
+    os.makedirs(store, exist_ok=True)
+    if workers == 1:
+        return sum(convert_file(file, store, chunksize) for file in files)
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        return sum(pool.map(convert_file, files, [store] * len(files), [chunksize] * len(files)))
+
+
+# Function to open the store as a dataset; filters on the partition columns prune whole directories
+def open_store(store=store_path):
+    return ds.dataset(store, format="parquet", schema=arrow_schema(), partitioning=partitioning)
+
+
+# Function to load events from the store, reading only the partitions the filters allow
+def load_events(store=store_path, years=None, states=None, event_types=None, columns=None):
+    """
+    INPUTS:
+    store - root directory written by build_store
+    years - iterable of years to read (e.g. range(1996, 2024)), or None for all
+    states - STATE values (upper case, as NOAA writes them), or None for all
+    event_types - EVENT_TYPE values, or None for all
+    columns - columns to return, or None for all
+
+    OUTPUT:
+    DataFrame with the typed columns, in NOAA column order, sorted by EVENT_ID
+    """
+    expression = None
+    for column, values in [("YEAR", years), ("STATE", states), ("EVENT_TYPE", event_types)]:
+        if values is None:
+            continue
+        values = [int(v) for v in values] if column == "YEAR" else [str(v) for v in values]
+        condition = ds.field(column).isin(values)
+        expression = condition if expression is None else expression & condition
+
+    table = open_store(store).to_table(filter=expression)
+    # Keep nullable integers (e.g. EPISODE_ID) as Int64 instead of letting them decay to float
+    df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+    df = df[[c for c in column_order if c in df.columns]].astype({"STATE": "category", "EVENT_TYPE": "category"})
+    df = df.sort_values("EVENT_ID", kind="stable").reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+# Function to parse a "1996-2023" or "2005" command-line year range
+def parse_years(text):
+    if not text:
+        return None
+    first, _, last = text.partition("-")
+    return range(int(first), int(last or first) + 1)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Columnar, partitioned store of the StormEvents archive.")
+    parser.add_argument("--store", default=store_path, help="Store root directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Convert yearly CSV files into the store")
+    build.add_argument("--input-glob", default=ingestion.csv_files_path, help="Pattern of yearly StormEvents files")
+    build.add_argument("--workers", type=int, default=1, help="Worker processes (1 = serial, 0 = all cores)")
+
+    extract = commands.add_parser("extract", help="Write a filtered CSV from the store")
+    extract.add_argument("--output", default=ingestion.output_file_path, help="Output CSV")
+    extract.add_argument("--years", help="Year or year range, e.g. 1996-2023")
+    extract.add_argument("--state", action="append", dest="states", help="STATE to keep (repeatable)")
+    extract.add_argument("--event-type", action="append", dest="event_types",
+                         help="EVENT_TYPE to keep (repeatable, default: Dust Storm)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        rows = build_store(ingestion.list_yearly_files(args.input_glob), args.store, args.workers)
+        print(f"Stored {rows} rows in {args.store}")
+    else:
+        states = [s.upper() for s in args.states] if args.states else None
+        df = load_events(args.store, parse_years(args.years), states, args.event_types or ["Dust Storm"])
+        df.to_csv(args.output, index=False)
+        print(f"Extracted {len(df)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,9 @@ from http.cookiejar import CookieJar
 import urllib.request
 from urllib.parse import urlencode
 import getpass
+from MERRA2_Downloader import DownloadError
+from MERRA2_Subset_Client import SubsetClient, SubsetRequest
+from MERRA2_Polling import PollSchedule
 
 
 # STEP 2
@@ -63,40 +66,14 @@ destGrid = 'cfsr0.5a'
 
 # STEP 5
 # Construct JSON WSP request for API method: subset
+# SubsetRequest validates the parameters and builds the same 'args' as every other script
+request = SubsetRequest([minlon, minlat, maxlon, maxlat], begTime, endTime, begHour, endHour,
+                        product=product, variables=varNames, mapping=interp, grid=destGrid)
 subset_request = {
     'methodname': 'subset',
     'type': 'jsonwsp/request',
     'version': '1.0',
-    'args': {
-        'role'  : 'subset',
-        'start' : begTime,
-        'end'   : endTime,
-        'diurnalFrom' : begHour,
-        'diurnalTo' : endHour,
-        "diurnalAggregation": "none",
-        'box'   : [minlon, minlat, maxlon, maxlat],
-        'crop'  : True,
-        'mapping': interp,
-        'grid'  : destGrid,
-        'data': [{'datasetId': product,
-                  'variable' : varNames[0]
-                 },
-                 {'datasetId': product,
-                  'variable' : varNames[1]
-                 },
-                 {'datasetId': product,
-                  'variable' : varNames[2]
-                 },
-                 {'datasetId': product,
-                  'variable' : varNames[3]
-                 },
-                 {'datasetId': product,
-                  'variable' : varNames[4]
-                 },
-                 {'datasetId': product,
-                  'variable' : varNames[5]
-                 }]
-    }
+    'args': request.to_args()
 }
 
 # STEP 6
@@ -117,9 +94,12 @@ status_request = {
     'args': {'jobId': myJobId}
 }
 
-# Check on the job status after a brief nap
+# Check on the job status, napping as long as its progress suggests
+schedule = PollSchedule()
+schedule.start(myJobId)
+percent = 0
 while response['result']['Status'] in ['Accepted', 'Running']:
-    sleep(5)
+    sleep(schedule.next_delay(myJobId, percent))
     response = get_http_data(status_request)
     status  = response['result']['Status']
     percent = response['result']['PercentCompleted']
@@ -132,69 +112,28 @@ else :
 
 
 # STEP 8 (Plan A - preferred)
-# Construct JSON WSP request for API method: GetResult
-batchsize = 20
-results_request = {
-    'methodname': 'GetResult',
-    'version': '1.0',
-    'type': 'jsonwsp/request',
-    'args': {
-        'jobId': myJobId,
-        'count': batchsize,
-        'startIndex': 0
-    }
-}
-
-# Retrieve the results in JSON in multiple batches 
-# Initialize variables, then submit the first GetResults request
-# Add the results from this batch to the list and increment the count
-results = []
-count = 0 
-response = get_http_data(results_request) 
-count = count + response['result']['itemsPerPage']
-results.extend(response['result']['items']) 
-
-# Increment the startIndex and keep asking for more results until we have them all
-total = response['result']['totalResults']
-while count < total :
-    results_request['args']['startIndex'] += batchsize 
-    response = get_http_data(results_request) 
-    count = count + response['result']['itemsPerPage']
-    results.extend(response['result']['items'])
-       
-# Check on the bookkeeping
-print('Retrieved %d out of %d expected items' % (len(results), total))
-
-
-# Sort the results into documents and URLs
-
-docs = []
-urls = []
-for item in results :
-    try:
-        if item['start'] and item['end'] : urls.append(item) 
-    except:
-        docs.append(item)
+# Page through GetResult lazily: the next page is fetched in the background and
+# every data URL starts downloading as soon as its page arrives.
+# Documentation items are sorted out and not downloaded.
+client = SubsetClient(url, http=http)
+downloads, docs = client.start_downloads(myJobId)
+print('Retrieved %d data items and %d documentation items' % (len(downloads), len(docs)))
 # Print out the documentation links, but do not download them
 # print('\nDocumentation:')
 # for item in docs : print(item['label']+': '+item['link'])
 
 
 # STEP 10 
-# Use the requests library to submit the HTTP_Services URLs and write out the results.
+# The HTTP_Services URLs are streamed to disk in parallel over one pooled session.
+# Partial files are resumed and only renamed into place once complete.
 print('\nHTTP_services output:')
-for item in urls :
-    URL = item['link'] 
-    result = requests.get(URL)
+for item, future in downloads :
     try:
-        result.raise_for_status()
-        outfn = item['label']
-        f = open(outfn,'wb')
-        f.write(result.content)
-        f.close()
-        print(outfn, "is downloaded")
-    except:
-        print('Error! Status code is %d for this URL:\n%s' % (result.status.code,URL))
+        record = future.result()
+        print(record['path'], "is downloaded (%.2f MB/s)" % record['mb_per_s'])
+    except (DownloadError, requests.exceptions.RequestException) as e:
+        print('Error! %s for this URL:\n%s' % (e, item['link']))
         print('Help for downloading data is at https://disc.gsfc.nasa.gov/data-access')
+client.downloader.close()
         
 print('Downloading is done and find the downloaded files in your current working directory')
\ No newline at end of file
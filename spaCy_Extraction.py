@@ -0,0 +1,136 @@
+import os
+import hashlib
+import pandas as pd
+import spacy
+from spacy.tokens import Doc, DocBin
+
+# spaCy model shared by the narrative extraction scripts
+default_model = "en_core_web_sm"
+
+# Narratives handed to spaCy per batch, and worker processes used by nlp.pipe
+default_batch_size = 256
+default_n_process = 1
+
+
+# Function to load the spaCy model with only the components a script actually uses
+def load_pipeline(model=default_model, components=("ner",)):
+    """
+    INPUTS:
+    model - spaCy model name
+    components - pipeline components whose output is needed, e.g. ("ner",) for
+                 entities plus token/lexical Matcher patterns, ("ner", "parser")
+                 when dependency labels are read
+
+    OUTPUT:
+    nlp object with every other component disabled; shared embedding layers
+    (tok2vec) stay enabled when a kept component listens to them
+    """
+    nlp = spacy.load(model)
+    keep = [name for name in nlp.pipe_names if name in components]
+    for name in nlp.pipe_names:
+        listeners = getattr(nlp.get_pipe(name), "listening_components", [])
+        if name not in keep and any(listener in keep for listener in listeners):
+            keep.append(name)
+    nlp.select_pipes(enable=keep)
+    return nlp
+
+
+# Function to stream texts through nlp.pipe; Docs come back in input order
+def pipe_texts(nlp, texts, batch_size=default_batch_size, n_process=default_n_process):
+    texts = ("" if text is None else str(text) for text in texts)
+    return nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+
+
+# Function to build the "episode event" text each row is parsed from
+def combined_narratives(df, episode_column="EPISODE_NARRATIVE", event_column="EVENT_NARRATIVE"):
+    return [f"{episode} {event}" for episode, event in zip(df[episode_column], df[event_column])]
+
+
+# Function to list the GPE entities of every value in a column (empty list for missing values)
+def extract_column_locations(nlp, values, batch_size=default_batch_size, n_process=default_n_process):
+    values = list(values)
+    present = [i for i, value in enumerate(values) if pd.notnull(value)]
+    locations = [[] for _ in values]
+    docs = pipe_texts(nlp, (values[i] for i in present), batch_size, n_process)
+    for i, doc in zip(present, docs):
+        locations[i] = [ent.text for ent in doc.ents if ent.label_ == "GPE"]
+    return locations
+
+
+# Persistent parse cache: Docs (tokens, entities, and dependencies when the parser ran)
+# serialized with DocBin and keyed by a hash of the pipeline and the text
+default_cache_file = "narrative_docs.spacy"
+
+
+# Function to identify the enabled pipeline, so a model or component change never reuses old parses
+def pipeline_fingerprint(nlp):
+    return f"{nlp.meta.get('name', '')}-{nlp.meta.get('version', '')}-{','.join(nlp.pipe_names)}"
+
+
+# Function to compute the cache key of one text
+def text_key(fingerprint, text):
+    return hashlib.sha256(f"{fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+
+# Function to load the cached Docs as a {key: Doc} dictionary
+def load_doc_cache(nlp, cache_file=default_cache_file):
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    doc_bin = DocBin(store_user_data=True).from_disk(cache_file)
+    return {doc.user_data.pop("cache_key"): doc for doc in doc_bin.get_docs(nlp.vocab)}
+
+
+# Function to write the {key: Doc} dictionary back to disk
+def save_doc_cache(docs_by_key, cache_file=default_cache_file):
+    doc_bin = DocBin(store_user_data=True)
+    for key, doc in docs_by_key.items():
+        # The key only rides along in the serialized user data; DocBin.add copies it immediately
+        doc.user_data["cache_key"] = key
+        doc_bin.add(doc)
+        del doc.user_data["cache_key"]
+    tmp_file = cache_file + ".tmp"
+    doc_bin.to_disk(tmp_file)
+    os.replace(tmp_file, cache_file)
+
+
+# Function to parse each distinct text once, reusing Docs cached by earlier runs
+def pipe_unique(nlp, texts, cache_file=default_cache_file, batch_size=default_batch_size,
+                n_process=default_n_process):
+    """
+    INPUTS:
+    texts - texts to parse; repeats (e.g. an EPISODE_NARRATIVE shared by every
+            event of the episode) are parsed only once
+    cache_file - DocBin file holding earlier parses, or None to keep the cache in memory only
+
+    OUTPUT:
+    list of Docs aligned with texts (repeated texts share one Doc)
+    """
+    texts = ["" if text is None else str(text) for text in texts]
+    fingerprint = pipeline_fingerprint(nlp)
+    keys = [text_key(fingerprint, text) for text in texts]
+
+    cached = load_doc_cache(nlp, cache_file)
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            missing.setdefault(key, text)
+
+    if missing:
+        parsed = pipe_texts(nlp, missing.values(), batch_size, n_process)
+        cached.update(zip(missing.keys(), parsed))
+        if cache_file:
+            save_doc_cache(cached, cache_file)
+    print(f"Parsed {len(missing)} new narratives; {len(set(keys)) - len(missing)} reused from cache")
+    return [cached[key] for key in keys]
+
+
+# Function to build the "episode event" Doc of every row from separately cached narrative parses
+def combined_narrative_docs(nlp, df, cache_file=default_cache_file, batch_size=default_batch_size,
+                            n_process=default_n_process, episode_column="EPISODE_NARRATIVE",
+                            event_column="EVENT_NARRATIVE"):
+    episodes = [str(text) for text in df[episode_column]]
+    events = [str(text) for text in df[event_column]]
+    docs = pipe_unique(nlp, episodes + events, cache_file, batch_size, n_process)
+    episode_docs, event_docs = docs[:len(episodes)], docs[len(episodes):]
+    # Matcher patterns are applied to the joined Doc, so they still see both narratives together
+    return [Doc.from_docs([episode_doc, event_doc]) for episode_doc, event_doc in zip(episode_docs, event_docs)]
@@ -1,15 +1,23 @@
 import pandas as pd
-import spacy
 from spacy.matcher import PhraseMatcher
 from geopy.geocoders import GeoNames
+import spaCy_Extraction as extraction
+from Geocode_Cache import GeocodeCache
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition (only NER is needed next to the PhraseMatcher)
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
 
 # Initialize the GeoNames geocoder
 geo_names_user = "soheil.bouzari"  # Replace with your GeoNames username
 geonames = GeoNames(username=geo_names_user)
 
+# Shared on-disk geocode cache (keyed by provider and normalized query)
+geocode_cache = GeocodeCache("geocode_cache.sqlite")
+
 # Load your data from CSV
 input_file = "combined_rows.csv"
 df_input = pd.read_csv(input_file)
@@ -55,10 +63,8 @@ def check_highways_and_directions(doc):
             directions.append(token.text)
     return highways, directions
 
-# Function to extract location entities from text using spaCy and PhraseMatcher
-def extract_locations(text):
-    text = normalize_abbreviations(text)  # Normalize abbreviations
-    doc = nlp(text)
+# Function to extract location entities from a processed (abbreviation-normalized) narrative
+def extract_locations(doc):
     locations = [ent.text for ent in doc.ents if ent.label_ == "GPE"]
 
     # Use PhraseMatcher to detect specific terms
@@ -76,28 +82,43 @@ def extract_locations(text):
     
     return locations
 
-# Geocoding function using GeoNames API
+# Function to query the GeoNames API; returns (lat, lon) or None, and raises on service errors
+def query_geonames(location, state):
+    geo = geonames.geocode(f"{location}, {state}")
+    return (geo.latitude, geo.longitude) if geo else None
+
+# Geocoding function using GeoNames API (answers, including "not found", are cached)
 def geocode_geonames(state, location):
     try:
-        geo = geonames.geocode(f"{location}, {state}")
-        if geo:
-            return geo.latitude, geo.longitude, "GeoNames"
+        coordinates = geocode_cache.lookup("GeoNames", location, state, query_geonames)
+        if coordinates:
+            return coordinates[0], coordinates[1], "GeoNames"
         return None, None, None
     except Exception as e:
         print(f"GeoNames error: {e}")
         return None, None, None
 
+# Normalize abbreviations in every narrative and stream them through spaCy in batches
+def narrative_docs(column):
+    narratives = [normalize_abbreviations(n) if pd.notnull(n) else None for n in df_input[column]]
+    present = [i for i, n in enumerate(narratives) if n is not None]
+    docs = [None] * len(narratives)
+    for i, doc in zip(present, extraction.pipe_texts(nlp, (narratives[i] for i in present), batch_size, n_process)):
+        docs[i] = doc
+    return docs
+
+episode_docs = narrative_docs('EPISODE_NARRATIVE')
+event_docs = narrative_docs('EVENT_NARRATIVE')
+
 # Process each row in the DataFrame
-for index, row in df_input.iterrows():
+for (index, row), episode_doc, event_doc in zip(df_input.iterrows(), episode_docs, event_docs):
     state = row['STATE']
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
     
     # Extract locations from narratives
     locations = []
-    for narrative in [episode_narrative, event_narrative]:
-        if pd.notnull(narrative):
-            extracted_locations = extract_locations(narrative)
+    for doc in [episode_doc, event_doc]:
+        if doc is not None:
+            extracted_locations = extract_locations(doc)
             locations.extend(extracted_locations)
     
     # Geocode the extracted locations
@@ -119,5 +140,6 @@ for index, row in df_input.iterrows():
 # Save the updated DataFrame to a new CSV file
 output_file = "combined_rows_with_highways_and_directions.csv"
 df_input.to_csv(output_file, index=False)
+geocode_cache.report()
 
 print(f"Processing complete. Results saved to {output_file}.")
@@ -1,9 +1,16 @@
 import pandas as pd
-import spacy
 from spacy.matcher import PhraseMatcher
+import spaCy_Extraction as extraction
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition (only NER is needed next to the PhraseMatcher)
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
+
+# Parsed narratives are cached here and reused across runs (only the Matcher is re-applied)
+doc_cache_file = "narrative_docs.spacy"
 
 # Load your data from CSV
 input_file = "combined_rows.csv"
@@ -18,9 +25,8 @@ matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
 patterns = [nlp.make_doc(kw) for kw in highway_keywords + directional_keywords]
 matcher.add("HighwayTerms", patterns)
 
-# Function to parse specific location information
-def parse_location(narrative):
-    doc = nlp(narrative)
+# Function to parse specific location information from a processed narrative
+def parse_location(doc):
     matches = matcher(doc)
     
     locations = []  # To store potential location matches
@@ -35,16 +41,14 @@ def parse_location(narrative):
     
     return locations
 
+# Parse each distinct episode/event narrative once (shared episode narratives are not re-parsed)
+# and join them into one Doc per row
+docs = extraction.combined_narrative_docs(nlp, df_input, doc_cache_file, batch_size=batch_size, n_process=n_process)
+
 # Process each narrative and extract detailed locations
-for index, row in df_input.iterrows():
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
-    
-    # Combine narratives into one text for processing
-    full_narrative = f"{episode_narrative} {event_narrative}"
-    
+for index, doc in zip(df_input.index, docs):
     # Extract specific locations
-    parsed_locations = parse_location(full_narrative)
+    parsed_locations = parse_location(doc)
     
     if parsed_locations:
         # Store extracted locations in new columns for further geocoding
@@ -1,10 +1,18 @@
 import re
 import pandas as pd
-import spacy
 from spacy.matcher import Matcher
+import spaCy_Extraction as extraction
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition; the Matcher patterns only need
+# entities and lexical attributes, so the tagger, parser and lemmatizer are skipped
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner",))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
+
+# Parsed narratives are cached here and reused across runs (only the Matcher is re-applied)
+doc_cache_file = "narrative_docs.spacy"
 
 # Load your data from CSV
 input_file = "combined_rows.csv"
@@ -44,9 +52,9 @@ def add_patterns(matcher):
 # Call function to add patterns to matcher
 add_patterns(matcher)
 
-# Function to parse location information and create coherent phrases
-def parse_location(narrative, state):
-    doc = nlp(narrative)
+# Function to parse location information from an already processed narrative and create coherent phrases
+def parse_location(doc, state):
+    narrative = doc.text
     matches = matcher(doc)
 
     # Extract entities
@@ -97,17 +105,14 @@ def parse_location(narrative, state):
     print("No specific location found")
     return "No specific location found"
 
-# Process each narrative and extract detailed locations
-for index, row in df_input.iterrows():
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
-    state = row['STATE']
-
-    # Combine narratives into one text for processing
-    full_narrative = f"{episode_narrative} {event_narrative}"
+# Parse each distinct episode/event narrative once (shared episode narratives are not re-parsed)
+# and join them into one Doc per row
+docs = extraction.combined_narrative_docs(nlp, df_input, doc_cache_file, batch_size=batch_size, n_process=n_process)
 
+# Process each narrative and extract detailed locations
+for index, state, doc in zip(df_input.index, df_input['STATE'], docs):
     # Extract and format specific locations
-    parsed_location = parse_location(full_narrative, state)
+    parsed_location = parse_location(doc, state)
 
     # Store results in new columns
     df_input.at[index, 'Extracted_Location'] = parsed_location
@@ -1,9 +1,16 @@
 import pandas as pd
-import spacy
 from spacy.matcher import PhraseMatcher
+import spaCy_Extraction as extraction
 
-# Load the spaCy model for Named Entity Recognition
-nlp = spacy.load("en_core_web_sm")
+# Load the spaCy model for Named Entity Recognition and dependency parsing
+nlp = extraction.load_pipeline("en_core_web_sm", components=("ner", "parser"))
+
+# Narratives per spaCy batch and worker processes for nlp.pipe
+batch_size = 256
+n_process = 1
+
+# Parsed narratives are cached here and reused across runs (only the Matcher is re-applied)
+doc_cache_file = "narrative_docs.spacy"
 
 # Load your data from CSV
 input_file = "combined_rows.csv"
@@ -25,9 +32,8 @@ def combine_location(distance_phrase, direction, location, highway=None):
     else:
         return f"{distance_phrase} {direction} of {location}"
 
-# Function to parse specific location information using dependency parsing
-def parse_location(narrative):
-    doc = nlp(narrative)
+# Function to parse specific location information from a processed narrative using dependency parsing
+def parse_location(doc):
     matches = matcher(doc)
 
     locations = []  # To store potential location matches
@@ -68,16 +74,14 @@ def parse_location(narrative):
 
     return locations
 
-# Process each narrative and extract detailed locations
-for index, row in df_input.iterrows():
-    episode_narrative = row['EPISODE_NARRATIVE']
-    event_narrative = row['EVENT_NARRATIVE']
-
-    # Combine narratives into one text for processing
-    full_narrative = f"{episode_narrative} {event_narrative}"
+# Parse each distinct episode/event narrative once (shared episode narratives are not re-parsed)
+# and join them into one Doc per row
+docs = extraction.combined_narrative_docs(nlp, df_input, doc_cache_file, batch_size=batch_size, n_process=n_process)
 
+# Process each narrative and extract detailed locations
+for index, doc in zip(df_input.index, docs):
     # Extract specific locations using dependency parsing
-    parsed_locations = parse_location(full_narrative)
+    parsed_locations = parse_location(doc)
 
     if parsed_locations:
         # Store extracted locations in new columns for further geocoding
@@ -0,0 +1,53 @@
+import time
+import asyncio
+import threading
+from aiohttp import web
+
+
+class StubServer:
+    """
+    Local aiohttp server on a free port, run in a background thread so both
+    synchronous (requests) and asyncio clients can talk to it.
+
+    routes - list of (method, path, handler); handlers are aiohttp coroutines.
+    Every request is recorded in self.requests as (path, monotonic time).
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+        self.url = None
+
+    # Return the arrival times of the requests to one path
+    def times(self, path):
+        return [t for p, t in self.requests if p == path]
+
+    async def start(self):
+        @web.middleware
+        async def record(request, handler):
+            self.requests.append((request.path, time.monotonic()))
+            return await handler(request)
+
+        app = web.Application(middlewares=[record])
+        for method, path, handler in self.routes:
+            app.router.add_route(method, path, handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result(10)
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(10)
+        self.loop.close()
@@ -0,0 +1,85 @@
+import io
+import csv
+import pandas as pd
+import pytest
+from aiohttp import web
+
+import Census_Batch_Geocoder as census
+from Geocode_Cache import GeocodeCache
+from stub_server import StubServer
+
+# Fake gazetteer of the addressbatch endpoint: Match answers, and "Tie" for ambiguous names
+matches = {("Phoenix", "ARIZONA"): (33.4484, -112.074), ("Tucson", "ARIZONA"): (32.2226, -110.9747),
+           ("Pinal", "ARIZONA"): (32.9, -111.3)}
+ties = {("Springfield", "ARIZONA")}
+
+uploads = []
+
+
+# Fake addressbatch endpoint answering in the Census CSV format (all fields quoted, Match/No_Match/Tie)
+async def addressbatch(request):
+    form = await request.post()
+    assert form["benchmark"] == census.benchmark
+    rows = list(csv.reader(io.StringIO(form["addressFile"].file.read().decode("utf-8"))))
+    uploads.append(rows)
+    out = io.StringIO()
+    writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+    for row_id, street, city, state, zip_code in rows:
+        address = f"{street}, {city}, {state}, {zip_code}"
+        if (city, state) in matches:
+            lat, lon = matches[(city, state)]
+            writer.writerow([row_id, address, "Match", "Non_Exact", f"{city.upper()}, AZ", f"{lon},{lat}", "1", "L"])
+        elif (city, state) in ties:
+            writer.writerow([row_id, address, "Tie"])
+        else:
+            writer.writerow([row_id, address, "No_Match"])
+    return web.Response(text=out.getvalue(), content_type="text/csv")
+
+
+@pytest.fixture
+def server():
+    uploads.clear()
+    with StubServer([("POST", "/addressbatch", addressbatch)]) as stub:
+        yield stub
+
+
+def test_parse_batch_response():
+    text = ('"0","Phoenix, AZ","Match","Exact","PHOENIX, AZ","-112.074,33.4484","1","L"\n'
+            '"1","Nowhere, AZ","No_Match"\n'
+            '"2","Springfield, AZ","Tie"\n'
+            "\n")
+    assert census.parse_batch_response(text) == {0: (33.4484, -112.074), 1: None, 2: None}
+
+
+def test_batch_geocode_chunks_and_cache(server, tmp_path):
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"))
+    candidates = [("Phoenix", "ARIZONA"), ("Nowhere", "ARIZONA"), ("Springfield", "ARIZONA"),
+                  ("Tucson", "ARIZONA"), ("Pinal", "ARIZONA")]
+
+    results = census.batch_geocode(candidates, f"{server.url}/addressbatch", chunk_size=2, cache=cache)
+
+    assert results == {("Phoenix", "ARIZONA"): (33.4484, -112.074), ("Nowhere", "ARIZONA"): None,
+                       ("Springfield", "ARIZONA"): None, ("Tucson", "ARIZONA"): (32.2226, -110.9747),
+                       ("Pinal", "ARIZONA"): (32.9, -111.3)}
+    assert [len(rows) for rows in uploads] == [2, 2, 1]
+
+    # Every answer, "not found" included, is cached: a second run uploads nothing
+    assert census.batch_geocode(candidates, f"{server.url}/addressbatch", chunk_size=2, cache=cache) == results
+    assert len(uploads) == 3
+
+
+def test_apply_results_follows_narrative_then_cz_name(server):
+    df = pd.DataFrame({"STATE": ["ARIZONA"] * 4, "CZ_NAME": ["MARICOPA", "PINAL", "PINAL", "X"]})
+    row_locations = [["Nowhere", "Phoenix"], [], ["Springfield"], []]
+    row_fallbacks = [["Maricopa"], ["Pinal"], ["Pinal"], ["Nowhere"]]
+    candidates = census.collect_candidates(df["STATE"], row_locations, row_fallbacks)
+    results = census.batch_geocode(candidates, f"{server.url}/addressbatch")
+
+    census.apply_results(df, row_locations, row_fallbacks, results)
+
+    assert df.loc[0, ["BA", "BB", "BC", "BD", "BE"]].tolist() == [
+        "Phoenix", 33.4484, -112.074, "Narrative: Phoenix", "US Census Geocoder"]
+    assert df.loc[1, ["BA", "BD"]].tolist() == ["Pinal", "No narrative location found, using CZ_NAME for location"]
+    # A Tie in the narrative counts as not found, so the CZ_NAME fallback is used
+    assert df.at[2, "BA"] == "Pinal"
+    assert pd.isna(df.at[3, "BA"]) and pd.isna(df.at[3, "BE"])
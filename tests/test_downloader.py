@@ -0,0 +1,65 @@
+import os
+import pytest
+from aiohttp import web
+
+from MERRA2_Downloader import Downloader, DownloadError
+from stub_server import StubServer
+
+content = bytes(range(256)) * 400
+
+# Responses still to fail, per path, before the file is served
+failures = {}
+
+
+# Serves `content`, first failing with the statuses queued in failures[path]
+async def throttled(request):
+    queued = failures.get(request.path)
+    if queued:
+        return web.Response(status=queued.pop(0), headers={"Retry-After": "0"})
+    return web.Response(body=content)
+
+
+# Answers every ranged request with 416 and no Content-Range, like servers that drop the header
+async def no_range(request):
+    if request.headers.get("Range"):
+        return web.Response(status=416)
+    return web.Response(body=content)
+
+
+@pytest.fixture
+def server():
+    failures.clear()
+    with StubServer([("GET", "/file", throttled), ("GET", "/norange", no_range)]) as stub:
+        yield stub
+
+
+def test_throttling_and_server_errors_are_retried(server, tmp_path):
+    failures["/file"] = [429, 503, 500]
+    downloader = Downloader(retries=3, backoff=0)
+    record = downloader.download(f"{server.url}/file", str(tmp_path / "a.nc"))
+
+    assert record["size"] == len(content)
+    assert (tmp_path / "a.nc").read_bytes() == content
+    assert len(server.times("/file")) == 4
+    downloader.close()
+
+
+def test_persistent_server_error_raises(server, tmp_path):
+    failures["/file"] = [503] * 10
+    downloader = Downloader(retries=2, backoff=0)
+    with pytest.raises(DownloadError, match="HTTP 503"):
+        downloader.download(f"{server.url}/file", str(tmp_path / "a.nc"))
+    downloader.close()
+
+
+def test_416_without_total_restarts_from_zero(server, tmp_path):
+    path = str(tmp_path / "a.nc")
+    with open(path + ".part", "wb") as f:
+        f.write(content[:1000])
+    downloader = Downloader(backoff=0)
+    record = downloader.download(f"{server.url}/norange", path)
+
+    assert not record["resumed"] and record["size"] == len(content)
+    assert (tmp_path / "a.nc").read_bytes() == content
+    assert not os.path.exists(path + ".part")
+    downloader.close()
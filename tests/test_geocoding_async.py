@@ -0,0 +1,139 @@
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from aiohttp import web
+
+import Geocoding_Async as engine
+from Geocode_Cache import GeocodeCache, normalize_query
+from stub_server import StubServer
+
+census_places = {"phoenix, arizona": (33.4484, -112.074), "tucson, arizona": (32.2226, -110.9747)}
+geonames_places = {"casa grande, arizona": (32.8795, -111.7574), "pinal, arizona": (32.9, -111.3),
+                   "phoenix, arizona": (33.45, -112.07)}
+nominatim_places = {f"town{i}, arizona": (33.0 + i / 10, -112.0) for i in range(8)}
+
+# Seconds the GeoNames stub waits before answering (set per test)
+geonames_delay = {"seconds": 0}
+
+
+async def census(request):
+    place = census_places.get(normalize_query(request.query["address"]))
+    matches = [{"coordinates": {"x": place[1], "y": place[0]}}] if place else []
+    return web.json_response({"result": {"addressMatches": matches}})
+
+
+async def geonames(request):
+    await asyncio.sleep(geonames_delay["seconds"])
+    place = geonames_places.get(normalize_query(request.query["q"]))
+    places = [{"lat": str(place[0]), "lng": str(place[1])}] if place else []
+    return web.json_response({"totalResultsCount": len(places), "geonames": places})
+
+
+async def nominatim(request):
+    assert request.headers["User-Agent"] == "stub-test"
+    place = nominatim_places.get(normalize_query(request.query["q"]))
+    return web.json_response([{"lat": str(place[0]), "lon": str(place[1])}] if place else [])
+
+
+@pytest.fixture
+def server():
+    geonames_delay["seconds"] = 0
+    routes = [("GET", "/census", census), ("GET", "/geonames", geonames), ("GET", "/nominatim", nominatim)]
+    with StubServer(routes) as stub:
+        yield stub
+
+
+# The sequential loop of NLP_Geocoding_GeoNames_USCensus.py (Census, then GeoNames), with requests
+def sync_geocode(df, row_locations, url):
+    def geocode_location(state, location):
+        r = requests.get(f"{url}/census", params={"address": f"{location}, {state}",
+                                                  "benchmark": "Public_AR_Current", "format": "json"})
+        matches = r.json()["result"]["addressMatches"]
+        if matches:
+            return matches[0]["coordinates"]["y"], matches[0]["coordinates"]["x"], "US Census Geocoder"
+        r = requests.get(f"{url}/geonames", params={"q": f"{location}, {state}", "maxRows": 1, "username": "u"})
+        places = r.json()["geonames"]
+        if places:
+            return float(places[0]["lat"]), float(places[0]["lng"]), "GeoNames"
+        return None, None, None
+
+    for (index, row), locations in zip(df.iterrows(), row_locations):
+        found = False
+        for location in locations:
+            lat, lon, source = geocode_location(row["STATE"], location)
+            if lat and lon:
+                df.loc[index, ["BA", "BB", "BC", "BD", "BE"]] = [location, lat, lon, f"Narrative: {location}", source]
+                found = True
+                break
+        if not found:
+            if locations:
+                df.at[index, "BD"] = "Narrative found, but geocoding failed"
+            elif pd.notnull(row["CZ_NAME"]):
+                lat, lon, source = geocode_location(row["STATE"], row["CZ_NAME"])
+                df.loc[index, ["BA", "BB", "BC", "BD", "BE"]] = [
+                    row["CZ_NAME"], lat, lon, "No narrative location found, using CZ_NAME for location", source]
+    return df
+
+
+def rows():
+    df = pd.DataFrame({
+        "STATE": ["ARIZONA"] * 6,
+        "CZ_NAME": ["MARICOPA", "PIMA", "PINAL", "PINAL", np.nan, "ATLANTIS"],
+    })
+    locations = [["Phoenix"], ["Nowhere", "Casa Grande"], ["Nowhere"], [], [], []]
+    return df, locations
+
+
+def output_columns(df):
+    return df.reindex(columns=["BA", "BB", "BC", "BD", "BE"]).astype(object).where(lambda d: d.notna(), None)
+
+
+def providers(url):
+    return [engine.CensusProvider(f"{url}/census", rate=100, capacity=10),
+            engine.GeoNamesProvider("u", f"{url}/geonames", rate=100, capacity=10)]
+
+
+@pytest.mark.parametrize("race", [False, True])
+def test_same_columns_as_sync_path(server, race):
+    expected = sync_geocode(*rows(), server.url)
+    df, locations = rows()
+    result = engine.geocode_dataframe(df, locations, providers(server.url), race=race)
+
+    pd.testing.assert_frame_equal(output_columns(result), output_columns(expected))
+    assert result.at[0, "BE"] == "US Census Geocoder"
+    assert result.at[1, "BE"] == "GeoNames"
+    assert result.at[2, "BD"] == "Narrative found, but geocoding failed"
+
+
+def test_each_bucket_keeps_its_provider_rate(server):
+    census = engine.CensusProvider(f"{server.url}/census", rate=20, capacity=1)
+    nominatim = engine.NominatimProvider("stub-test", f"{server.url}/nominatim", rate=4, capacity=1)
+    df = pd.DataFrame({"STATE": ["ARIZONA"] * 8, "CZ_NAME": [np.nan] * 8})
+    locations = [[f"Town{i}"] for i in range(8)]
+
+    result = engine.geocode_dataframe(df, locations, [census, nominatim])
+
+    assert (result["BE"] == "Nominatim").all()
+    for path, rate in (("/census", 20), ("/nominatim", 4)):
+        times = server.times(path)
+        assert len(times) == 8
+        assert min(np.diff(times)) >= 0.8 / rate
+    # The fast provider is not held back to the slow one's rate
+    census_span = server.times("/census")[-1] - server.times("/census")[0]
+    nominatim_span = server.times("/nominatim")[-1] - server.times("/nominatim")[0]
+    assert census_span < nominatim_span / 2
+
+
+def test_race_caches_answers_of_cancelled_callers(server, tmp_path):
+    geonames_delay["seconds"] = 0.3
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"))
+    df = pd.DataFrame({"STATE": ["ARIZONA"], "CZ_NAME": [np.nan]})
+
+    result = engine.geocode_dataframe(df, [["Phoenix"]], providers(server.url), cache=cache, race=True)
+
+    assert result.at[0, "BE"] == "US Census Geocoder"
+    assert cache.get("US Census Geocoder", "Phoenix", "ARIZONA") == pytest.approx(census_places["phoenix, arizona"])
+    # GeoNames lost the race but its answer was fetched, so it is cached as well
+    assert cache.get("GeoNames", "Phoenix", "ARIZONA") == pytest.approx(geonames_places["phoenix, arizona"])
@@ -0,0 +1,156 @@
+import os
+import itertools
+import pytest
+from aiohttp import web
+
+import MERRA2_Orchestrator as orchestrator
+import MERRA2_Subset_Client as subset
+from MERRA2_Job_Ledger import JobLedger
+from MERRA2_Polling import PollSchedule
+from stub_server import StubServer
+
+# Fake GES DISC subset service: jobs succeed after `polls` GetStatus calls, boxes in fail_boxes fail
+service = {"jobs": {}, "calls": [], "pages": [], "polls": 2, "items": 3, "fail_boxes": set(),
+           "missing_files": set(), "counter": itertools.count(1)}
+
+
+def wsp_response(methodname, result):
+    return web.json_response({"type": "jsonwsp/response", "version": "1.0", "methodname": methodname,
+                              "result": result})
+
+
+# JSON-WSP endpoint: subset, GetStatus and paged GetResult
+async def jsonwsp(request):
+    body = await request.json()
+    methodname, args = body["methodname"], body["args"]
+    service["calls"].append(methodname)
+
+    if methodname == "subset":
+        job_id = f"job{next(service['counter'])}"
+        service["jobs"][job_id] = {"args": args, "polls": 0}
+        return wsp_response(methodname, {"jobId": job_id, "Status": "Accepted"})
+
+    job = service["jobs"][args["jobId"]]
+    if methodname == "GetStatus":
+        job["polls"] += 1
+        if tuple(job["args"]["box"]) in service["fail_boxes"]:
+            return wsp_response(methodname, {"Status": "Failed", "PercentCompleted": 100, "message": "boom"})
+        if job["polls"] < service["polls"]:
+            return wsp_response(methodname, {"Status": "Running", "PercentCompleted": 50})
+        return wsp_response(methodname, {"Status": "Succeeded", "PercentCompleted": 100})
+
+    if methodname == "GetResult":
+        service["pages"].append((args["jobId"], args["startIndex"], args["count"]))
+        base = str(request.url.origin())
+        items = [{"label": "README.pdf", "link": f"{base}/doc"}] + [
+            {"label": f"MERRA2_400.tavg1_2d_flx_Nx.202309{i:02d}.nc4", "link": f"{base}/file/{args['jobId']}/{i}",
+             "start": "2023-09-01", "end": "2023-09-01"}
+            for i in range(1, service["items"] + 1)]
+        page = items[args["startIndex"]:args["startIndex"] + args["count"]]
+        return wsp_response(methodname, {"items": page, "itemsPerPage": len(page), "totalResults": len(items)})
+
+    return web.json_response({"type": "jsonwsp/fault", "methodname": methodname, "fault": "unknown method"})
+
+
+# Result file: its own URL path repeated, so every file's content is distinct (404 for missing_files)
+async def result_file(request):
+    if request.path in service["missing_files"]:
+        raise web.HTTPNotFound()
+    return web.Response(body=(request.path * 100).encode())
+
+
+@pytest.fixture
+def server():
+    service["jobs"].clear()
+    service["calls"].clear()
+    service["pages"].clear()
+    service["fail_boxes"].clear()
+    service["missing_files"].clear()
+    service["items"] = 3
+    service["counter"] = itertools.count(1)
+    routes = [("POST", "/jsonwsp", jsonwsp), ("GET", "/file/{job}/{i}", result_file)]
+    with StubServer(routes) as stub:
+        yield stub
+
+
+def client(server):
+    return subset.SubsetClient(f"{server.url}/jsonwsp", retry_wait=0)
+
+
+def job(name, box, tag):
+    minlon, minlat, maxlon, maxlat = box
+    args = subset.build_subset_args(minlon, maxlon, minlat, maxlat, "2023-09-01T00:00:00Z", "2023-09-01T23:00:00Z",
+                                    "20:30")
+    return orchestrator.SubsetJob(name, args, tag)
+
+
+def test_run_jobs_submits_polls_and_downloads(server, tmp_path):
+    service["fail_boxes"].add((1.0, 1.0, 2.0, 2.0))
+    jobs = [job("Row 0", (-112, 33, -111, 34), "Phoenix"), job("Row 1", (-111, 32, -110, 33), "Tucson"),
+            job("Row 2", (-112, 33, -111, 34), "Mesa"), job("Bad", (1, 1, 2, 2), "Nowhere")]
+
+    orchestrator.run_jobs(jobs, client(server), max_active=2, schedule=PollSchedule(0.05, 0.2),
+                          directory=str(tmp_path))
+
+    assert [j.status for j in jobs] == ["Succeeded", "Succeeded", "Succeeded", "Failed"]
+    assert jobs[3].error == "boom" and jobs[3].files == []
+    # The README item is documentation, not data; every data file is tagged with its row
+    assert sorted(os.path.basename(p) for p in jobs[0].files) == [
+        f"MERRA2_400.202309{i:02d}.SUB.Phoenix.nc" for i in (1, 2, 3)]
+    assert all(os.path.getsize(p) > 0 for j in jobs[:3] for p in j.files)
+    # Row 2 is the same request as Row 0: submitted once, files copied under its own tag
+    assert service["calls"].count("subset") == 3
+    assert jobs[2].job_id == jobs[0].job_id
+    assert sorted(os.path.basename(p) for p in jobs[2].files) == [
+        f"MERRA2_400.202309{i:02d}.SUB.Mesa.nc" for i in (1, 2, 3)]
+
+
+def test_run_jobs_pages_through_results(server, tmp_path):
+    service["items"] = 45
+    jobs = [job("Row 0", (-112, 33, -111, 34), "Phoenix")]
+
+    orchestrator.run_jobs(jobs, client(server), schedule=PollSchedule(0.05, 0.2), directory=str(tmp_path))
+
+    assert [(start, count) for _, start, count in service["pages"]] == [(0, 20), (20, 20), (40, 20)]
+    assert len(jobs[0].files) == 45
+
+
+def test_run_jobs_resumes_from_ledger(server, tmp_path):
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    service["fail_boxes"].add((1.0, 1.0, 2.0, 2.0))
+    first = [job("Row 0", (-112, 33, -111, 34), "Phoenix"), job("Bad", (1, 1, 2, 2), "Nowhere")]
+    orchestrator.run_jobs(first, client(server), schedule=PollSchedule(0.05, 0.2), directory=str(tmp_path),
+                          ledger=ledger)
+    assert service["calls"].count("subset") == 2
+
+    # Completed requests are skipped; only the failed one is submitted again
+    service["fail_boxes"].clear()
+    again = [job("Row 0", (-112, 33, -111, 34), "Phoenix"), job("Bad", (1, 1, 2, 2), "Nowhere")]
+    orchestrator.run_jobs(again, client(server), schedule=PollSchedule(0.05, 0.2), directory=str(tmp_path),
+                          ledger=ledger)
+    assert service["calls"].count("subset") == 3
+    assert [j.status for j in again] == ["Succeeded", "Succeeded"]
+    assert again[0].files == first[0].files
+
+
+def test_failed_download_is_fetched_again_without_resubmitting(server, tmp_path):
+    ledger = JobLedger(str(tmp_path / "jobs.sqlite"))
+    service["missing_files"].add("/file/job1/2")
+    first = [job("Row 0", (-112, 33, -111, 34), "Phoenix")]
+    orchestrator.run_jobs(first, client(server), schedule=PollSchedule(0.05, 0.2), directory=str(tmp_path),
+                          ledger=ledger)
+
+    # The job succeeded on the service; only its files are incomplete
+    assert first[0].status == "Succeeded" and first[0].files == []
+    assert first[0].error.startswith("download failed")
+    entry = ledger.get(first[0].key)
+    assert entry["status"] == "Succeeded" and entry["job_id"] == "job1"
+    assert [f["path"] is not None for f in ledger.files(first[0].key)] == [True, False, True]
+
+    service["missing_files"].clear()
+    again = [job("Row 0", (-112, 33, -111, 34), "Phoenix")]
+    orchestrator.run_jobs(again, client(server), schedule=PollSchedule(0.05, 0.2), directory=str(tmp_path),
+                          ledger=ledger)
+    assert service["calls"].count("subset") == 1
+    assert again[0].job_id == "job1" and len(again[0].files) == 3
+    assert ledger.completed_files(again[0].key) == sorted(again[0].files)